@@ -0,0 +1,351 @@
+"""Benchmarks of the ZOC Computations
+
+This module contains benchmarks of the solvers, samplers and copulas, and of
+the main functions of the scripts. For every benchmark, the wall time, the
+peak memory, the number of calls of the numerical solvers and the counters and
+timers of `instrumentation` are recorded.
+The results can be saved as JSON baseline, and later runs can be compared
+against it to detect performance regressions.
+
+
+Copyright (C) 2021 Karl-Ludwig Besser
+
+This program is used in the article:
+Karl-Ludwig Besser, Pin-Hsun Lin, and Eduard Jorswieck, "On Fading Channel
+Dependency Structures with a Positive Zero-Outage Capacity", IEEE Transactions
+on Communications, vol. 69, no. 10, pp. 6561-6574, Oct 2021.
+
+License:
+This program is licensed under the GPLv3 license. If you in any way use this
+code for research that results in publications, please cite our original
+article listed above.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+PARTICULAR PURPOSE.
+See the GNU General Public License for more details.
+
+Author: Karl-Ludwig Besser, Technische Universität Braunschweig
+"""
+
+import contextlib
+import functools
+import importlib
+import json
+import os
+import platform
+import re
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import scipy
+
+import instrumentation
+
+BASELINE_FORMAT = 1
+
+# Solver functions whose number of calls is recorded
+COUNTED = (("maximum_ratio_combining", "_opt_x"),
+           ("maximum_ratio_combining", "find_roots_bisect"),
+           ("maximum_ratio_combining", "_track_roots"),
+           ("maximum_ratio_combining", "_probe_roots"),
+           ("maximum_ratio_combining", "_pairwise_exchange"),
+           ("rayleigh_fading", "_xopt"),
+           ("selection_combining", "_calc_p_star"),
+           ("selection_combining", "_solve_s_star"),
+          )
+
+def _consume(samples):
+    for _chunk in samples:
+        pass
+
+def _entry_point(module, name, *args, **kwargs):
+    """Run the main function `name` of `module` without plots, exports and
+    cache in a temporary directory."""
+    import cache
+    _enabled = cache.default_cache.enabled
+    _cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as _tmp:
+        cache.default_cache.enabled = False
+        os.chdir(_tmp)
+        try:
+            return getattr(importlib.import_module(module), name)(*args, **kwargs)
+        finally:
+            os.chdir(_cwd)
+            cache.default_cache.enabled = _enabled
+
+def workloads(quick=False):
+    """Dict of all benchmarks, which map their name to a function without
+    arguments. With `quick`, only a small subset of the parameters is used."""
+    from copulas import (zoc_copula1, zoc_copula2, copula_grid,
+                         clayton_samples, clayton_sample_chunks,
+                         zoc_copula1_sample_chunks, zoc_copula2_sample_chunks)
+    from maximum_ratio_combining import (zoc_copula_t_mrc_heterog,
+                                         zoc_copula_t_mrc_heterog_nlinks,
+                                         _xopt_numerical,
+                                         max_zoc_inner_bound_mrc_homog,
+                                         max_zoc_outer_bound_mrc_homog,
+                                         max_zoc_outer_bound_joint_mix_mrc_homog)
+    from rayleigh_fading import (zoc_copula_t_mrc_heterog_rayleigh,
+                                 zoc_copula_t_mrc_heterog_rayleigh_batch)
+    from selection_combining import (max_zoc_sc_heterog, max_zoc_sc_heterog_batch,
+                                     max_zoc_sc_homog)
+    from nakagami_fading import optimal_t_nakagami
+    from boundary import region_scan
+    from sweep import fading_distribution
+    from tabulated import tabulate
+    from utils import NakagamiSNR
+    m_values = (1, 5) if quick else (1, 2, 5, 10)
+    snr_ratios_db = (0, 10) if quick else (0, 5, 10)
+    num_t_values = (50,) if quick else (50, 200, 1000)
+    num_samples = (10**5,) if quick else (10**5, 10**6, 10**7, 10**8)
+    num_configs = 10**3 if quick else 10**4
+    benchmarks = {}
+    for _m in m_values:
+        for _ratio in snr_ratios_db:
+            rv_x = fading_distribution("nakagami", 0., _m)
+            rv_y = fading_distribution("nakagami", _ratio, _m)
+            _suffix = "m{}-ratio{}".format(_m, _ratio)
+            for _num_t in num_t_values:
+                t = np.linspace(0, 1, _num_t)
+                benchmarks["mrc-batch-{}-t{}".format(_suffix, _num_t)] = functools.partial(
+                    zoc_copula_t_mrc_heterog, t, rv_x, rv_y)
+                benchmarks["mrc-continuation-{}-t{}".format(_suffix, _num_t)] = functools.partial(
+                    zoc_copula_t_mrc_heterog, t, rv_x, rv_y, method="continuation")
+            benchmarks["xopt-numerical-{}-t{}".format(_suffix, num_t_values[-1])] = functools.partial(
+                _xopt_numerical, np.linspace(0, 1, num_t_values[-1])[1:], rv_x, rv_y)
+            benchmarks["sc-heterog-{}".format(_suffix)] = functools.partial(
+                max_zoc_sc_heterog, [rv_x.ppf, rv_y.ppf])
+            benchmarks["sc-heterog-tabulated-{}".format(_suffix)] = functools.partial(
+                max_zoc_sc_heterog, [tabulate(rv_x).ppf, tabulate(rv_y).ppf])
+    snr_db = np.linspace(-10, 10, 50)
+    _lam = 10**(-snr_db/10.)
+    for _num_t in num_t_values:
+        t = np.linspace(0, 1, _num_t)[:, np.newaxis, np.newaxis]
+        benchmarks["rayleigh-grid50x50-t{}".format(_num_t)] = functools.partial(
+            zoc_copula_t_mrc_heterog_rayleigh, t, _lam[:, np.newaxis], _lam)
+    for _num in ((100,) if quick else (100, 400)):
+        _lam_grid = np.logspace(-1, 1, _num)
+        for _dtype in (np.float32, np.float64):
+            benchmarks["rayleigh-batch-{}^3-{}".format(_num, np.dtype(_dtype).name)] = functools.partial(
+                zoc_copula_t_mrc_heterog_rayleigh_batch, np.linspace(0, 1, _num)[:, np.newaxis, np.newaxis],
+                _lam_grid[:, np.newaxis], _lam_grid, dtype=_dtype)
+    _rng = np.random.default_rng(0)
+    for _n in ((8, 16) if quick else (8, 16, 64)):
+        _m = _rng.integers(1, 11, (num_configs, _n))
+        _snr = 10**(_rng.uniform(-10, 10, (num_configs, _n))/10)
+        benchmarks["sc-batch-n{}-{}".format(_n, num_configs)] = functools.partial(
+            max_zoc_sc_heterog_batch, fading_distribution("nakagami", 10*np.log10(_snr), _m))
+    for _n in ((4,) if quick else (4, 16)):
+        _m = _rng.integers(1, 11, _n)
+        _snr_db = snr_db[:, np.newaxis] + _rng.uniform(-5, 5, _n)
+        benchmarks["mrc-nlinks-n{}-snr50".format(_n)] = functools.partial(
+            zoc_copula_t_mrc_heterog_nlinks, .5, fading_distribution("nakagami", _snr_db, _m))
+    _grid = (NakagamiSNR(np.linspace(.5, 25, 50)[:, np.newaxis, np.newaxis],
+                         10**(np.linspace(-10, 20, 200)/10)[:, np.newaxis]),
+             np.arange(2, 102))
+    benchmarks["bounds-nakagami-50x200x100"] = lambda: [
+        _bound(*_grid) for _bound in (max_zoc_inner_bound_mrc_homog,
+                                      max_zoc_outer_bound_mrc_homog,
+                                      max_zoc_outer_bound_joint_mix_mrc_homog,
+                                      max_zoc_sc_homog)]
+    _snr_db = _rng.uniform(-10, 10, (2, 10 if quick else 100))
+    benchmarks["optimal-t-nakagami-{}".format(_snr_db.shape[1])] = functools.partial(
+        optimal_t_nakagami, _rng.choice(m_values, _snr_db.shape[1]), *_snr_db)
+    _num_snr = 10 if quick else 50
+    benchmarks["boundary-scan-{0}x{0}".format(_num_snr)] = functools.partial(
+        region_scan, np.linspace(-10, 10, _num_snr), m=2., t=.9)
+    rv = fading_distribution("nakagami", 0., 2)
+    for _num in num_samples:
+        if _num <= 10**7:
+            benchmarks["clayton-samples-{:.0e}".format(_num)] = functools.partial(
+                clayton_samples, _num, rv, rv, .25)
+            benchmarks["clayton-samples-tabulated-{:.0e}".format(_num)] = functools.partial(
+                clayton_samples, _num, tabulate(rv), tabulate(rv), .25)
+        benchmarks["clayton-chunks-{:.0e}".format(_num)] = lambda _num=_num: _consume(
+            clayton_sample_chunks(_num, rv, rv, .25, seed=0))
+        for _name, _chunks in (("zoc1", zoc_copula1_sample_chunks),
+                               ("zoc2", zoc_copula2_sample_chunks)):
+            for _rtol in (None, 1e-10):
+                benchmarks["{}-chunks-{}{:.0e}".format(
+                    _name, "" if _rtol is None else "tabulated-", _num)] = functools.partial(
+                        lambda _chunks, _num, _rtol: _consume(
+                            _chunks(_num, rv, rv, .3, seed=0, rtol=_rtol)),
+                        _chunks, _num, _rtol)
+    for _num in ((1000,) if quick else (1000, 4000)):
+        u = np.linspace(0, 1, _num)
+        for _name, _copula in (("zoc1", zoc_copula1), ("zoc2", zoc_copula2)):
+            benchmarks["copula-grid-{}-{}".format(_name, _num)] = functools.partial(
+                copula_grid, _copula, u, u, .3)
+    benchmarks.update({
+        "main-boundary": functools.partial(_entry_point, "boundary", "main", 8., 0.),
+        "main-rayleigh": functools.partial(_entry_point, "rayleigh_fading", "main",
+                                           [0, 5], [0, 5], export=False),
+        "main-nakagami-two-links": functools.partial(_entry_point, "nakagami_fading",
+                                                     "main_two_links", 5, 0., 0.),
+        "main-nakagami-n-links": functools.partial(_entry_point, "nakagami_fading",
+                                                   "main_n_links", 5, 0.),
+        "main-mrc": functools.partial(_entry_point, "maximum_ratio_combining", "main",
+                                      0., 5),
+        "main-sc": functools.partial(_entry_point, "selection_combining", "main",
+                                     [2, 5, 10], 10.),
+        })
+    return benchmarks
+
+@contextlib.contextmanager
+def _count_calls(counts):
+    """Count the calls of the functions in `COUNTED` within the context."""
+    _patched = []
+    for _module, _name in COUNTED:
+        try:
+            _module = importlib.import_module(_module)
+        except ImportError:
+            continue
+        _func = getattr(_module, _name, None)
+        if _func is None:
+            continue
+        _key = "{}.{}".format(_module.__name__, _name)
+        def _wrapper(*args, _func=_func, _key=_key, **kwargs):
+            counts[_key] = counts.get(_key, 0) + 1
+            return _func(*args, **kwargs)
+        setattr(_module, _name, _wrapper)
+        _patched.append((_module, _name, _func))
+    try:
+        yield counts
+    finally:
+        for _module, _name, _func in _patched:
+            setattr(_module, _name, _func)
+
+def run_benchmark(func, repeat=3, memory=True):
+    """Wall time (minimum over `repeat` runs) and number of solver calls of
+    `func`.
+
+    The counters and timers of `instrumentation` and the peak memory (traced
+    by `tracemalloc`) are recorded in an additional run, so that they do not
+    affect the wall time.
+    """
+    _times = []
+    for _ in range(repeat):
+        calls = {}
+        with _count_calls(calls):
+            _start = time.perf_counter()
+            func()
+            _times.append(time.perf_counter() - _start)
+    peak_memory = None
+    with instrumentation.instrument() as _recorder:
+        if memory:
+            tracemalloc.start()
+        try:
+            func()
+            if memory:
+                peak_memory = tracemalloc.get_traced_memory()[1]
+        finally:
+            if memory:
+                tracemalloc.stop()
+    return {"time": min(_times), "peak_memory": peak_memory, "calls": calls,
+            "counters": dict(_recorder.counters), "timers": dict(_recorder.timers)}
+
+def run_suite(quick=False, pattern=None, repeat=3, memory=True, verbose=False):
+    """Run all benchmarks whose name matches the regular expression
+    `pattern`. Benchmarks that raise an exception are reported with the
+    error instead of the measurements."""
+    results = {}
+    for _name, _func in workloads(quick).items():
+        if pattern is not None and not re.search(pattern, _name):
+            continue
+        try:
+            results[_name] = run_benchmark(_func, repeat=repeat, memory=memory)
+        except Exception as _error:
+            results[_name] = {"error": "{}: {}".format(type(_error).__name__, _error)}
+        if verbose:
+            print(_format_result(_name, results[_name]), flush=True)
+    return {"format": BASELINE_FORMAT, "quick": quick,
+            "environment": {"python": platform.python_version(),
+                            "numpy": np.__version__, "scipy": scipy.__version__,
+                            "machine": platform.machine(),
+                            "processor": platform.processor()},
+            "results": results}
+
+def _format_result(name, result):
+    if "error" in result:
+        return "{:40s} ERROR {}".format(name, result["error"])
+    _memory = result["peak_memory"]
+    _memory = "{:10.1f} MiB".format(_memory/2**20) if _memory is not None else "{:>14s}".format("-")
+    _calls = ", ".join("{}={}".format(k.split(".")[-1], v) for k, v in sorted(result["calls"].items()))
+    return "{:40s} {:10.4f} s {} {}".format(name, result["time"], _memory, _calls)
+
+def compare(results, baseline, threshold=.25, memory_threshold=.25,
+            min_time=5e-3):
+    """List of regressions of `results` compared to `baseline`.
+
+    A benchmark regresses if its time or peak memory grows by more than the
+    relative threshold, if a solver is called or a function is evaluated
+    (counters `*.evaluations`) more often than allowed by `threshold` or if
+    it fails but did not fail in the baseline. Time
+    differences below `min_time` seconds are ignored as noise.
+    """
+    regressions = []
+    results = results["results"]
+    for _name, _base in baseline["results"].items():
+        if _name not in results or "error" in _base:
+            continue
+        _new = results[_name]
+        if "error" in _new:
+            regressions.append("{}: fails with {}".format(_name, _new["error"]))
+            continue
+        if (_new["time"] > (1+threshold)*_base["time"]
+                and _new["time"] - _base["time"] > min_time):
+            regressions.append("{}: time {:.4f} s -> {:.4f} s".format(
+                _name, _base["time"], _new["time"]))
+        if (_new["peak_memory"] is not None and _base["peak_memory"] is not None
+                and _new["peak_memory"] > (1+memory_threshold)*_base["peak_memory"]):
+            regressions.append("{}: peak memory {:.1f} MiB -> {:.1f} MiB".format(
+                _name, _base["peak_memory"]/2**20, _new["peak_memory"]/2**20))
+        for _func, _num in _new["calls"].items():
+            _num_base = _base["calls"].get(_func, 0)
+            if _num > (1+threshold)*_num_base:
+                regressions.append("{}: {} calls {:d} -> {:d}".format(
+                    _name, _func, _num_base, _num))
+        for _counter, _num in _new.get("counters", {}).items():
+            _num_base = _base.get("counters", {}).get(_counter)
+            if (_counter.endswith(".evaluations") and _num_base is not None
+                    and _num > (1+threshold)*_num_base):
+                regressions.append("{}: {} {:d} -> {:d}".format(
+                    _name, _counter, _num_base, _num))
+    return regressions
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--quick", action="store_true",
+                        help="Only run a small subset of the parameters")
+    parser.add_argument("-k", "--filter", help="Regular expression of the benchmarks to run")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--no-memory", action="store_true",
+                        help="Do not measure the peak memory")
+    parser.add_argument("--save", help="Save the results as JSON baseline")
+    parser.add_argument("--compare", help="Compare the results to this JSON baseline")
+    parser.add_argument("--threshold", type=float, default=.25,
+                        help="Allowed relative increase of time and solver calls")
+    parser.add_argument("--memory-threshold", type=float, default=.25,
+                        help="Allowed relative increase of the peak memory")
+    args = parser.parse_args()
+    results = run_suite(quick=args.quick, pattern=args.filter, repeat=args.repeat,
+                        memory=not args.no_memory, verbose=True)
+    if args.save:
+        with open(args.save, "w") as _file:
+            json.dump(results, _file, indent=2)
+    if args.compare:
+        with open(args.compare) as _file:
+            baseline = json.load(_file)
+        regressions = compare(results, baseline, threshold=args.threshold,
+                              memory_threshold=args.memory_threshold)
+        for _regression in regressions:
+            print("REGRESSION", _regression)
+        if regressions:
+            sys.exit(1)
+        print("No regressions compared to {}".format(args.compare))
@@ -27,12 +27,133 @@ Author: Karl-Ludwig Besser, Technische Universität Braunschweig
 
 import numpy as np
 from scipy import stats
-import matplotlib.pyplot as plt
 
-from utils import export_results
+from utils import export_results, find_roots_bisect, Marginals
 from rayleigh_fading import _boundary_b, zoc_copula_t_mrc_heterog_rayleigh
 from selection_combining import max_zoc_sc_heterog
 
+def _curve_levels(num, tail):
+    """Fractions of t at which the boundary is sampled and the step of their
+    logits. The logits of all but the two end points (0 and 1) are uniformly
+    spaced, so the points are dense close to both ends of the boundary."""
+    _z_max = np.log((1-tail)/tail)
+    _z, _step = np.linspace(-_z_max, _z_max, num-2, retstep=True)
+    return np.concatenate(([0.], 1/(1 + np.exp(-_z)), [1.])), _step
+
+def _broadcast_marginals(dists, t):
+    """Marginals broadcast against the shape of `t`."""
+    marginals = Marginals(dists)
+    return marginals.broadcast_to(np.broadcast_shapes(np.shape(t), marginals.shape))
+
+def boundary_curves(dists, t=1., num=100, tail=1e-9):
+    """Boundaries of the support for many configurations at once.
+
+    `dists` are the marginals of X and Y as accepted by `utils.Marginals`
+    and `t` is broadcast against the shape of the configurations. The
+    boundary for the copula parameter t is the curve
+    (F_x^{-1}(u), F_y^{-1}(t-u)) for u in [0, t], which is sampled at `num`
+    values of u. They are dense close to both ends, where the curve can go
+    to infinity, and the closest ones have the distance `tail*t`. Returns
+    x and y with the shape of the configurations followed by `num`.
+    """
+    marginals = _broadcast_marginals(dists, t)
+    if marginals.n != 2:
+        raise ValueError("The boundary is only defined for two links")
+    t = np.broadcast_to(np.asarray(t, dtype=float), marginals.shape).ravel()
+    _u = t[:, np.newaxis]*_curve_levels(num, tail)[0]
+    _levels = np.stack((_u, t[:, np.newaxis]-_u), axis=-1).reshape(-1, 2)
+    _idx = np.repeat(np.arange(marginals.size), num)
+    with np.errstate(invalid="ignore"):
+        _points = marginals.ppf(np.clip(_levels, 0, 1), idx=_idx)
+    x, y = _points.reshape(marginals.size, num, 2).transpose(2, 0, 1)
+    return x.reshape(*marginals.shape, num), y.reshape(*marginals.shape, num)
+
+def _sc_crossing(marginals, t):
+    """Point s=x=y of the boundary, i.e., the root of F_x(s)+F_y(s)=t."""
+    _idx = np.arange(marginals.size)
+    # Both distribution functions are at least t/2 at the upper bound, which
+    # is increased slightly against rounding errors
+    _up = np.max(marginals.ppf(np.stack((t/2, t/2), axis=-1)), axis=1)*(1 + 1e-8)
+    def _condition(s, idx):
+        return np.sum(marginals.cdf(s[:, np.newaxis], idx=idx), axis=1) - t[idx]
+    s_sc, _converged = find_roots_bisect(_condition, np.zeros_like(t), _up,
+                                         args=(_idx,))
+    s_sc[t == 0] = 0.
+    return s_sc
+
+def boundary_regions(dists, t=1., num=100, tail=1e-9):
+    """Boundaries of the support and the regions S_MRC and S_SC for many
+    configurations at once.
+
+    See `boundary_curves` for the arguments. The triangle S_MRC={x+y<s_mrc}
+    and the square S_SC={max(x, y)<s_sc} are the largest ones below the
+    boundary, i.e., s_mrc and s_sc are the largest SNRs with zero outage.
+    s_mrc is computed with `zoc_copula_t_mrc_heterog_nlinks` and s_sc is the
+    intersection of the boundary with y=x. The area below the boundary is
+    the integral of y dx/dz over the logit z of u/t, which is evaluated with
+    the trapezoidal rule on the uniform grid of z of the sampled curve. Its
+    integrand decays at both ends, so the rule converges quickly. The parts
+    of the curve between the grid and the end points are added as trapezoids.
+
+    Returns a dict of arrays with the shape of the configurations, which
+    contains the curves `x` and `y` (with the additional last axis), `s_mrc`,
+    `s_sc`, the area below the boundary `area`, and the areas between the
+    boundary and the regions `gap_mrc` and `gap_sc`.
+    """
+    from maximum_ratio_combining import zoc_copula_t_mrc_heterog_nlinks
+    marginals = _broadcast_marginals(dists, t)
+    x, y = boundary_curves(dists, t, num=num, tail=tail)
+    _t = np.broadcast_to(np.asarray(t, dtype=float), marginals.shape)
+    _levels, _step = _curve_levels(num, tail)
+    _x = x[..., 1:-1].reshape(-1, 1)
+    _idx = np.repeat(np.arange(marginals.size), num-2)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        _dx = (_t[..., np.newaxis]*_levels[1:-1]*(1-_levels[1:-1])
+               /marginals.pdf(_x, idx=_idx)[:, 0].reshape(*marginals.shape, num-2))
+        _integrand = y[..., 1:-1]*_dx
+    area = _step*np.sum(np.where(np.isfinite(_integrand), _integrand, 0.), axis=-1)
+    # Trapezoids between the end points of the boundary and the grid of z,
+    # which contain the tails beyond it (if the end points are finite)
+    with np.errstate(invalid="ignore"):
+        for _end, _inner in ((0, 1), (-1, -2)):
+            _segment = np.abs(x[..., _end] - x[..., _inner])*(y[..., _end] + y[..., _inner])/2
+            area = area + np.where(np.isfinite(_segment), _segment, 0.)
+    s_mrc = 2**zoc_copula_t_mrc_heterog_nlinks(_t, dists) - 1
+    s_sc = _sc_crossing(marginals, _t.ravel()).reshape(marginals.shape)
+    return {"x": x, "y": y, "s_mrc": s_mrc, "s_sc": s_sc, "area": area,
+            "gap_mrc": area - s_mrc**2/2, "gap_sc": area - s_sc**2}
+
+def region_scan(snr_db, m=1., t=1., num=100, plot=False, export=False):
+    """Regions S_MRC and S_SC for Nakagami-m fading on the grid of all pairs
+    of the SNRs `snr_db` (in dB) of both links.
+
+    All configurations are evaluated with a single call of
+    `boundary_regions`. Returns the SNR grid and the results, which are
+    exported to `boundary-scan-m{m}-t{t}.dat`.
+    """
+    SNR_X_DB, SNR_Y_DB = np.meshgrid(snr_db, snr_db)
+    SNR_X = 10**(SNR_X_DB/10.)
+    SNR_Y = 10**(SNR_Y_DB/10.)
+    regions = boundary_regions([stats.gamma(a=m, scale=SNR_X/m),
+                                stats.gamma(a=m, scale=SNR_Y/m)], t=t, num=num)
+    if export:
+        results = {"snrx": SNR_X_DB.ravel(), "snry": SNR_Y_DB.ravel()}
+        results.update({_key: regions[_key].ravel() for _key in
+                        ("s_mrc", "s_sc", "area", "gap_mrc", "gap_sc")})
+        export_results(results, "boundary-scan-m{}-t{}.dat".format(m, t))
+    if plot:
+        import matplotlib.pyplot as plt
+        fig, axs = plt.subplots(1, 2, sharey=True)
+        for _ax, _key in zip(axs, ("gap_mrc", "gap_sc")):
+            _mesh = _ax.pcolormesh(SNR_X_DB, SNR_Y_DB, regions[_key]/regions["area"],
+                                   vmin=0, vmax=1, shading="auto")
+            _ax.set_xlabel("SNR_x [dB]")
+            _ax.set_title("Relative gap {}".format(_key[4:].upper()))
+        axs[0].set_ylabel("SNR_y [dB]")
+        fig.colorbar(_mesh, ax=axs)
+        fig.savefig("results-boundary-scan-m{}-t{}.png".format(m, t), dpi=100)
+    return SNR_X_DB, SNR_Y_DB, regions
+
 def main(snr_x_db, snr_y_db, plot=False, export=False):
     snr_x = 10**(snr_x_db/10.)
     snr_y = 10**(snr_y_db/10.)
@@ -51,6 +172,7 @@ def main(snr_x_db, snr_y_db, plot=False, export=False):
     if export:
         export_results({"x": x, "boundary": b}, "boundary-example.dat")
     if plot:
+        import matplotlib.pyplot as plt
         fig, axs = plt.subplots()
         axs.fill_between(x, b, label="Boundary B", alpha=.5)#, ec=(1, 0, 0, 1))
         axs.fill_between([0, s_mrc], [s_mrc, 0], label="S MRC", alpha=.5)
@@ -59,16 +181,26 @@ def main(snr_x_db, snr_y_db, plot=False, export=False):
         axs.set_ylabel("y")
         axs.legend()
         fig.tight_layout()
+        fig.savefig("results-boundary-example.png", dpi=100)
 
 
 if __name__ == "__main__":
     import argparse
-    import matplotlib.pyplot as plt
     parser = argparse.ArgumentParser()
     parser.add_argument("--plot", action="store_true")
     parser.add_argument("--export", action="store_true")
     parser.add_argument("-x", "--snr_x_db", type=float, default=8.)
     parser.add_argument("-y", "--snr_y_db", type=float, default=0.)
+    parser.add_argument("--scan", action="store_true",
+                        help="Scan the regions on a grid of SNRs of both links")
+    parser.add_argument("-m", type=float, default=1.)
+    parser.add_argument("-t", type=float, default=1.)
     args = vars(parser.parse_args())
-    main(**args)
-    plt.show()
+    if args.pop("scan"):
+        region_scan(np.linspace(-10, 10, 50), m=args["m"], t=args["t"],
+                    plot=args["plot"], export=args["export"])
+    else:
+        main(args["snr_x_db"], args["snr_y_db"], plot=args["plot"], export=args["export"])
+    if args["plot"]:
+        import matplotlib.pyplot as plt
+        plt.show()
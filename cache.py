@@ -0,0 +1,251 @@
+"""Persistent Result Cache
+
+This module contains an on-disk cache for the results of expensive ZOC
+computations. The results are stored under a hash of the function, its
+arguments and a version number of the solver. Frozen scipy distributions are
+identified by their family and parameters.
+
+
+Copyright (C) 2021 Karl-Ludwig Besser
+
+This program is used in the article:
+Karl-Ludwig Besser, Pin-Hsun Lin, and Eduard Jorswieck, "On Fading Channel
+Dependency Structures with a Positive Zero-Outage Capacity", IEEE Transactions
+on Communications, vol. 69, no. 10, pp. 6561-6574, Oct 2021.
+
+License:
+This program is licensed under the GPLv3 license. If you in any way use this
+code for research that results in publications, please cite our original
+article listed above.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+PARTICULAR PURPOSE.
+See the GNU General Public License for more details.
+
+Author: Karl-Ludwig Besser, Technische Universität Braunschweig
+"""
+
+import contextlib
+import functools
+import hashlib
+import inspect
+import os
+import pickle
+
+import numpy as np
+
+from utils import frozen_parameters
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+CACHE_FORMAT = 2
+DEFAULT_DIRECTORY = os.path.join(os.path.expanduser("~"), ".cache",
+                                 "zero-outage-joint-distributions")
+
+def encode(obj):
+    """Canonical representation of `obj` that is used to compute the key."""
+    if hasattr(obj, "cache_key"):
+        return ("custom", type(obj).__name__, encode(obj.cache_key()))
+    elif hasattr(obj, "dist") and hasattr(obj, "args") and hasattr(obj, "kwds"):
+        _shapes, _loc, _scale = frozen_parameters(obj)
+        return ("rv", obj.dist.name, encode(tuple(_shapes)), encode(_loc),
+                encode(_scale))
+    elif hasattr(obj, "__self__") and hasattr(obj.__self__, "dist"):
+        return ("method", obj.__name__, encode(obj.__self__))
+    elif isinstance(obj, np.generic):
+        # Numpy scalars have the same key as the Python scalars
+        return encode(obj.item())
+    elif isinstance(obj, np.ndarray):
+        obj = np.ascontiguousarray(obj)
+        return ("array", obj.dtype.str, obj.shape,
+                hashlib.sha256(obj.tobytes()).hexdigest())
+    elif isinstance(obj, (list, tuple)):
+        return (type(obj).__name__, tuple(encode(v) for v in obj))
+    elif isinstance(obj, dict):
+        return ("dict", tuple((str(k), encode(v)) for k, v in sorted(obj.items())))
+    elif isinstance(obj, (int, float)) and not isinstance(obj, bool):
+        return ("number", repr(float(obj)))
+    elif obj is None or isinstance(obj, (bool, complex, str)):
+        return (type(obj).__name__, repr(obj))
+    raise TypeError("Objects of type {} can not be used as cache key".format(
+        type(obj).__name__))
+
+class ResultCache:
+    """On-disk cache with a size limit and LRU eviction.
+
+    Every entry is stored in its own file, which is written atomically, so
+    that several processes can share the same cache directory. The access
+    time of an entry is tracked by the modification time of its file. If the
+    total size exceeds `max_bytes`, the least recently used entries are
+    removed until the total size is below `low_water*max_bytes`. The total
+    size is tracked incrementally, so only writes that exceed the limit scan
+    the directory.
+
+    The directory defaults to the environment variable `ZOC_CACHE_DIR` or
+    `DEFAULT_DIRECTORY`. Setting `ZOC_CACHE_DISABLE` disables the cache.
+    """
+    def __init__(self, directory=None, max_bytes=2**30, enabled=None, low_water=.9):
+        if directory is None:
+            directory = os.environ.get("ZOC_CACHE_DIR", DEFAULT_DIRECTORY)
+        if enabled is None:
+            enabled = not os.environ.get("ZOC_CACHE_DISABLE")
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.low_water = low_water
+        self.enabled = enabled
+
+    def key(self, func, args=(), kwargs=None, version=0):
+        """Key of the call of `func`. The arguments are bound to the
+        parameters of `func` including the defaults, so the key does not
+        depend on how they are passed and changes with the defaults, e.g.,
+        of solver tolerances."""
+        _name = "{}.{}".format(func.__module__, func.__qualname__)
+        try:
+            _bound = inspect.signature(func).bind(*args, **(kwargs or {}))
+        except (TypeError, ValueError):
+            pass
+        else:
+            _bound.apply_defaults()
+            args, kwargs = (), dict(_bound.arguments)
+        _repr = repr((CACHE_FORMAT, _name, version, encode(tuple(args)),
+                      encode(kwargs or {})))
+        return hashlib.sha256(_repr.encode()).hexdigest()
+
+    def _filename(self, key):
+        return os.path.join(self.directory, key[:2], key + ".pkl")
+
+    def get(self, key):
+        """Return `(True, value)` if `key` is in the cache and `(False, None)`
+        otherwise."""
+        _filename = self._filename(key)
+        try:
+            with open(_filename, "rb") as _file:
+                value = pickle.load(_file)
+            os.utime(_filename)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return False, None
+        return True, value
+
+    def put(self, key, value):
+        _filename = self._filename(key)
+        os.makedirs(os.path.dirname(_filename), exist_ok=True)
+        _tmp = "{}.tmp{}".format(_filename, os.getpid())
+        with open(_tmp, "wb") as _file:
+            pickle.dump(value, _file, protocol=pickle.HIGHEST_PROTOCOL)
+        try:
+            _old_size = os.stat(_filename).st_size
+        except FileNotFoundError:
+            _old_size = 0
+        os.replace(_tmp, _filename)
+        self._add_size(os.stat(_filename).st_size - _old_size)
+
+    def _entries(self):
+        entries = []
+        for _root, _dirs, _files in os.walk(self.directory):
+            for _name in _files:
+                if not _name.endswith(".pkl"):
+                    continue
+                try:
+                    _stat = os.stat(os.path.join(_root, _name))
+                except FileNotFoundError:
+                    continue
+                entries.append((_stat.st_mtime, _stat.st_size,
+                                os.path.join(_root, _name)))
+        return entries
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """Exclusive lock of the cache directory between processes."""
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, "lock"), "w") as _lock:
+            if fcntl is not None:
+                fcntl.flock(_lock, fcntl.LOCK_EX)
+            yield
+
+    @property
+    def _size_filename(self):
+        return os.path.join(self.directory, "size")
+
+    def _add_size(self, size):
+        """Add `size` bytes to the estimate of the total size and evict
+        entries if it exceeds `max_bytes`.
+
+        The estimate is shared by all processes in the file `size`, so the
+        directory is only scanned if the estimate is missing or too large.
+        Entries that are removed by other means only increase the estimate,
+        which is corrected by the next scan.
+        """
+        with self._locked():
+            try:
+                with open(self._size_filename) as _file:
+                    _total = int(_file.read()) + size
+            except (OSError, ValueError):
+                _total = None
+            if _total is None or _total > self.max_bytes:
+                _total = self._evict()
+            with open(self._size_filename, "w") as _file:
+                _file.write(str(_total))
+
+    def _evict(self):
+        """Remove the least recently used entries if the total size exceeds
+        `max_bytes` until it is at most `low_water*max_bytes` and return the
+        remaining size. Needs the lock.
+
+        Evicting below the limit leaves room for the following writes, so
+        the directory is not scanned again on every write at the limit.
+        """
+        entries = sorted(self._entries())
+        _size = sum(_entry[1] for _entry in entries)
+        if _size <= self.max_bytes:
+            return _size
+        for _mtime, _entry_size, _filename in entries:
+            if _size <= self.low_water*self.max_bytes:
+                break
+            try:
+                os.remove(_filename)
+            except FileNotFoundError:
+                pass
+            _size -= _entry_size
+        return _size
+
+    def clear(self):
+        with self._locked():
+            for _mtime, _size, _filename in self._entries():
+                try:
+                    os.remove(_filename)
+                except FileNotFoundError:
+                    pass
+            with open(self._size_filename, "w") as _file:
+                _file.write("0")
+
+    def cached(self, func=None, version=0):
+        """Decorator that stores the results of `func` in the cache.
+
+        Increase `version` whenever the results of `func` change, e.g., due to
+        changes of the solver. All arguments need to be supported by the key
+        computation (numbers, strings, arrays, sequences, dicts, frozen scipy
+        distributions and their methods).
+        """
+        if func is None:
+            return functools.partial(self.cached, version=version)
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not self.enabled:
+                return func(*args, **kwargs)
+            _key = self.key(func, args, kwargs, version)
+            _hit, value = self.get(_key)
+            if not _hit:
+                value = func(*args, **kwargs)
+                self.put(_key, value)
+            return value
+        return wrapper
+
+default_cache = ResultCache()
+
+def cached(func=None, version=0):
+    """Cache the results of `func` in `default_cache`."""
+    return default_cache.cached(func, version=version)
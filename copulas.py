@@ -23,26 +23,61 @@ See the GNU General Public License for more details.
 Author: Karl-Ludwig Besser, Technische Universität Braunschweig
 """
 
+import os
+
 import numpy as np
 from scipy import stats
 
-@np.vectorize
 def zoc_copula1(a, b, t=.5):
-    if np.abs(a-b)>t:
-        c = np.minimum(a, b)
-    elif np.abs(a+b-1) > 1-t:
-        c = np.maximum(a+b-1, 0)
-    else:
-        c = (a+b)/2 - t/2
-    return c
+    a, b, t = np.asarray(a), np.asarray(b), np.asarray(t)
+    _sum = a + b
+    c = np.where(np.abs(_sum-1) > 1-t, np.maximum(_sum-1, 0), _sum/2 - t/2)
+    c = np.where(np.abs(a-b) > t, np.minimum(a, b), c)
+    return c[()]
 
-@np.vectorize
 def zoc_copula2(a, b, t=.5):
-    if a < t and b < t:
-        c = np.maximum(a+b-t, 0)
-    else:
-        c = np.minimum(a, b)
-    return c
+    a, b, t = np.asarray(a), np.asarray(b), np.asarray(t)
+    c = np.where((a < t) & (b < t), np.maximum(a+b-t, 0), np.minimum(a, b))
+    return c[()]
+
+def inv_zoc_copula1_dv(p, v, t=.5):
+    """Inverse of Pr(U<u | V=v) for `zoc_copula1`.
+
+    Given V=v, U only takes the two values |v-t| and min(v+t, 2-t-v), each
+    with probability 1/2.
+    """
+    return np.where(p < .5, np.abs(v-t), np.minimum(v+t, 2-t-v))
+
+def inv_zoc_copula2_dv(p, v, t=.5):
+    """Inverse of Pr(U<u | V=v) for `zoc_copula2`, i.e., U=t-v for v<t and U=v
+    otherwise."""
+    return np.where(v < t, t-v, v)
+
+def copula_grid(copula, u, v, t=.5, out=None, chunk_size=2**20, dtype=float):
+    """Evaluate `copula` on the grid `u` x `v` in chunks of rows.
+
+    The result has shape `(len(u), len(v))` and is written into `out`, which
+    can be a preallocated array, a memory-mapped array or a filename. In the
+    last case, a `.npy` file is created and returned as memory map. At most
+    `chunk_size` values are computed at once, so that no full-size
+    temporaries are needed.
+    """
+    u = np.ravel(u)
+    v = np.ravel(v)
+    shape = (len(u), len(v))
+    if out is None:
+        out = np.empty(shape, dtype=dtype)
+    elif isinstance(out, (str, os.PathLike)):
+        out = np.lib.format.open_memmap(out, mode="w+", dtype=dtype, shape=shape)
+    if out.shape != shape:
+        raise ValueError("The output needs to have shape {}".format(shape))
+    _rows = max(1, chunk_size//max(len(v), 1))
+    for _start in range(0, len(u), _rows):
+        _stop = _start + _rows
+        out[_start:_stop] = copula(u[_start:_stop, np.newaxis], v, t)
+    if isinstance(out, np.memmap):
+        out.flush()
+    return out
 
 # Clayton Copula
 def copula_clayton_dv(u, v, theta):
@@ -67,3 +102,169 @@ def clayton_samples(n, rv_x=stats.uniform, rv_y=stats.uniform, theta=.25, u=None
         _y = rv_y.ppf(uk1)
         _x = rv_x.ppf(u)
     return (_x, _y)
+
+# ZOC Copulas
+def zoc_copula1_samples(n, rv_x=stats.uniform, rv_y=stats.uniform, t=.5, u=None,
+                        rng=None, rtol=None):
+    """Samples (X, Y) with the copula `zoc_copula1` and the marginals `rv_x`
+    and `rv_y`.
+
+    Given the level `u` of X, the level of Y is one of the two values of
+    `inv_zoc_copula1_dv` with equal probability. The random numbers are drawn
+    from `rng`, which can be a `Generator` or a seed. See
+    `copula_sample_chunks` for `rtol`.
+    """
+    rng = np.random.default_rng(rng)
+    rv_x, rv_y = _tabulated_marginals(rtol, rv_x, rv_y)
+    if u is None:
+        u = rng.random(n)
+    _y = rv_y.ppf(inv_zoc_copula1_dv(rng.random(n), u, t))
+    _x = rv_x.ppf(u)
+    return (_x, _y)
+
+def zoc_copula2_samples(n, rv_x=stats.uniform, rv_y=stats.uniform, t=.5, u=None,
+                        rng=None, rtol=None):
+    """Samples (X, Y) with the copula `zoc_copula2` and the marginals `rv_x`
+    and `rv_y`.
+
+    The copula is singular, i.e., the level of Y is a function of the level
+    `u` of X, so only a single random number is needed per sample. See
+    `zoc_copula1_samples` for the other arguments.
+    """
+    rng = np.random.default_rng(rng)
+    rv_x, rv_y = _tabulated_marginals(rtol, rv_x, rv_y)
+    if u is None:
+        u = rng.random(n)
+    _y = rv_y.ppf(inv_zoc_copula2_dv(None, u, t))
+    _x = rv_x.ppf(u)
+    return (_x, _y)
+
+# Streaming samplers
+# Number of samples of the independent random streams
+BLOCK_SIZE = 2**16
+
+def seed_sequence(seed=None):
+    """`numpy.random.SeedSequence` from `seed`, which can also be a seed
+    sequence or a generator. All samplers that split their samples into
+    independent blocks derive their streams from it."""
+    if isinstance(seed, np.random.SeedSequence):
+        return seed
+    if isinstance(seed, np.random.Generator):
+        return np.random.SeedSequence(seed.integers(2**32, size=4))
+    return np.random.SeedSequence(seed)
+
+def _uniform_pairs(seed_seq, start, out, block_size=BLOCK_SIZE):
+    """Fill `out` of shape `(k, 2)` with the uniforms of samples start..start+k.
+
+    The samples are split into blocks of `block_size` and every block has its
+    own stream that is spawned from `seed_seq`. Sample `i` therefore only
+    depends on `seed_seq` and `i`, but not on how the samples are chunked or
+    distributed over workers.
+    """
+    _flat = out.reshape(-1)
+    _filled = 0
+    while _filled < len(out):
+        _block, _offset = divmod(start+_filled, block_size)
+        _count = min(block_size-_offset, len(out)-_filled)
+        _seq = np.random.SeedSequence(seed_seq.entropy, pool_size=seed_seq.pool_size,
+                                      spawn_key=seed_seq.spawn_key+(_block,))
+        _bit_generator = np.random.PCG64(_seq)
+        _bit_generator.advance(2*_offset)
+        np.random.Generator(_bit_generator).random(out=_flat[2*_filled:2*(_filled+_count)])
+        _filled += _count
+    return out
+
+def split_sample_range(n, num_workers, block_size=BLOCK_SIZE):
+    """Split `n` samples into contiguous `(start, num)` ranges for workers.
+
+    The ranges are aligned to the blocks of the random streams.
+    """
+    _blocks = np.array_split(np.arange(int(np.ceil(n/block_size))), num_workers)
+    _ranges = []
+    for _part in _blocks:
+        if len(_part) == 0:
+            continue
+        _start = int(_part[0])*block_size
+        _stop = min((int(_part[-1])+1)*block_size, n)
+        _ranges.append((_start, _stop-_start))
+    return _ranges
+
+def _tabulated_marginals(rtol, *dists):
+    """Tabulated versions of the frozen distributions in `dists` (see
+    `tabulated.tabulate`) if `rtol` is given."""
+    if rtol is None:
+        return dists
+    from tabulated import tabulate
+    return tuple(tabulate(_rv, rtol=rtol) if hasattr(_rv, "dist") else _rv
+                 for _rv in dists)
+
+def copula_sample_chunks(n, inv_copula_dv, rv_x=stats.uniform,
+                         rv_y=stats.uniform, param=.5, seed=None,
+                         chunk_size=2**20, start=0, rtol=None):
+    """Generate samples of a joint distribution in chunks of `chunk_size`.
+
+    The dependency is given by the conditional inverse `inv_copula_dv(p, v,
+    param)` of the copula, e.g., `inv_copula_clayton_dv` or
+    `inv_zoc_copula1_dv`. The marginals are given by `rv_x` and `rv_y`.
+
+    This yields tuples `(x, y)` of at most `chunk_size` samples until `n`
+    samples are generated. The random numbers are drawn from streams spawned
+    from `seed`, which can be an int, a `SeedSequence` or a `Generator`.
+    The samples are bit-identical for a given seed, independent of the chunk
+    size. Use `start` to generate only a part of the samples, e.g., in a
+    worker process (see `split_sample_range`).
+
+    The quantile functions of the marginals are usually the most expensive
+    part. If `rtol` is given, frozen marginals are replaced by tables of
+    their quantile functions with this relative accuracy (see
+    `tabulated.py`), which is several times faster, e.g., for Nakagami-m
+    fading.
+
+    The yielded arrays are reused for the next chunk, so they need to be
+    copied if they should be kept.
+    """
+    rv_x, rv_y = _tabulated_marginals(rtol, rv_x, rv_y)
+    seed_seq = seed_sequence(seed)
+    chunk_size = max(1, min(chunk_size, n))
+    _uniforms = np.empty((chunk_size, 2))
+    _x = np.empty(chunk_size)
+    _y = np.empty(chunk_size)
+    for _start in range(start, start+n, chunk_size):
+        _num = min(chunk_size, start+n-_start)
+        _u = _uniform_pairs(seed_seq, _start, _uniforms[:_num])
+        _x[:_num] = rv_x.ppf(_u[:, 0])
+        _y[:_num] = rv_y.ppf(inv_copula_dv(_u[:, 1], _u[:, 0], param))
+        yield _x[:_num], _y[:_num]
+
+def _inv_independent_dv(p, v, param=None):
+    return p
+
+def clayton_sample_chunks(n, rv_x=stats.uniform, rv_y=stats.uniform, theta=.25,
+                          seed=None, chunk_size=2**20, start=0, rtol=None):
+    """Generate samples with a Clayton copula in chunks of `chunk_size`.
+
+    See `copula_sample_chunks` for details.
+    """
+    _inv = _inv_independent_dv if theta == 0 else inv_copula_clayton_dv
+    return copula_sample_chunks(n, _inv, rv_x, rv_y, theta, seed=seed,
+                                chunk_size=chunk_size, start=start, rtol=rtol)
+
+def zoc_copula1_sample_chunks(n, rv_x=stats.uniform, rv_y=stats.uniform, t=.5,
+                              seed=None, chunk_size=2**20, start=0, rtol=None):
+    """Generate samples with the copula `zoc_copula1` in chunks of
+    `chunk_size`.
+
+    See `copula_sample_chunks` for details.
+    """
+    return copula_sample_chunks(n, inv_zoc_copula1_dv, rv_x, rv_y, t, seed=seed,
+                                chunk_size=chunk_size, start=start, rtol=rtol)
+
+def zoc_copula2_sample_chunks(n, rv_x=stats.uniform, rv_y=stats.uniform, t=.5,
+                              seed=None, chunk_size=2**20, start=0, rtol=None):
+    """Generate samples with the copula `zoc_copula2` in chunks of
+    `chunk_size`.
+
+    See `copula_sample_chunks` for details.
+    """
+    return copula_sample_chunks(n, inv_zoc_copula2_dv, rv_x, rv_y, t, seed=seed,
+                                chunk_size=chunk_size, start=start, rtol=rtol)
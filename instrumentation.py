@@ -0,0 +1,156 @@
+"""Solver Instrumentation
+
+This module contains opt-in counters and timers for the numerical solvers. By
+default, instrumentation is disabled and every hook in the solvers only checks
+a global variable. Within the context manager `instrument`, the hooks record
+counters (e.g., function evaluations, brackets and iterations) and timers
+(e.g., time spent in the scipy distributions), both in total and for every
+call of a solver. The report is a JSON-serializable dict.
+
+Example:
+    with instrument() as recorder:
+        zoc_copula_t_mrc_heterog(t, rv_x, rv_y)
+    print(recorder.report())
+
+
+Copyright (C) 2021 Karl-Ludwig Besser
+
+This program is used in the article:
+Karl-Ludwig Besser, Pin-Hsun Lin, and Eduard Jorswieck, "On Fading Channel
+Dependency Structures with a Positive Zero-Outage Capacity", IEEE Transactions
+on Communications, vol. 69, no. 10, pp. 6561-6574, Oct 2021.
+
+License:
+This program is licensed under the GPLv3 license. If you in any way use this
+code for research that results in publications, please cite our original
+article listed above.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+PARTICULAR PURPOSE.
+See the GNU General Public License for more details.
+
+Author: Karl-Ludwig Besser, Technische Universität Braunschweig
+"""
+
+from collections import defaultdict
+import contextlib
+import functools
+import json
+import time
+
+_RECORDER = None
+_DISABLED = contextlib.nullcontext()
+
+class Recorder:
+    """Collection of counters, timers and records of solver calls.
+
+    `callback` is called with the record of every finished solver call.
+    """
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.counters = defaultdict(int)
+        self.timers = defaultdict(float)
+        self.calls = []
+        self._stack = []
+
+    def count(self, name, value=1):
+        self.counters[name] += int(value)
+        for _record in self._stack:
+            _record["counters"][name] += int(value)
+
+    def add_time(self, name, seconds):
+        self.timers[name] += seconds
+        for _record in self._stack:
+            _record["timers"][name] += seconds
+
+    @contextlib.contextmanager
+    def timer(self, name):
+        _start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - _start)
+
+    @contextlib.contextmanager
+    def solver_call(self, name, **info):
+        _record = {"function": name, "info": info, "counters": defaultdict(int),
+                   "timers": defaultdict(float)}
+        self._stack.append(_record)
+        _start = time.perf_counter()
+        try:
+            yield _record
+        finally:
+            _record["time"] = time.perf_counter() - _start
+            self._stack.remove(_record)
+            _record["counters"] = dict(_record["counters"])
+            _record["timers"] = dict(_record["timers"])
+            self.calls.append(_record)
+            if self.callback is not None:
+                self.callback(_record)
+
+    def add_info(self, **info):
+        if self._stack:
+            self._stack[-1]["info"].update(info)
+
+    def report(self):
+        return {"counters": dict(self.counters), "timers": dict(self.timers),
+                "calls": list(self.calls)}
+
+    def save(self, filename):
+        with open(filename, "w") as _file:
+            json.dump(self.report(), _file, indent=2)
+
+@contextlib.contextmanager
+def instrument(callback=None):
+    """Enable the instrumentation within the context.
+
+    Yields the `Recorder` that collects the results. Nested contexts record
+    into their own recorder.
+    """
+    global _RECORDER
+    _previous = _RECORDER
+    _RECORDER = Recorder(callback)
+    try:
+        yield _RECORDER
+    finally:
+        _RECORDER = _previous
+
+def enabled():
+    return _RECORDER is not None
+
+def count(name, value=1):
+    if _RECORDER is not None:
+        _RECORDER.count(name, value)
+
+def timer(name):
+    """Context manager that adds its duration to the timer `name`."""
+    if _RECORDER is None:
+        return _DISABLED
+    return _RECORDER.timer(name)
+
+def solver_call(name, **info):
+    """Context manager that records a call of the solver `name`.
+
+    The counters and timers within the context are added to the record of
+    the call, together with `info` and the total time of the call.
+    """
+    if _RECORDER is None:
+        return _DISABLED
+    return _RECORDER.solver_call(name, **info)
+
+def solver(func):
+    """Decorator that records every call of `func` as a solver call (see
+    `solver_call`)."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if _RECORDER is None:
+            return func(*args, **kwargs)
+        with _RECORDER.solver_call(func.__name__):
+            return func(*args, **kwargs)
+    return wrapper
+
+def info(**info):
+    """Add `info` to the record of the innermost solver call."""
+    if _RECORDER is not None:
+        _RECORDER.add_info(**info)
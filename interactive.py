@@ -0,0 +1,250 @@
+"""Incremental Recomputation for Interactive Plots
+
+This module contains the backend of the interactive plots in the notebooks,
+which keeps them responsive while the sliders are moved. The computation of a
+plot is split into stages, i.e., functions whose results are cached with the
+values of their arguments, such that only the stages that depend on a changed
+parameter are evaluated again. The stages are evaluated after the widget
+events stop for a short time, first at a coarse and then at finer levels
+(e.g., resolutions of a grid), and outdated computations are cancelled.
+
+Example:
+    def grid(level):
+        return np.linspace(0, 5, level)
+    def boundary(grid, t, snr_x_db, snr_y_db):
+        ...
+    def draw(results, level):
+        line.set_data(results["grid"], results["boundary"])
+        fig.canvas.draw_idle()
+    recompute = IncrementalRecompute({"grid": grid, "boundary": boundary},
+                                     draw, levels=(40, 150))
+    recompute.interact({"t": .5, "snr_x_db": 0, "snr_y_db": 0},
+                       t=(0, 1, .1), snr_x_db=(-5, 10, 1), snr_y_db=(-5, 10, 1))
+
+
+Copyright (C) 2021 Karl-Ludwig Besser
+
+This program is used in the article:
+Karl-Ludwig Besser, Pin-Hsun Lin, and Eduard Jorswieck, "On Fading Channel
+Dependency Structures with a Positive Zero-Outage Capacity", IEEE Transactions
+on Communications, vol. 69, no. 10, pp. 6561-6574, Oct 2021.
+
+License:
+This program is licensed under the GPLv3 license. If you in any way use this
+code for research that results in publications, please cite our original
+article listed above.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+PARTICULAR PURPOSE.
+See the GNU General Public License for more details.
+
+Author: Karl-Ludwig Besser, Technische Universität Braunschweig
+"""
+
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import inspect
+import threading
+import time
+
+from cache import encode
+
+class Cancelled(Exception):
+    """Raised in a computation whose parameters are outdated."""
+
+class IncrementalRecompute:
+    """Debounced, progressive and cancellable evaluation of `stages`.
+
+    `stages` is a dict of functions in the order of their evaluation. The
+    names of their arguments are parameters (the keyword arguments of
+    `update`), names of earlier stages, or `level`, which is the current
+    element of `levels`. Every result is cached with the key of its
+    arguments (earlier stages by their own keys), so stages that do not
+    depend on a changed parameter or on `level` are reused. The `cache_size`
+    most recently used results are kept.
+
+    `update` returns immediately. When there has been no further update for
+    `delay` seconds, the stages are evaluated on a worker thread for all
+    levels and `draw(results, level)` is called after every level with the
+    dict of the parameters and the results of all stages. Levels before the
+    finest level that is completely cached are skipped. A computation is
+    cancelled between two stages as soon as newer parameters are available
+    (a running stage is not interrupted). The durations of the stages of the
+    last evaluation are stored in `timings`.
+
+    Plotting libraries like matplotlib are not thread-safe, so `draw` is not
+    called on the worker thread. The worker hands the results to the asyncio
+    event loop `loop` (by default the loop that runs while the object is
+    created, e.g., the loop of the Jupyter kernel), which draws them on its
+    own thread. Only the results of the newest level are drawn if the loop
+    is busy. Without a loop, the results are drawn by `wait`.
+    """
+    def __init__(self, stages, draw, levels=(None,), delay=.05, cache_size=256,
+                 loop=None):
+        if loop is None:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                pass
+        self.stages = dict(stages)
+        self.draw = draw
+        self.loop = loop
+        self.levels = tuple(levels)
+        self.delay = delay
+        self.cache_size = cache_size
+        self.timings = {}
+        self._arguments = {}
+        for _name, _func in self.stages.items():
+            _arguments = list(inspect.signature(_func).parameters)
+            for _arg in _arguments:
+                if _arg in self.stages and _arg not in self._arguments:
+                    raise ValueError("Stage {} depends on the later stage {}".format(
+                        _name, _arg))
+            self._arguments[_name] = _arguments
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._timer = None
+        self._future = None
+        self._pending_draw = None
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+    def _keys(self, params, level):
+        """Cache keys of all stages."""
+        keys = {}
+        for _name, _arguments in self._arguments.items():
+            _key = []
+            for _arg in _arguments:
+                if _arg == "level":
+                    _key.append(encode(level))
+                elif _arg in keys:
+                    _key.append(keys[_arg])
+                elif _arg in params:
+                    _key.append(encode(params[_arg]))
+                else:
+                    raise ValueError("Missing parameter {} of stage {}".format(_arg, _name))
+            keys[_name] = (_name, tuple(_key))
+        return keys
+
+    def is_cached(self, level, **params):
+        """True if the results of all stages for `level` are cached."""
+        with self._lock:
+            return all(_key in self._cache for _key in self._keys(params, level).values())
+
+    def compute(self, level, check=None, **params):
+        """Dict of `params` and the results of all stages for `level`, which
+        are taken from the cache if possible. `check` is called before every
+        stage and can raise `Cancelled`."""
+        keys = self._keys(params, level)
+        results = {}
+        for _name, _func in self.stages.items():
+            if check is not None:
+                check()
+            with self._lock:
+                _cached = keys[_name] in self._cache
+                if _cached:
+                    self._cache.move_to_end(keys[_name])
+                    results[_name] = self._cache[keys[_name]]
+            if _cached:
+                self.timings[_name] = 0.
+                continue
+            _args = {_arg: level if _arg == "level" else results.get(_arg, params.get(_arg))
+                     for _arg in self._arguments[_name]}
+            _start = time.perf_counter()
+            results[_name] = _func(**_args)
+            self.timings[_name] = time.perf_counter() - _start
+            with self._lock:
+                self._cache[keys[_name]] = results[_name]
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return dict(params, **results)
+
+    def _run(self, generation, params):
+        """Evaluate and draw all levels until `params` are outdated."""
+        def _check():
+            if generation != self._generation:
+                raise Cancelled()
+        _start = 0
+        for i, level in enumerate(self.levels):
+            if self.is_cached(level, **params):
+                _start = i
+        try:
+            for level in self.levels[_start:]:
+                results = self.compute(level, check=_check, **params)
+                _check()
+                with self._lock:
+                    self._pending_draw = (generation, results, level)
+                if self.loop is not None:
+                    self.loop.call_soon_threadsafe(self.draw_pending)
+        except Cancelled:
+            return False
+        return True
+
+    def draw_pending(self):
+        """Draw the newest results of the worker if they are still up to
+        date. This needs to be called on the thread that owns the plots."""
+        with self._lock:
+            _pending, self._pending_draw = self._pending_draw, None
+        if _pending is None:
+            return
+        generation, results, level = _pending
+        if generation == self._generation:
+            self.draw(results, level)
+
+    def _submit(self, generation, params):
+        with self._lock:
+            if generation == self._generation:
+                self._future = self._executor.submit(self._run, generation, params)
+
+    def update(self, **params):
+        """Schedule the evaluation for `params` and cancel all earlier ones."""
+        with self._lock:
+            self._generation += 1
+            self._future = None
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = threading.Timer(self.delay, self._submit,
+                                          args=(self._generation, params))
+            self._timer.daemon = True
+            self._timer.start()
+
+    def wait(self, timeout=None):
+        """Wait for the evaluation of the last update and draw its results on
+        the calling thread. Returns False if it was cancelled and raises the
+        exceptions of the stages and `draw`."""
+        with self._lock:
+            _timer = self._timer
+        if _timer is None:
+            return True
+        _timer.join(timeout)
+        with self._lock:
+            _future = self._future
+        if _future is None:
+            return False
+        done = _future.result(timeout)
+        self.draw_pending()
+        return done
+
+    def interact(self, defaults=None, **widgets):
+        """Connect `update` to the widgets created by `ipywidgets.interact`
+        from the abbreviations `widgets`, whose initial values are taken
+        from the dict `defaults`."""
+        from ipywidgets import interact
+        defaults = {} if defaults is None else defaults
+        def _update(**params):
+            self.update(**params)
+        _update.__signature__ = inspect.Signature([
+            inspect.Parameter(_name, inspect.Parameter.KEYWORD_ONLY,
+                              default=defaults.get(_name, inspect.Parameter.empty))
+            for _name in widgets])
+        return interact(_update, **widgets)
+
+    def close(self):
+        """Cancel the pending evaluations and stop the worker thread."""
+        with self._lock:
+            self._generation += 1
+            if self._timer is not None:
+                self._timer.cancel()
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,312 @@
+"""ZOC Lookup Tables
+
+This module contains precomputed tables of the ZOC for Nakagami-m fading with
+two links, which answer (batches of) queries by multilinear interpolation
+instead of running the numerical solvers. The fading model is the one of
+`nakagami_fading.main_two_links`, i.e., Gamma distributed SNRs with shape m and
+mean SNR_x and SNR_y, together with the copula-t construction for MRC or the
+optimal dependency for SC.
+
+Since all quantiles scale linearly with the mean SNR, the optimal value of X+Y
+(MRC) or max(X, Y) (SC) for the SNRs (SNR_x, SNR_y) is SNR_x times the value
+for (1, SNR_y/SNR_x). The tables therefore store this normalized SNR over
+(m, SNR_y/SNR_x in dB, t) and a query for (m, SNR_x, SNR_y, t) is answered
+with ZOC = log2(1 + SNR_x*g).
+
+The normalized SNR is nondecreasing in SNR_y/SNR_x and in t. The exact values
+are computed on a grid with twice the resolution when the table is built, and
+on every sub-cell of this grid both the exact function and the (also
+monotone) interpolation lie between their values at the lowest and highest
+corner. This gives a guaranteed error bound for every cell of the table if m
+is one of the grid points (up to the accuracy of the solvers). The normalized
+SNR is not monotone in m, so between the grid points of m only an estimate
+of the additional error from the midpoints of m is available. Every query
+returns the error bound or estimate of its cell. `check_table` compares the
+table to the exact solvers on random points.
+
+Example:
+    table = build_table(m=[1, 2, 5], t=np.linspace(0, 1, 21))
+    zoc, error = table(2.5, snr_x_db, snr_y_db, .7, return_error=True)
+
+
+Copyright (C) 2021 Karl-Ludwig Besser
+
+This program is used in the article:
+Karl-Ludwig Besser, Pin-Hsun Lin, and Eduard Jorswieck, "On Fading Channel
+Dependency Structures with a Positive Zero-Outage Capacity", IEEE Transactions
+on Communications, vol. 69, no. 10, pp. 6561-6574, Oct 2021.
+
+License:
+This program is licensed under the GPLv3 license. If you in any way use this
+code for research that results in publications, please cite our original
+article listed above.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+PARTICULAR PURPOSE.
+See the GNU General Public License for more details.
+
+Author: Karl-Ludwig Besser, Technische Universität Braunschweig
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import itertools
+
+import numpy as np
+
+COMBINING = ("mrc", "sc")
+# Factor between the largest error at the midpoints of m and its estimate
+SAFETY_FACTOR = 2.
+
+def _exact_normalized(combining, m, ratio_db, t=None):
+    """Exact normalized SNR for SNR_x=1 for one value of `m` and all values of
+    `ratio_db` (and `t` for MRC)."""
+    from rayleigh_fading import zoc_copula_t_mrc_heterog_rayleigh
+    from maximum_ratio_combining import zoc_copula_t_mrc_heterog
+    from selection_combining import max_zoc_sc_heterog_batch
+    from sweep import fading_distribution
+    ratio_db = np.asarray(ratio_db, dtype=float)
+    if combining == "sc":
+        _snr_db = np.stack([np.zeros_like(ratio_db), ratio_db], axis=-1)
+        return 2**max_zoc_sc_heterog_batch(fading_distribution("nakagami", _snr_db, m)) - 1
+    results = np.empty((len(ratio_db), len(t)))
+    for _idx, _ratio_db in enumerate(ratio_db):
+        if m == 1:
+            _zoc = zoc_copula_t_mrc_heterog_rayleigh(t, 1., 10**(-_ratio_db/10.))
+        else:
+            _zoc = zoc_copula_t_mrc_heterog(t, fading_distribution("nakagami", 0., m),
+                                            fading_distribution("nakagami", _ratio_db, m))
+        results[_idx] = 2**_zoc - 1
+    return results
+
+def _refine(axis):
+    """Axis with the midpoints of all intervals inserted."""
+    refined = np.empty(2*len(axis)-1)
+    refined[::2] = axis
+    refined[1::2] = (axis[1:] + axis[:-1])/2
+    return refined
+
+def _locate(axis, x):
+    """Index of the interval of `axis` that contains `x`, the position within
+    the interval and whether `x` is outside of the axis (or NaN)."""
+    x = np.asarray(x, dtype=float)
+    idx = np.clip(np.searchsorted(axis, x, side="right")-1, 0, len(axis)-2)
+    weight = (x - axis[idx])/(axis[idx+1] - axis[idx])
+    outside = ~((x >= axis[0]) & (x <= axis[-1]))
+    return idx, weight, outside
+
+class ZOCTable:
+    """Lookup table of the normalized SNR on the grid `axes`.
+
+    `axes` are the sorted grid points of m, the ratio SNR_y/SNR_x in dB and,
+    for MRC, the copula parameter t. `values` contains the normalized SNR on
+    the grid. `cell_bound` is the error bound of the normalized SNR in every
+    cell of the grid for the values of m on the grid and `m_error_estimate`
+    the estimated additional error for the values of m between them (which is
+    not guaranteed).
+    """
+    def __init__(self, combining, axes, values, cell_bound, m_error_estimate):
+        if combining not in COMBINING:
+            raise ValueError("Unknown combining: {}".format(combining))
+        self.combining = combining
+        self.axes = [np.asarray(_axis, dtype=float) for _axis in axes]
+        self.values = np.asarray(values)
+        self.cell_bound = np.asarray(cell_bound)
+        self.m_error_estimate = np.asarray(m_error_estimate)
+        if self.values.shape != tuple(len(_axis) for _axis in self.axes):
+            raise ValueError("The values need to have the shape of the axes")
+        for _axis in self.axes:
+            if len(_axis) < 2 or np.any(np.diff(_axis) <= 0):
+                raise ValueError("The axes need to be increasing with at least two points")
+
+    @property
+    def error_bound(self):
+        """Largest error bound of the normalized SNR in the table for the
+        values of m on the grid."""
+        return float(np.max(self.cell_bound))
+
+    @property
+    def error_estimate(self):
+        """Largest error estimate of the normalized SNR in the table for all
+        values of m."""
+        return float(np.max(self.cell_bound + self.m_error_estimate))
+
+    def interpolate(self, *coords, return_error=False):
+        """Multilinear interpolation of the normalized SNR at `coords`.
+
+        Points outside of the grid are NaN. The error is the bound of the
+        cell if m is on the grid and an estimate otherwise.
+        """
+        coords = np.broadcast_arrays(*[np.asarray(_c, dtype=float) for _c in coords])
+        _located = [_locate(_axis, _c) for _axis, _c in zip(self.axes, coords)]
+        _idx = [_loc[0] for _loc in _located]
+        _weight = [_loc[1] for _loc in _located]
+        value = np.zeros(np.shape(coords[0]))
+        for _corner in itertools.product((0, 1), repeat=len(self.axes)):
+            _factor = np.ones_like(value)
+            for _w, _c in zip(_weight, _corner):
+                _factor = _factor*(_w if _c else 1-_w)
+            value += _factor*self.values[tuple(_i + _c for _i, _c in zip(_idx, _corner))]
+        _outside = np.any([_loc[2] for _loc in _located], axis=0)
+        value[_outside] = np.nan
+        if return_error:
+            _cell = tuple(_idx)
+            _m_on_grid = np.isin(coords[0], self.axes[0])
+            error = self.cell_bound[_cell] + np.where(_m_on_grid, 0., self.m_error_estimate[_cell])
+            error = np.where(_outside, np.nan, error)
+            return value[()], error[()]
+        return value[()]
+
+    def __call__(self, m, snr_x_db, snr_y_db, t=None, return_error=False):
+        """ZOC for Nakagami-m fading with the SNRs `snr_x_db` and `snr_y_db`.
+
+        With `return_error`, the bound on the absolute error of the ZOC is
+        returned as well, which is only an estimate if m is not on the grid.
+        """
+        if (t is None) != (self.combining == "sc"):
+            raise ValueError("t is required for MRC and not used for SC")
+        snr_x_db = np.asarray(snr_x_db, dtype=float)
+        _coords = [m, np.asarray(snr_y_db) - snr_x_db] + ([] if t is None else [t])
+        _value, _error = self.interpolate(*_coords, return_error=True)
+        snr_x = 10**(snr_x_db/10.)
+        zoc = np.log2(1 + snr_x*_value)
+        if return_error:
+            _low = np.maximum(_value - _error, 0)
+            error = np.maximum(np.log2(1 + snr_x*(_value+_error)) - zoc,
+                               zoc - np.log2(1 + snr_x*_low))
+            return zoc[()], error[()]
+        return zoc[()]
+
+    def save(self, filename):
+        """Save the table as compressed `.npz` file with single precision."""
+        np.savez_compressed(filename, combining=self.combining,
+                            values=self.values.astype(np.float32),
+                            cell_bound=self.cell_bound.astype(np.float32),
+                            m_error_estimate=self.m_error_estimate.astype(np.float32),
+                            **{"axis{}".format(_idx): _axis
+                               for _idx, _axis in enumerate(self.axes)})
+
+    @classmethod
+    def load(cls, filename):
+        with np.load(filename) as _data:
+            _axes = [_data["axis{}".format(_idx)]
+                     for _idx in range(_data["values"].ndim)]
+            return cls(str(_data["combining"]), _axes, _data["values"],
+                       _data["cell_bound"], _data["m_error_estimate"])
+
+def build_table(m=(1, 2, 3, 4, 5, 6, 8, 10), ratio_db=np.linspace(-20, 20, 41),
+                t=np.linspace(0, 1, 51), combining="mrc", workers=None):
+    """Build the lookup table on the grid of `m`, `ratio_db` (SNR_y/SNR_x in
+    dB) and `t` (only for MRC).
+
+    The exact values are computed on the grid with all midpoints inserted,
+    in parallel for the values of m. The table only stores the values on the
+    original grid (in single precision) and the errors of every cell. For the
+    values of m on the grid, the bound follows from the monotonicity in the
+    other axes: on every sub-cell of the refined grid, the exact values E and
+    the interpolation I lie between their values at the lowest and highest
+    corner, so the error is at most max(E_hi - I_lo, I_hi - E_lo). Decreases
+    of the exact values along these axes, i.e., numerical errors of the
+    solvers, are added to the bound. The estimate for the values of m between
+    the grid points is `SAFETY_FACTOR` times the largest error of the
+    interpolation at the midpoints of m in the cell.
+    """
+    if combining not in COMBINING:
+        raise ValueError("Unknown combining: {}".format(combining))
+    axes = [np.asarray(m, dtype=float), np.asarray(ratio_db, dtype=float)]
+    if combining == "mrc":
+        axes.append(np.asarray(t, dtype=float))
+    _fine = [_refine(_axis) for _axis in axes]
+    _t = _fine[2] if combining == "mrc" else None
+    with ProcessPoolExecutor(workers) as executor:
+        _exact = np.array(list(executor.map(
+            _exact_normalized, itertools.repeat(combining), _fine[0],
+            itertools.repeat(_fine[1]), itertools.repeat(_t))))
+    _coarse = tuple(slice(None, None, 2) for _axis in axes)
+    values = _exact[_coarse].astype(np.float32)
+    _shape = [len(_axis)-1 for _axis in axes]
+    table = ZOCTable(combining, axes, values, np.zeros(_shape), np.zeros(_shape))
+    _interp = table.interpolate(*np.meshgrid(*_fine, indexing="ij"))
+    _rounding = np.finfo(np.float32).eps*np.max(values)
+    # Bound on the sub-cells of the refined grid for the values of m on the grid
+    _lo = (slice(None, None, 2),) + (slice(None, -1),)*(len(axes)-1)
+    _hi = (slice(None, None, 2),) + (slice(1, None),)*(len(axes)-1)
+    _sub_bound = np.maximum(_exact[_hi] - _interp[_lo], _interp[_hi] - _exact[_lo])
+    _decrease = max(np.max(-np.diff(_exact[::2], axis=_axis), initial=0.)
+                    for _axis in range(1, len(axes)))
+    cell_bound = np.zeros(_shape)
+    for _offset in itertools.product((0, 1), repeat=len(axes)):
+        _block = tuple(slice(_o, _o + _n if _a == 0 else _o + 2*_n, 1 if _a == 0 else 2)
+                       for _a, (_o, _n) in enumerate(zip(_offset, _shape)))
+        cell_bound = np.maximum(cell_bound, _sub_bound[_block])
+    table.cell_bound = cell_bound + _decrease + _rounding
+    # Estimate at the midpoints of m
+    _error = np.abs(_interp - _exact)[1::2]
+    m_error = np.zeros(_shape)
+    for _offset in itertools.product((0, 1, 2), repeat=len(axes)-1):
+        _block = (slice(None),) + tuple(slice(_o, _o + 2*_n, 2)
+                                        for _o, _n in zip(_offset, _shape[1:]))
+        m_error = np.maximum(m_error, _error[_block])
+    table.m_error_estimate = SAFETY_FACTOR*m_error + _rounding
+    return table
+
+def _exact_zoc(combining, m, snr_x_db, snr_y_db, t=None):
+    from rayleigh_fading import zoc_copula_t_mrc_heterog_rayleigh
+    from maximum_ratio_combining import zoc_copula_t_mrc_heterog
+    from selection_combining import max_zoc_sc_heterog
+    from sweep import fading_distribution
+    rv_x = fading_distribution("nakagami", snr_x_db, m)
+    rv_y = fading_distribution("nakagami", snr_y_db, m)
+    if combining == "sc":
+        return max_zoc_sc_heterog([rv_x.ppf, rv_y.ppf])
+    if m == 1:
+        return zoc_copula_t_mrc_heterog_rayleigh(t, 10**(-snr_x_db/10.), 10**(-snr_y_db/10.))
+    return zoc_copula_t_mrc_heterog(t, rv_x, rv_y)
+
+def check_table(table, num_points=100, snr_x_db=(-10, 10), seed=None):
+    """Compare the table to the exact solvers on random points.
+
+    The points are uniformly distributed over the grid of the table and
+    the interval `snr_x_db`. For m=1 and MRC, the closed form for Rayleigh
+    fading is used as exact solution. Returns the largest error, the largest
+    error bound (or estimate) and the number of points whose error exceeds
+    it.
+    """
+    rng = np.random.default_rng(seed)
+    _coords = [rng.uniform(_axis[0], _axis[-1], num_points) for _axis in table.axes]
+    if table.axes[0][0] <= 1 <= table.axes[0][-1]:
+        _coords[0][:num_points//4] = 1.
+    _snr_x_db = rng.uniform(*snr_x_db, num_points)
+    _snr_y_db = _snr_x_db + _coords[1]
+    _t = _coords[2] if table.combining == "mrc" else None
+    zoc, bound = table(_coords[0], _snr_x_db, _snr_y_db, _t, return_error=True)
+    exact = np.array([_exact_zoc(table.combining, _coords[0][_idx], _snr_x_db[_idx],
+                                 _snr_y_db[_idx], None if _t is None else _t[_idx])
+                      for _idx in range(num_points)])
+    error = np.abs(zoc - exact)
+    return {"max_error": float(np.max(error)), "max_bound": float(np.max(bound)),
+            "violations": int(np.count_nonzero(error > bound))}
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("filename")
+    parser.add_argument("--combining", choices=COMBINING, default="mrc")
+    parser.add_argument("-m", type=float, nargs="+", default=[1, 2, 3, 4, 5, 6, 8, 10])
+    parser.add_argument("--ratio_min", type=float, default=-20)
+    parser.add_argument("--ratio_max", type=float, default=20)
+    parser.add_argument("--num_ratio", type=int, default=41)
+    parser.add_argument("--num_t", type=int, default=51)
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--check", type=int, default=100,
+                        help="Number of random points to check against the exact solvers")
+    args = parser.parse_args()
+    table = build_table(args.m, np.linspace(args.ratio_min, args.ratio_max, args.num_ratio),
+                        np.linspace(0, 1, args.num_t), combining=args.combining,
+                        workers=args.workers)
+    table.save(args.filename)
+    print("Error bound of the normalized SNR: {:.3e} (m on the grid), "
+          "error estimate: {:.3e}".format(table.error_bound, table.error_estimate))
+    if args.check:
+        print(check_table(table, args.check, seed=0))
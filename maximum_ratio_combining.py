@@ -25,78 +25,588 @@ See the GNU General Public License for more details.
 Author: Karl-Ludwig Besser, Technische Universität Braunschweig
 """
 
+import itertools
+
 import numpy as np
-from scipy import optimize
-from scipy import integrate
 from scipy import stats
 
-from utils import export_results, pairwise
+from utils import (export_results, find_roots_bisect, frozen_parameters, is_distribution,
+                   Marginals)
+import instrumentation
 
-def _is_distribution(dist):
-    if hasattr(dist, 'dist'):
-        return isinstance(dist.dist, stats.rv_continuous)
-    else:
-        return isinstance(dist, stats.rv_continuous)
+# Increase when the results of the numerical solvers change. This invalidates
+# cached results (see `cache.py`).
+SOLVER_VERSION = 4
 
 def max_zoc_outer_bound_mrc_homog(qf, n=2):
-    if _is_distribution(qf):
+    if is_distribution(qf):
         qf = qf.ppf
     return np.log2(1 + n*qf(1-1/n))
 
 def max_zoc_outer_bound_joint_mix_mrc_homog(mean, n=2):
-    if _is_distribution(mean):
+    if is_distribution(mean):
         mean = mean.mean()
     return np.log2(1 + n*mean)
 
 def max_zoc_inner_bound_mrc_homog(qf, n=2):
-    if _is_distribution(qf):
+    if is_distribution(qf):
         qf = qf.ppf
     x_star = qf((1-1./n)**(n-1))
     return np.log2(1 + n*x_star)
 
 
+def _boundary_y(x, t, rv_x, rv_y):
+    """Boundary F_y^{-1}(t-F_x(x)) of the support.
+
+    In the upper tail of X, the level t-F_x(x) of Y is computed from the
+    survival function of X, and in the upper tail of Y, the boundary is
+    computed from the inverse survival function of Y. This keeps the
+    precision for t=1, where the boundary extends to levels far below the
+    machine precision at both ends.
+    """
+    x, t = np.broadcast_arrays(np.asarray(x, dtype=float), np.asarray(t, dtype=float))
+    _cdf = np.asarray(rv_x.cdf(x))
+    _upper_x = _cdf >= .5
+    _level = np.array(t - _cdf)
+    if np.any(_upper_x):
+        _level[_upper_x] = (t[_upper_x]-1) + rv_x.sf(x[_upper_x])
+    _upper_y = _level >= .5
+    y = np.empty_like(_level)
+    y[~_upper_y] = rv_y.ppf(_level[~_upper_y])
+    if np.any(_upper_y):
+        y[_upper_y] = rv_y.isf((1-t[_upper_y]) + _cdf[_upper_y])
+    return y[()]
+
 def _opt_x(x, t, rv_x, rv_y):
-    return rv_y.pdf(rv_y.ppf(t-rv_x.cdf(x)))-rv_x.pdf(x)
+    instrumentation.count("opt_x.evaluations", np.size(x))
+    with instrumentation.timer("scipy.opt_x"):
+        return rv_y.pdf(_boundary_y(x, t, rv_x, rv_y))-rv_x.pdf(x)
+
+# Logits of the fractions of t at the levels of the bracket grids: uniform
+# in the center and geometric in the tails down to levels of about 1e-300
+_LEVEL_LOGITS = np.concatenate((-np.geomspace(690, 32, 30), np.linspace(-30, 30, 121),
+                                np.geomspace(32, 690, 30)))
+
+def _level_grid(t, rv_x):
+    """Grid of x for the root search of `_opt_x`, one row for each t.
+
+    The points are the quantiles of X at the levels u=t*expit(z) for the
+    logits z in `_LEVEL_LOGITS`, so the grid covers (0, rv_x.ppf(t)) and is
+    dense close to both ends, where u or t-u is small. For t=1, where the
+    boundary extends to infinity, the stationary points can lie at levels
+    far below the machine precision, so the upper tail is computed with the
+    inverse survival function.
+    """
+    t = np.asarray(t, dtype=float)[:, np.newaxis]
+    _lower = _LEVEL_LOGITS < 0
+    points = np.empty((len(t), len(_LEVEL_LOGITS)))
+    points[:, _lower] = rv_x.ppf(t/(1 + np.exp(-_LEVEL_LOGITS[_lower])))
+    points[:, ~_lower] = rv_x.isf((1-t) + t/(1 + np.exp(_LEVEL_LOGITS[~_lower])))
+    return points
+
+def _interval_bounds(t, rv_x):
+    """Lower and upper bounds of the brackets between the points of
+    `_level_grid`."""
+    _points = _level_grid(t, rv_x)
+    return _points[:, :-1], _points[:, 1:]
 
 def _xopt_numerical(t, rv_x, rv_y):
-    if t == 1:
-        _interval_bounds = np.logspace(-8, rv_x.ppf(1-1e-8), num=60)
-    else:
-        _interval_bounds = np.logspace(-5, rv_x.ppf(t), num=50)
-    _interval_bounds_fw = np.concatenate(([0], _interval_bounds))
-    _interval_bounds_bw = np.flip(np.concatenate(([max(_interval_bounds)],
-                                  max(_interval_bounds)-_interval_bounds)))
-    _interval_bounds_lin = np.linspace(0, max(_interval_bounds))
-    xopts = []
-    for _interval_bounds in [_interval_bounds_fw, _interval_bounds_bw, _interval_bounds_lin]:
-        for _low, _up in pairwise(_interval_bounds):
-            try:
-                xopts.append(optimize.root_scalar(_opt_x, args=(t, rv_x, rv_y),
-                                                bracket=[_low-np.finfo(float).eps, _up+np.finfo(float).eps]))
-            except Exception as e:
-                continue
-    return xopts
+    """Roots of `_opt_x` for all values in the array `t` at once.
+
+    Returns the index into `t` and the position of every root that was found.
+    """
+    t = np.ravel(t).astype(float)
+    instrumentation.count("xopt.scans")
+    if len(t) == 0:
+        return np.array([], dtype=int), np.array([])
+    _low, _up = _interval_bounds(t, rv_x)
+    _idx_t = np.broadcast_to(np.arange(len(t))[:, np.newaxis], _low.shape)
+    # The log-pdf of the gamma distribution is NaN at the infinite bounds
+    with np.errstate(invalid="ignore"):
+        _roots, _converged = find_roots_bisect(_opt_x, _low, _up,
+                                               args=(t[_idx_t], rv_x, rv_y))
+    return _idx_t[_converged], _roots[_converged]
+
+def _grid_minimum(t, rv_x, rv_y):
+    """Smallest value of x+boundary_b(x, t) on `_level_grid` for every t.
+
+    Every point of the boundary is an upper bound of the minimum, so this
+    bounds the error if a bracket contains an even number of roots."""
+    _points = _level_grid(t, rv_x)
+    with np.errstate(invalid="ignore"):
+        _values = _points + boundary_b(_points, np.asarray(t)[:, np.newaxis], rv_x, rv_y)
+    return np.min(np.where(np.isnan(_values), np.inf, _values), axis=1)
+
+def _pdf_derivative(rv, x):
+    """Derivative of the pdf of the frozen distribution `rv` at `x`.
+
+    The derivative is analytic for the gamma (Nakagami-m) and exponential
+    (Rayleigh) distribution. For all other distributions, a central difference
+    is used.
+    """
+    if rv.dist.name in ("gamma", "expon"):
+        _shapes, loc, scale = frozen_parameters(rv)
+        a = _shapes[0] if _shapes else 1.
+        with np.errstate(divide="ignore", invalid="ignore"):
+            _log_deriv = np.where(a == 1, 0., (a-1)/(x-loc)) - 1./scale
+        return rv.pdf(x)*_log_deriv
+    _h = 1e-6*(1 + np.abs(x))
+    return (rv.pdf(x+_h) - rv.pdf(x-_h))/(2*_h)
+
+def _opt_x_derivative(x, t, rv_x, rv_y):
+    instrumentation.count("opt_x_derivative.evaluations", np.size(x))
+    with instrumentation.timer("scipy.opt_x_derivative"):
+        _y = _boundary_y(x, t, rv_x, rv_y)
+        _pdf_x = rv_x.pdf(x)
+        return -_pdf_derivative(rv_y, _y)*_pdf_x/rv_y.pdf(_y) - _pdf_derivative(rv_x, x)
+
+def _unique_roots(roots, tol=1e-9):
+    roots = np.sort(roots)
+    _keep = np.diff(roots, prepend=-np.inf) > tol*(1 + np.abs(roots))
+    return roots[_keep]
+
+def _track_roots(roots, t, x_max, rv_x, rv_y, xtol=2e-12,
+                 rtol=4*np.finfo(float).eps, maxiter=20):
+    """Newton steps from the roots of the previous t to the roots at `t`.
+
+    Roots for which Newton's method leaves the domain `[0, x_max]` or does
+    not converge are dropped. They are found again by `_probe_roots` if they
+    still exist.
+    """
+    roots = np.array(roots, dtype=float)
+    active = np.ones(len(roots), dtype=bool)
+    converged = np.zeros(len(roots), dtype=bool)
+    for _ in range(maxiter):
+        idx = np.flatnonzero(active)
+        if len(idx) == 0:
+            break
+        _x = roots[idx]
+        instrumentation.count("continuation.newton_steps", len(idx))
+        _step = _opt_x(_x, t, rv_x, rv_y)/_opt_x_derivative(_x, t, rv_x, rv_y)
+        _x = _x - _step
+        roots[idx] = _x
+        _valid = np.isfinite(_x) & (_x >= 0) & (_x <= x_max)
+        _done = _valid & (np.abs(_step) <= xtol + rtol*np.abs(_x))
+        converged[idx[_done]] = True
+        active[idx[_done | ~_valid]] = False
+    instrumentation.count("continuation.dropped_roots", len(roots) - np.count_nonzero(converged))
+    return _unique_roots(roots[converged])
+
+def _probe_roots(roots, t, x_max, rv_x, rv_y, num=16):
+    """Check the roots at `t` against the signs of `_opt_x` on a probe grid.
+
+    The probe grid consists of `num` linearly spaced points and the points
+    of `_level_grid`, where only `num` points are kept in the uniformly
+    spaced center of the logits, so it also resolves roots close to zero and
+    close to `x_max`. Roots that appeared in a probe interval without any
+    known root are located by bisection. Returns `None` if the known roots
+    are not consistent with the sign changes on the probe grid, e.g.,
+    because a root disappeared.
+    """
+    instrumentation.count("continuation.probes")
+    _center = np.flatnonzero(np.abs(_LEVEL_LOGITS) <= 30)
+    _keep = np.ones(len(_LEVEL_LOGITS), dtype=bool)
+    _keep[_center] = False
+    _keep[_center[::max(len(_center)//num, 1)]] = True
+    _points = np.concatenate((np.linspace(0, x_max, num)[1:-1],
+                              _level_grid(np.array([t]), rv_x)[0, _keep]))
+    _points = np.unique(_points[np.isfinite(_points) & (_points > 0) & (_points < x_max)])
+    _points = np.concatenate(([0.], _points, [x_max]))
+    _bounds = rv_y.pdf(rv_y.ppf(np.array([t, 0]))) - rv_x.pdf(np.array([0, x_max]))
+    _values = np.concatenate(([_bounds[0]], _opt_x(_points[1:-1], t, rv_x, rv_y),
+                              [_bounds[1]]))
+    _signs = np.sign(_values)
+    if np.any(_signs == 0):
+        return None
+    _counts = np.histogram(roots, _points)[0]
+    _mismatch = (_counts % 2 == 1) != (_signs[:-1] != _signs[1:])
+    if np.any(_mismatch & (_counts > 0)):
+        instrumentation.count("continuation.inconsistent_probes")
+        return None
+    if not np.any(_mismatch):
+        return roots
+    _new, _converged = find_roots_bisect(_opt_x, _points[:-1][_mismatch],
+                                         _points[1:][_mismatch], args=(t, rv_x, rv_y))
+    return np.sort(np.concatenate((roots, _new[_converged])))
+
+def _xopt_continuation(t, rv_x, rv_y):
+    """Roots of `_opt_x` for all values in `t` by tracking them along t.
+
+    The values of `t` are processed in ascending order and the roots of the
+    previous value are used as starting points for Newton steps with the
+    analytic derivative of `_opt_x`. The roots are then checked against the
+    sign changes of `_opt_x` on a coarse probe grid, which also locates roots
+    that newly appear. The full scan of `_xopt_numerical` is only used for
+    the first point and whenever a root disappears.
+
+    Pairs of roots that appear within the same probe interval are only
+    detected once they are separated by a probe point.
+    Returns the index into `t` and the position of every root that was found.
+    """
+    t = np.ravel(t).astype(float)
+    idx = []
+    roots = []
+    _roots = None
+    for _idx_t in np.argsort(t, kind="stable"):
+        _t = t[_idx_t]
+        if _t == 1:
+            _roots = _unique_roots(_xopt_numerical(_t, rv_x, rv_y)[1])
+            idx.append(np.full(len(_roots), _idx_t))
+            roots.append(_roots)
+            _roots = None
+            continue
+        _x_max = rv_x.ppf(_t)
+        if _roots is not None:
+            _roots = _probe_roots(_track_roots(_roots, _t, _x_max, rv_x, rv_y),
+                                  _t, _x_max, rv_x, rv_y)
+        if _roots is None:
+            _roots = _unique_roots(_xopt_numerical(_t, rv_x, rv_y)[1])
+            _roots = _roots[_roots <= _x_max]
+            _probed = _probe_roots(_roots, _t, _x_max, rv_x, rv_y)
+            if _probed is not None:
+                _roots = _probed
+        idx.append(np.full(len(_roots), _idx_t))
+        roots.append(_roots)
+    if not idx:
+        return np.array([], dtype=int), np.array([])
+    return np.concatenate(idx), np.concatenate(roots)
 
 def boundary_b(x, t, rv_x, rv_y):
-    return rv_y.ppf(t-rv_x.cdf(x))
+    return _boundary_y(x, t, rv_x, rv_y)
+
+@instrumentation.solver
+def zoc_copula_t_mrc_heterog(t, rv_x, rv_y, method="batch", return_branch=False):
+    """ZOC of two links with MRC and the copula with parameter t.
+
+    With `method="batch"`, the stationary points are found by scanning fixed
+    bracket grids for all values of `t` at once. With
+    `method="continuation"`, they are tracked along t instead, which only
+    needs a few function evaluations per point on dense t grids.
+
+    If `return_branch` is True, the active branch of the minimum is returned
+    as well: 0 for a stationary point of the boundary, 1 for `rv_x.ppf(t)`
+    and 2 for `rv_y.ppf(t)`.
+    """
+    _methods = {"batch": _xopt_numerical, "continuation": _xopt_continuation}
+    if method not in _methods:
+        raise ValueError("Unknown method: {} (valid methods: {})".format(
+            method, ", ".join(_methods)))
+    _find_roots = _methods[method]
+    t = np.asarray(t, dtype=float)
+    _t = t.ravel()
+    instrumentation.info(method=method, num_t=len(_t))
+    opt_s = np.full(len(_t), np.inf)
+    _nonzero = np.flatnonzero(_t != 0)
+    _idx, _roots = _find_roots(_t[_nonzero], rv_x, rv_y)
+    _idx = _nonzero[_idx]
+    with instrumentation.timer("scipy.ppf"):
+        np.fmin.at(opt_s, _idx, _roots + boundary_b(_roots, _t[_idx], rv_x, rv_y))
+        opt_s[_nonzero] = np.fmin(opt_s[_nonzero], _grid_minimum(_t[_nonzero], rv_x, rv_y))
+        _candidates = np.stack((opt_s, rv_x.ppf(_t), rv_y.ppf(_t)))
+    _min = np.min(_candidates, axis=0)
+    branch = np.argmin(_candidates, axis=0)
+    # Stationary points at the ends of the domain (e.g., the grid point
+    # closest to x=0) belong to the branches of the ends
+    for _branch in (2, 1):
+        branch[_candidates[_branch] <= _min*(1 + 1e-12)] = _branch
+    zoc = np.log2(1 + _min)
+    zoc[_t == 0] = 0.
+    if instrumentation.enabled():
+        instrumentation.count("roots", len(_roots))
+        for _name, _num in zip(("interior", "ppf_x", "ppf_y"),
+                               np.bincount(branch[_t != 0], minlength=3)):
+            instrumentation.count("branch." + _name, _num)
+    if return_branch:
+        return zoc.reshape(t.shape)[()], branch.reshape(t.shape)[()]
+    return zoc.reshape(t.shape)[()]
+
+def optimal_t_mrc_heterog(rv_x, rv_y, t_max=1., method="batch"):
+    """Copula parameter t in [0, t_max] with the largest ZOC and its ZOC.
+
+    For every x, the boundary `x + boundary_b(x, t)` increases with t on all
+    three branches of the minimum. The values of x that become feasible for
+    a larger t are greater than `rv_x.ppf(t)`, which is already an upper
+    bound of the minimum. Therefore, the ZOC is nondecreasing in t and the
+    optimum is the upper bound `t_max` (which can be an array), so only a
+    single evaluation of the ZOC is needed instead of a sweep over t.
+    """
+    t_max = np.asarray(t_max, dtype=float)
+    if np.any((t_max < 0) | (t_max > 1)):
+        raise ValueError("t_max needs to be in [0, 1]")
+    return t_max[()], zoc_copula_t_mrc_heterog(t_max, rv_x, rv_y, method=method)
+
+def zoc_copula_t_mrc_heterog_reference(t, rv_x, rv_y, num=400001, z_max=200.):
+    """Brute-force reference of `zoc_copula_t_mrc_heterog` for a scalar t.
+
+    The sum x + boundary_b(x, t) is evaluated at the quantiles of X at the
+    levels u=t*expit(z) for `num` uniformly spaced logits z in [-z_max,
+    z_max], where the tails of both X and Y are computed with the inverse
+    survival functions. It is slow but does not depend on a root search.
+    """
+    _z = np.linspace(-z_max, z_max, num)
+    _u = t/(1 + np.exp(-_z))
+    _v = t/(1 + np.exp(_z))
+    with np.errstate(invalid="ignore"):
+        _x = np.where(_z < 0, rv_x.ppf(_u), rv_x.isf((1-t) + _v))
+        _y = np.where(_z > 0, rv_y.ppf(_v), rv_y.isf((1-t) + _u))
+        _sum = _x + _y
+    opt_s = min(np.nanmin(_sum), rv_x.ppf(t), rv_y.ppf(t))
+    return np.log2(1 + opt_s)
+
+# Cases of heterogeneous Nakagami-m fading (gamma distributed SNRs) with
+# stationary points deep in the tails for t=1
+_CHECK_CASES = [(1., stats.gamma(a=5, scale=2), stats.gamma(a=5, scale=2)),
+                (1., stats.gamma(a=10, scale=.01), stats.gamma(a=10, scale=1.)),
+                (1., stats.gamma(a=10, scale=1.), stats.gamma(a=10, scale=.01)),
+                (1., stats.gamma(a=10, scale=.1), stats.gamma(a=10, scale=10.)),
+                (1., stats.gamma(a=20, scale=.05), stats.gamma(a=20, scale=5.)),
+                (.999, stats.gamma(a=10, scale=.01), stats.gamma(a=10, scale=1.)),
+                (.7, stats.gamma(a=.5, scale=2), stats.gamma(a=3, scale=1)),
+                (1., stats.expon(scale=1), stats.expon(scale=3))]
+
+def check_solvers(tol=1e-4):
+    """Compare both methods of `zoc_copula_t_mrc_heterog`,
+    `optimal_t_mrc_heterog` and `zoc_copula_t_mrc_heterog_nlinks` with the
+    brute-force reference. Returns True if all deviations are below `tol`."""
+    success = True
+    for t, rv_x, rv_y in _CHECK_CASES:
+        _reference = zoc_copula_t_mrc_heterog_reference(t, rv_x, rv_y)
+        _results = {_method: zoc_copula_t_mrc_heterog(t, rv_x, rv_y, method=_method)
+                    for _method in ("batch", "continuation")}
+        _results["optimal_t"] = optimal_t_mrc_heterog(rv_x, rv_y, t_max=t)[1]
+        _results["nlinks"] = zoc_copula_t_mrc_heterog_nlinks(t, [rv_x, rv_y])
+        _ok = all(abs(_zoc - _reference) < tol for _zoc in _results.values())
+        success = success and _ok
+        print("t={:.3f}, X: {} {}, Y: {} {}: reference={:.6f}, {} {}".format(
+            t, rv_x.dist.name, frozen_parameters(rv_x), rv_y.dist.name,
+            frozen_parameters(rv_y), _reference,
+            ", ".join("{}={:.6f}".format(*_item) for _item in _results.items()),
+            "OK" if _ok else "FAILED"))
+    return success
+
+
+def _project_slice(v, total, cap):
+    """Euclidean projection of the rows of `v` onto {u: sum(u)=total,
+    0<=u<=cap}.
+
+    The sum of `clip(v-mu, 0, cap)` is piecewise linear and decreasing in mu
+    with breakpoints at `v` and `v-cap`, so mu is found exactly by evaluating
+    it at all breakpoints and interpolating on the right segment.
+    """
+    # The projection is invariant to shifts of the rows
+    v = v - np.max(v, axis=1, keepdims=True)
+    _cap = cap[:, np.newaxis]
+    _breaks = np.sort(np.concatenate((v, v-_cap), axis=1), axis=1)
+    _sums = np.sum(np.clip(v[:, np.newaxis, :] - _breaks[:, :, np.newaxis], 0,
+                           _cap[:, :, np.newaxis]), axis=2)
+    _idx = np.clip(np.sum(_sums >= total[:, np.newaxis], axis=1)-1, 0,
+                   _breaks.shape[1]-2)[:, np.newaxis]
+    _mu_low = np.take_along_axis(_breaks, _idx, axis=1)[:, 0]
+    _mu_up = np.take_along_axis(_breaks, _idx+1, axis=1)[:, 0]
+    _sum_low = np.take_along_axis(_sums, _idx, axis=1)[:, 0]
+    _sum_up = np.take_along_axis(_sums, _idx+1, axis=1)[:, 0]
+    _slope = np.where(_sum_low > _sum_up, _sum_low - _sum_up, 1.)
+    mu = _mu_low + (_sum_low - total)*(_mu_up - _mu_low)/_slope
+    return np.clip(v - mu[:, np.newaxis], 0, _cap)
+
+def _pairwise_exchange(table, idx, max_sweeps=100):
+    """Local search on the grid of levels by exchanges between two links.
+
+    `table` contains the quantiles of all links on a common grid of levels
+    and `idx` the grid index of the level of every link. For every pair of
+    links, their levels are replaced by the best split of their sum, which
+    is found by scanning the grid. The sweeps over all pairs are repeated
+    until no exchange improves any configuration.
+    """
+    _num, _n, _num_grid = table.shape
+    _grid = np.arange(_num_grid)
+    idx = idx.copy()
+    for _ in range(max_sweeps):
+        instrumentation.count("nlinks.exchange_sweeps")
+        _improved = False
+        for _i, _j in itertools.combinations(range(_n), 2):
+            _other = (idx[:, _i] + idx[:, _j])[:, np.newaxis] - _grid
+            _values = table[:, _i, :] + np.take_along_axis(
+                table[:, _j, :], np.clip(_other, 0, _num_grid-1), axis=1)
+            _values[(_other < 0) | (_other >= _num_grid)] = np.inf
+            _best = np.argmin(_values, axis=1)
+            _current = _values[np.arange(_num), idx[:, _i]]
+            _better = _values[np.arange(_num), _best] < _current*(1 - 1e-12)
+            if np.any(_better):
+                _improved = True
+                idx[_better, _j] = _other[_better, _best[_better]]
+                idx[_better, _i] = _best[_better]
+        if not _improved:
+            break
+    return idx
+
+def _initial_levels(marginals, t, num_grid, num_random, rng):
+    """Starting points on the slice for every configuration.
+
+    The quantiles are tabulated on a grid of `num_grid` levels in [0, t]. The
+    pairwise exchange search is started from the vertex that assigns the
+    level t to the links with the smallest quantiles at t and from the
+    center of the slice. Additionally, `num_random` random points on the
+    slice are returned.
+    """
+    _n = marginals.n
+    _last = num_grid - 1
+    _grid = np.linspace(0, 1, num_grid)*t[:, np.newaxis]
+    with instrumentation.timer("scipy.ppf"):
+        _table = np.stack([marginals.ppf(_u[:, np.newaxis]) for _u in _grid.T],
+                          axis=2)
+    _order = np.argsort(np.argsort(_table[:, :, -1], axis=1), axis=1)
+    _vertex = np.where(_order < _n//2, _last, 0)
+    _vertex[_order == _n//2] = (_n % 2)*_last//2
+    _center = np.full_like(_vertex, _last//2)
+    starts = [_pairwise_exchange(_table, _start)/_last*t[:, np.newaxis]
+              for _start in (_vertex, _center)]
+    for _ in range(num_random):
+        _random = rng.uniform(size=_vertex.shape)*t[:, np.newaxis]
+        starts.append(_project_slice(_random, _n*t/2, t))
+    return np.stack(starts, axis=1)
+
+def _tail_levels(marginals, t, levels, values, num_tail=200):
+    """Exchanges between two links at levels close to the ends of their
+    range, where the levels cannot be represented by floats.
+
+    For every ordered pair (i, j) of links, whose levels sum to s on the
+    slice given the other levels in `levels`, the level of link i is set to L+d and that of link j to H-d,
+    where [L, H] is the range of levels of link i on the slice and d is
+    spaced logarithmically down to 1e-300*(H-L), first coarsely and then
+    around the best value. The quantile of link j is computed from the
+    inverse survival function at (1-H)+d, which keeps its precision for H=1.
+    Returns the improved values and levels.
+    """
+    _n = marginals.n
+    values = values.copy()
+    levels = levels.copy()
+    _exponents = np.linspace(-300, -2, num_tail)
+    with instrumentation.timer("scipy.ppf"):
+        _quantiles = marginals.ppf(levels)
+    for _i, _j in itertools.permutations(range(_n), 2):
+        _other_links = [_k for _k in range(_n) if _k not in (_i, _j)]
+        _sum = np.clip(_n*t/2 - np.sum(levels[:, _other_links], axis=1), 0, 2*t)
+        _low = np.maximum(_sum - t, 0)
+        _up = np.minimum(_sum, t)
+        _others = np.sum(_quantiles[:, _other_links], axis=1)
+        _idx = np.flatnonzero(_up > _low)
+        _grid = np.broadcast_to(_exponents, (len(_idx), num_tail))
+        for _ in range(2):
+            _delta = (_up - _low)[_idx, np.newaxis]*10.**_grid
+            _u = np.zeros((_delta.size, _n))
+            _u[:, _i] = (_low[_idx, np.newaxis] + _delta).ravel()
+            _u[:, _j] = ((1 - _up[_idx, np.newaxis]) + _delta).ravel()
+            _config = np.repeat(_idx, num_tail)
+            with instrumentation.timer("scipy.ppf"):
+                _q_i = marginals.ppf(_u, _config)[:, _i]
+                _q_j = marginals.isf(_u, _config)[:, _j]
+            _pair = (_q_i + _q_j).reshape(-1, num_tail)
+            _pair = np.where(np.isnan(_pair), np.inf, _pair)
+            _best = np.argmin(_pair, axis=1)
+            _rows = np.arange(len(_idx))
+            _better = _pair[_rows, _best] + _others[_idx] < values[_idx]
+            _k = _idx[_better]
+            _flat = (_rows*num_tail + _best)[_better]
+            values[_k] = _pair[_rows, _best][_better] + _others[_k]
+            levels[_k, _i] = _u[_flat, _i]
+            levels[_k, _j] = _sum[_k] - levels[_k, _i]
+            _quantiles[_k, _i] = _q_i[_flat]
+            _quantiles[_k, _j] = _q_j[_flat]
+            _center = np.take_along_axis(_grid, _best[:, np.newaxis], axis=1)
+            _width = _exponents[1] - _exponents[0]
+            _grid = _center + np.linspace(-_width, _width, num_tail)
+    return values, levels
+
+@instrumentation.solver
+def zoc_copula_t_mrc_heterog_nlinks(t, dists, num_grid=129, num_random=4,
+                                    seed=0, xtol=1e-10, maxiter=1000,
+                                    return_levels=False):
+    """ZOC of n heterogeneous links with MRC and the copula with parameter t.
+
+    This generalizes `zoc_copula_t_mrc_heterog` to n links. With probability
+    t, the levels U_i=F_i(X_i) are jointly mixed on the slice {sum(u)=n*t/2,
+    0<=u_i<=t} and they are comonotonic above t. The ZOC is therefore the
+    minimum of sum(F_i^{-1}(u_i)) over the slice, which is the segment
+    u_1+u_2=t for n=2.
+
+    The levels are first optimized on a grid of `num_grid` levels by
+    exchanges between pairs of links, which escapes the local minima caused
+    by the concave parts of the quantile functions. The result and
+    `num_random` random starting points are refined by a projected gradient
+    descent with backtracking. The gradient of the boundary surface is
+    1/f_i(F_i^{-1}(u_i)), so every iteration only needs one evaluation of the
+    quantile functions and densities per link. All configurations are
+    optimized simultaneously. Finally, the levels of every pair of links are
+    moved close to the ends of their range (see `_tail_levels`), where the
+    minimum can lie for t close to 1.
+
+    `dists` are the marginals of the links as accepted by `utils.Marginals`
+    and `t` is broadcast against the shape of the configurations, e.g., for
+    a sweep over t with fixed marginals. If `return_levels` is True, the
+    minimizing levels u_i are returned as well, with the links along the
+    last axis.
+    """
+    marginals = Marginals(dists)
+    marginals = marginals.broadcast_to(np.broadcast_shapes(np.shape(t), marginals.shape))
+    _n = marginals.n
+    t = np.broadcast_to(np.asarray(t, dtype=float), marginals.shape).ravel()
+    instrumentation.info(n=_n, num_configs=marginals.size)
+    _starts = _initial_levels(marginals, t, num_grid + num_grid % 2 - 1,
+                              num_random, np.random.default_rng(seed))
+    _num_starts = _starts.shape[1]
+    _idx = np.repeat(np.arange(marginals.size), _num_starts)
+    _t = t[_idx]
+    _total = _n*_t/2
+    levels = _starts.reshape(-1, _n)
 
-@np.vectorize
-def zoc_copula_t_mrc_heterog(t, rv_x, rv_y):
-    if t == 0:
-        return 0.
-    #elif t == 1:
-    #    return 1.
-    xopts = _xopt_numerical(t, rv_x, rv_y)
-    if xopts:
-        opt_s = min([xopt.root + boundary_b(xopt.root, t, rv_x, rv_y)
-                     for xopt in xopts if xopt.converged])
-    else:
-        opt_s = np.inf
-    #print(opt_s)
-    #print(np.min([opt_s, rv_x.ppf(t), rv_y.ppf(t)]))
-    return np.log2(1 + np.min([opt_s, rv_x.ppf(t), rv_y.ppf(t)]))
+    def _objective(levels, idx):
+        with instrumentation.timer("scipy.ppf"):
+            return np.sum(marginals.ppf(levels, _idx[idx]), axis=1)
 
+    def _gradient(levels, idx):
+        with np.errstate(divide="ignore", invalid="ignore"), \
+                instrumentation.timer("scipy.pdf_ppf"):
+            _pdf = marginals.pdf(marginals.ppf(levels, _idx[idx]), _idx[idx])
+            return np.minimum(1/_pdf, 1e100)
 
+    values = _objective(levels, slice(None))
+    _grad = _gradient(levels, slice(None))
+    _finite = np.where(_grad < 1e100, _grad, np.min(_grad, axis=1, keepdims=True))
+    _step = np.minimum(_t/np.maximum(np.max(_finite, axis=1) - np.min(_grad, axis=1),
+                                     1e-300), 1e100)
+    active = np.flatnonzero(_t > 0)
+    for _ in range(maxiter):
+        if len(active) == 0:
+            break
+        _levels = levels[active]
+        instrumentation.count("nlinks.gradient_steps", len(active))
+        _candidate = _project_slice(_levels - _step[active, np.newaxis]*_grad[active],
+                                    _total[active], _t[active])
+        _direction = _candidate - _levels
+        _values = _objective(_candidate, active)
+        _accept = (_values <= values[active] + 1e-4*np.sum(_grad[active]*_direction, axis=1))
+        _moved = np.max(np.abs(_direction), axis=1)
+        _acc = active[_accept]
+        instrumentation.count("nlinks.rejected_steps", len(active) - len(_acc))
+        levels[_acc] = _candidate[_accept]
+        values[_acc] = _values[_accept]
+        _grad[_acc] = _gradient(levels[_acc], _acc)
+        _step[active] = np.where(_accept, np.minimum(2*_step[active], 1e100),
+                                 _step[active]/2)
+        _done = _moved <= xtol*_t[active]
+        active = active[~_done]
+    values = values.reshape(-1, _num_starts)
+    _best = np.argmin(values, axis=1)
+    levels = levels.reshape(-1, _num_starts, _n)[np.arange(len(values)), _best]
+    values, levels = _tail_levels(marginals, t, levels,
+                                  values[np.arange(len(values)), _best])
+    zoc = np.log2(1 + values)
+    zoc[t == 0] = 0.
+    zoc = zoc.reshape(marginals.shape)[()]
+    if return_levels:
+        return zoc, levels.reshape(*marginals.shape, _n)
+    return zoc
 
 
 #### MAIN FUNCTIONS
@@ -121,6 +631,7 @@ def main(snr_db=10., m=5, plot=False, export=False):
                         "zocNakaIn": zoc_mrc_in_naka},
                         "zoc-MRC-snr{}.dat".format(snr_db))
     if plot:
+        import matplotlib.pyplot as plt
         fig, axs = plt.subplots()
         axs.plot(n, zoc_mrc_in_exp, 'r^-', label="Inner Bound -- Rayleigh Fading")
         axs.plot(n, zoc_mrc_out_exp_jm, 'ro-', label="Outer Bound (JM) -- Rayleigh Fading")
@@ -137,15 +648,21 @@ def main(snr_db=10., m=5, plot=False, export=False):
 
 if __name__ == "__main__":
     import argparse
-    import matplotlib.pyplot as plt
     parser = argparse.ArgumentParser()
     parser.add_argument("--plot", action="store_true")
     parser.add_argument("--export", action="store_true")
     parser.add_argument("-s", "--snr_db", type=float, default=10)
     parser.add_argument("-m", type=int, default=5)
+    parser.add_argument("--check", action="store_true",
+                        help="Compare the solvers with a brute-force reference")
     args = vars(parser.parse_args())
+    if args.pop("check"):
+        if not check_solvers():
+            raise SystemExit(1)
     main(**args)
-    plt.show()
+    if args["plot"]:
+        import matplotlib.pyplot as plt
+        plt.show()
     #rv2 = stats.lognorm(2)
     #print(max_zoc_sc_heterog([rv1.ppf, rv2.ppf]))
     #print(2**max_zoc_sc_heterog([stats.expon(scale=1).ppf,
@@ -0,0 +1,166 @@
+"""Monte Carlo validation of the ZOC
+
+This module contains a Monte Carlo simulation of the outage probability for
+dependent fading links, which is used to validate the analytical ZOC values
+for MRC and SC. The samples are drawn from joint distributions constructed
+with the copulas in `copulas.py`.
+
+
+Copyright (C) 2021 Karl-Ludwig Besser
+
+This program is used in the article:
+Karl-Ludwig Besser, Pin-Hsun Lin, and Eduard Jorswieck, "On Fading Channel
+Dependency Structures with a Positive Zero-Outage Capacity", IEEE Transactions
+on Communications, vol. 69, no. 10, pp. 6561-6574, Oct 2021.
+
+License:
+This program is licensed under the GPLv3 license. If you in any way use this
+code for research that results in publications, please cite our original
+article listed above.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+PARTICULAR PURPOSE.
+See the GNU General Public License for more details.
+
+Author: Karl-Ludwig Besser, Technische Universität Braunschweig
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import os
+
+import numpy as np
+from scipy import stats
+
+from copulas import (copula_sample_chunks, split_sample_range, seed_sequence,
+                     BLOCK_SIZE, inv_copula_clayton_dv, inv_zoc_copula1_dv,
+                     inv_zoc_copula2_dv)
+
+COPULAS = {"clayton": inv_copula_clayton_dv,
+           "zoc1": inv_zoc_copula1_dv,
+           "zoc2": inv_zoc_copula2_dv,
+          }
+
+def _count_outages(rates, rv_x, rv_y, copula, param, seed_seq, start, num,
+                   chunk_size):
+    """Partial outage counts of MRC and SC for samples start..start+num."""
+    counts = np.zeros((2, len(rates)), dtype=np.int64)
+    min_capac = np.full(2, np.inf)
+    _samples = copula_sample_chunks(num, COPULAS[copula], rv_x, rv_y, param,
+                                    seed=seed_seq, chunk_size=chunk_size,
+                                    start=start)
+    for _x, _y in _samples:
+        for _idx, _gain in enumerate((_x + _y, np.maximum(_x, _y))):
+            _capac = np.sort(np.log2(1 + _gain))
+            counts[_idx] += np.searchsorted(_capac, rates, side="left")
+            min_capac[_idx] = min(min_capac[_idx], _capac[0])
+    return counts, min_capac
+
+def _wilson_half_width(counts, num, confidence):
+    _z = stats.norm.ppf(1-(1-confidence)/2)
+    _p = counts/num
+    return _z/(1+_z**2/num)*np.sqrt(_p*(1-_p)/num + _z**2/(4*num**2))
+
+def outage_probability(rates, rv_x, rv_y, copula="zoc2", param=.5,
+                       max_samples=10**8, round_samples=2**22, tol=1e-4,
+                       confidence=.95, seed=None, workers=None,
+                       chunk_size=2**20):
+    """Monte Carlo estimate of the outage probabilities of MRC and SC.
+
+    The outage probability is the probability that the rate `log2(1+X+Y)`
+    (MRC) or `log2(1+max(X, Y))` (SC) is less than the values in `rates`.
+    The joint distribution of X and Y is constructed from the marginals
+    `rv_x`, `rv_y` and the copula `copula` (see `COPULAS`) with parameter
+    `param`.
+
+    The samples are drawn in rounds of `round_samples`, which are split over
+    `workers` processes. The simulation stops once the half-width of the
+    Wilson confidence interval of all estimates is at most `tol`, or after
+    `max_samples`. The results only depend on `seed`, `round_samples` and
+    `max_samples`, but not on the number of workers.
+
+    Returns a dict with the outage probabilities `outMRC` and `outSC`, the
+    half-widths of their confidence intervals `ciMRC` and `ciSC`, the
+    smallest sampled rates `minMRC` and `minSC`, which estimate the ZOC, and
+    the number of samples `num`.
+    """
+    if not max_samples > 0:
+        raise ValueError("max_samples needs to be positive")
+    rates = np.atleast_1d(rates).astype(float)
+    seed_seq = seed_sequence(seed)
+    workers = workers or os.cpu_count()
+    round_samples = max(BLOCK_SIZE, round_samples//BLOCK_SIZE*BLOCK_SIZE)
+    counts = np.zeros((2, len(rates)), dtype=np.int64)
+    min_capac = np.full(2, np.inf)
+    num = 0
+    _executor = ProcessPoolExecutor(workers) if workers > 1 else None
+    try:
+        while num < max_samples:
+            _round = min(round_samples, max_samples-num)
+            _tasks = [(rates, rv_x, rv_y, copula, param, seed_seq, num+_start,
+                       _num, chunk_size)
+                      for _start, _num in split_sample_range(_round, workers)]
+            if _executor is None:
+                _results = [_count_outages(*_task) for _task in _tasks]
+            else:
+                _results = _executor.map(_count_outages, *zip(*_tasks))
+            for _counts, _min_capac in _results:
+                counts += _counts
+                min_capac = np.minimum(min_capac, _min_capac)
+            num += _round
+            ci = _wilson_half_width(counts, num, confidence)
+            if np.max(ci) <= tol:
+                break
+    finally:
+        if _executor is not None:
+            _executor.shutdown()
+    return {"outMRC": counts[0]/num, "outSC": counts[1]/num,
+            "ciMRC": ci[0], "ciSC": ci[1],
+            "minMRC": min_capac[0], "minSC": min_capac[1], "num": num}
+
+
+def main(m=5, snr_x_db=0., snr_y_db=0., t=.5, samples=10**7, tol=1e-4,
+         workers=None, seed=None, export=False):
+    from maximum_ratio_combining import zoc_copula_t_mrc_heterog
+    from selection_combining import max_zoc_sc_heterog
+    from utils import export_results
+    snr_x = 10**(snr_x_db/10.)
+    snr_y = 10**(snr_y_db/10.)
+    rv_x = stats.gamma(a=m, scale=snr_x/m)
+    rv_y = stats.gamma(a=m, scale=snr_y/m)
+    zoc = {"MRC": zoc_copula_t_mrc_heterog(t, rv_x, rv_y),
+           "SC": max_zoc_sc_heterog([rv_x.ppf, rv_y.ppf])}
+    # The copula with parameter t achieves the MRC ZOC, the countermonotonic
+    # copula (t=1) achieves the maximum SC ZOC
+    params = {"MRC": t, "SC": 1.}
+    results = {}
+    for _comb in ("MRC", "SC"):
+        rates = np.linspace(0, 1.5*zoc[_comb], 50)
+        _results = outage_probability(rates, rv_x, rv_y, copula="zoc2",
+                                      param=params[_comb], max_samples=samples,
+                                      tol=tol, seed=seed, workers=workers)
+        print("{}: ZOC = {:.4f}, smallest simulated rate = {:.4f} ({:d} samples)".format(
+            _comb, zoc[_comb], _results["min"+_comb], _results["num"]))
+        results[_comb] = _results
+        if export:
+            export_results({"rate": rates, "out": _results["out"+_comb],
+                            "ci": _results["ci"+_comb]},
+                           "mc-outage-{}-naka{}-snrx{}-snry{}-t{}.dat".format(
+                               _comb, m, snr_x_db, snr_y_db, params[_comb]))
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--export", action="store_true")
+    parser.add_argument("-x", "--snr_x_db", type=float, default=0)
+    parser.add_argument("-y", "--snr_y_db", type=float, default=0)
+    parser.add_argument("-m", type=float, default=5)
+    parser.add_argument("-t", type=float, default=.5)
+    parser.add_argument("-n", "--samples", type=int, default=10**7)
+    parser.add_argument("--tol", type=float, default=1e-4)
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--seed", type=int)
+    args = vars(parser.parse_args())
+    main(**args)
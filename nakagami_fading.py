@@ -28,20 +28,65 @@ import numpy as np
 from scipy import stats
 
 from maximum_ratio_combining import (zoc_copula_t_mrc_heterog,
-        max_zoc_inner_bound_mrc_homog, max_zoc_outer_bound_joint_mix_mrc_homog,
-        max_zoc_outer_bound_mrc_homog)
-from utils import export_results
+        optimal_t_mrc_heterog, max_zoc_inner_bound_mrc_homog, max_zoc_outer_bound_joint_mix_mrc_homog,
+        max_zoc_outer_bound_mrc_homog, SOLVER_VERSION)
+from utils import export_results, adaptive_grid
+from cache import cached
+from rayleigh_fading import optimal_t_rayleigh
+
+def optimal_t_nakagami(m, snr_x_db, snr_y_db, t_max=1., method="batch"):
+    """Copula parameter t in [0, t_max] with the largest ZOC with MRC and its
+    ZOC for Nakagami-m fading for all broadcast values of the arguments.
+
+    The normalized SNR 2**ZOC-1 divided by SNR_x only depends on m, the ratio
+    SNR_y/SNR_x and t. Therefore, the solver is only called once for every
+    unique pair of m and SNR ratio. For m=1, the closed form of Rayleigh
+    fading is used for all pairs at once.
+    """
+    m, snr_x_db, snr_y_db, t_max = np.broadcast_arrays(
+        np.asarray(m), *[np.asarray(_arg, dtype=float) for _arg in (snr_x_db, snr_y_db, t_max)])
+    _ratio_db = (snr_y_db - snr_x_db).ravel()
+    _m = m.ravel()
+    _t = t_max.ravel()
+    normalized = np.empty(len(_t))
+    _rayleigh = _m == 1
+    normalized[_rayleigh] = 2**optimal_t_rayleigh(1., 10**(-_ratio_db[_rayleigh]/10.),
+                                                  _t[_rayleigh])[1] - 1
+    _others = np.flatnonzero(~_rayleigh)
+    _pairs, _inverse = np.unique(np.stack((_m[_others], _ratio_db[_others]), axis=-1),
+                                 axis=0, return_inverse=True)
+    for _idx, (_m_pair, _ratio_pair) in enumerate(_pairs):
+        _selected = _others[np.ravel(_inverse) == _idx]
+        _t_unique, _t_inverse = np.unique(_t[_selected], return_inverse=True)
+        rv_x = stats.gamma(a=_m_pair, scale=1./_m_pair)
+        rv_y = stats.gamma(a=_m_pair, scale=10**(_ratio_pair/10.)/_m_pair)
+        _zoc = optimal_t_mrc_heterog(rv_x, rv_y, _t_unique, method=method)[1]
+        normalized[_selected] = (2**np.atleast_1d(_zoc) - 1)[np.ravel(_t_inverse)]
+    zoc = np.log2(1 + 10**(snr_x_db/10.)*normalized.reshape(m.shape))
+    return t_max.copy()[()], zoc[()]
+
+def zoc_copula_t_mrc_heterog_adaptive(rv_x, rv_y, tol):
+    """ZOC with MRC on an adaptive grid of t with the accuracy `tol` (see
+    `utils.adaptive_grid`). Returns the grid, the ZOC and the branches."""
+    return adaptive_grid(
+        lambda t: zoc_copula_t_mrc_heterog(t, rv_x, rv_y, return_branch=True), tol=tol)
 
 def main_two_links(m=5, snr_x_db=10., snr_y_db=10., plot=False, export=False,
-                   **kwargs):
+                   tol=None, **kwargs):
     snr_x = 10**(snr_x_db/10.)
     snr_y = 10**(snr_y_db/10.)
-    t = np.linspace(0, 1, 150)
     rv_x = stats.gamma(a=m, scale=snr_x/m)
     rv_y = stats.gamma(a=m, scale=snr_y/m)
-    zoc_mrc = zoc_copula_t_mrc_heterog(t, rv_x, rv_y)
+    if tol is None:
+        t = np.linspace(0, 1, 150)
+        zoc_mrc = cached(zoc_copula_t_mrc_heterog, version=SOLVER_VERSION)(t, rv_x, rv_y)
+    else:
+        t, zoc_mrc, _branch = cached(zoc_copula_t_mrc_heterog_adaptive,
+                                     version=SOLVER_VERSION)(rv_x, rv_y, tol)
     if plot:
-        plt.plot(t, zoc_mrc, 'o-')
+        import matplotlib.pyplot as plt
+        fig, axs = plt.subplots()
+        axs.plot(t, zoc_mrc, 'o-')
     if export:
         export_results({"t": t, "capac": zoc_mrc},
                        "zoc-x_naka{0}-y_naka{0}-snrx{1}-snry{2}.dat".format(m, snr_x_db, snr_y_db))
@@ -54,6 +99,7 @@ def main_n_links(m=5, snr_x_db=0., plot=False, export=False, **kwargs):
     zoc_outer_w = max_zoc_outer_bound_mrc_homog(rv.ppf, n)
     zoc_outer_jm = max_zoc_outer_bound_joint_mix_mrc_homog(rv.mean(), n)
     if plot:
+        import matplotlib.pyplot as plt
         fig, axs = plt.subplots()
         axs.plot(n, zoc_inner, label="Inner Bound")
         axs.plot(n, zoc_outer_jm, label="Outer Bound JM")
@@ -67,7 +113,6 @@ def main_n_links(m=5, snr_x_db=0., plot=False, export=False, **kwargs):
 
 if __name__ == "__main__":
     import argparse
-    import matplotlib.pyplot as plt
     parser = argparse.ArgumentParser()
     parser.add_argument("--plot", action="store_true")
     parser.add_argument("--export", action="store_true")
@@ -75,10 +120,13 @@ if __name__ == "__main__":
     parser.add_argument("-y", "--snr_y_db", type=float, default=0)
     parser.add_argument("-m", type=int, default=5)
     parser.add_argument("--n-links", action="store_true")
+    parser.add_argument("--tol", type=float, help="Use an adaptive t grid with this accuracy")
     args = vars(parser.parse_args())
     n_links = args.pop("n_links")
     if n_links:
         main_n_links(**args)
     else:
         main_two_links(**args)
-    plt.show()
+    if args["plot"]:
+        import matplotlib.pyplot as plt
+        plt.show()
@@ -0,0 +1,274 @@
+"""Incremental Result Pipeline
+
+This module contains the job graph of the results (data files and figures)
+and rebuilds only the outputs that are out of date. Every job runs one command
+of `zoc.py` and its stamp is a hash of the command arguments and of the source
+files of all local modules that the job imports (directly or indirectly). A
+job is rebuilt, if one of its outputs is missing, its stamp changed, or one of
+the jobs it depends on is rebuilt. Independent jobs run in parallel.
+
+Example:
+    python3 pipeline.py --plot
+    python3 pipeline.py --dry-run mrc sc
+
+
+Copyright (C) 2021 Karl-Ludwig Besser
+
+This program is used in the article:
+Karl-Ludwig Besser, Pin-Hsun Lin, and Eduard Jorswieck, "On Fading Channel
+Dependency Structures with a Positive Zero-Outage Capacity", IEEE Transactions
+on Communications, vol. 69, no. 10, pp. 6561-6574, Oct 2021.
+
+License:
+This program is licensed under the GPLv3 license. If you in any way use this
+code for research that results in publications, please cite our original
+article listed above.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+PARTICULAR PURPOSE.
+See the GNU General Public License for more details.
+
+Author: Karl-Ludwig Besser, Technische Universität Braunschweig
+"""
+
+import ast
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import hashlib
+import json
+import os
+import sys
+
+SOURCE_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+STAMP_DIRECTORY = ".pipeline"
+
+# Job graph of the results presented in the paper. Every job runs the
+# `command` of `zoc.py`, which calls the main function of `module`, and
+# creates the data files `outputs` and, with plotting, the images `figures`.
+JOBS = {
+    "boundary": {"command": ["boundary", "-x", "8", "-y", "0"],
+                 "module": "boundary",
+                 "outputs": ["boundary-example.dat"],
+                 "figures": ["results-boundary-example.png"],
+                 "depends": []},
+    "rayleigh": {"command": ["rayleigh", "-x", "0", "5", "0", "-5", "-5",
+                             "-y", "0", "5", "5", "5", "10"],
+                 "module": "rayleigh_fading",
+                 "outputs": ["zoc-rayleigh-copula-t.dat",
+                             "grid-zero-out-snr-t0.5.dat"],
+                 "figures": ["results-zoc-rayleigh-copula-t.png",
+                             "results-zoc-grid-rayleigh-copula-t0.5.png"],
+                 "depends": []},
+    "mrc": {"command": ["mrc", "-s", "0", "-m", "5"],
+            "module": "maximum_ratio_combining",
+            "outputs": ["zoc-MRC-snr0.0.dat"],
+            "figures": ["results-mrc-snr0.0.png"],
+            "depends": []},
+    "sc": {"command": ["sc", "-s", "10", "-m", "2", "5", "10"],
+           "module": "selection_combining",
+           "outputs": ["zoc-SC-snr10.0-naka.dat",
+                       "zoc-sc-rayleigh-naka10-snr10.0.dat"],
+           "figures": ["results-sc-snr10.0.png"],
+           "depends": []},
+    }
+
+def local_dependencies(module, root=SOURCE_DIRECTORY):
+    """Names of the local modules in `root` that `module` imports, including
+    `module` itself and all modules that are imported indirectly."""
+    modules = set()
+    _pending = [module]
+    while _pending:
+        _name = _pending.pop()
+        _filename = os.path.join(root, "{}.py".format(_name))
+        if _name in modules or not os.path.isfile(_filename):
+            continue
+        modules.add(_name)
+        with open(_filename) as _file:
+            _tree = ast.parse(_file.read(), filename=_filename)
+        for _node in ast.walk(_tree):
+            if isinstance(_node, ast.Import):
+                _pending.extend(_alias.name.split(".")[0] for _alias in _node.names)
+            elif isinstance(_node, ast.ImportFrom) and _node.level == 0:
+                _pending.append(_node.module.split(".")[0])
+    return sorted(modules)
+
+def _file_hash(filename):
+    with open(filename, "rb") as _file:
+        return hashlib.sha256(_file.read()).hexdigest()
+
+def job_key(job, root=SOURCE_DIRECTORY):
+    """Stamp of `job` from its command and the source of its modules."""
+    _modules = local_dependencies(job["module"], root) + local_dependencies("zoc", root)
+    _sources = {_name: _file_hash(os.path.join(root, "{}.py".format(_name)))
+                for _name in sorted(set(_modules))}
+    _repr = json.dumps({"command": job["command"], "sources": _sources},
+                       sort_keys=True)
+    return hashlib.sha256(_repr.encode()).hexdigest()
+
+def _stamp_filename(directory, name):
+    return os.path.join(directory, STAMP_DIRECTORY, "{}.json".format(name))
+
+def _read_stamp(directory, name):
+    try:
+        with open(_stamp_filename(directory, name)) as _file:
+            return json.load(_file)
+    except (OSError, ValueError):
+        return None
+
+def _write_stamp(directory, name, key, plot):
+    _filename = _stamp_filename(directory, name)
+    os.makedirs(os.path.dirname(_filename), exist_ok=True)
+    _tmp = "{}.tmp{}".format(_filename, os.getpid())
+    with open(_tmp, "w") as _file:
+        json.dump({"key": key, "plot": plot}, _file)
+    os.replace(_tmp, _filename)
+
+def _job_outputs(job, plot):
+    return job["outputs"] + (job["figures"] if plot else [])
+
+def _ordered_jobs(names, jobs):
+    """`names` and all jobs they depend on in a topological order."""
+    ordered = []
+    _visiting = set()
+    def _visit(name):
+        if name in ordered:
+            return
+        if name not in jobs:
+            raise ValueError("Unknown job: {}".format(name))
+        if name in _visiting:
+            raise ValueError("The job graph contains a cycle at {}".format(name))
+        _visiting.add(name)
+        for _dependency in jobs[name]["depends"]:
+            _visit(_dependency)
+        ordered.append(name)
+    for _name in names:
+        _visit(_name)
+    return ordered
+
+def stale_jobs(directory=".", names=None, plot=False, force=False, jobs=JOBS):
+    """Dict of the jobs that need to be rebuilt with their stamp and the
+    reason, in the order in which they can be run."""
+    stale = {}
+    for _name in _ordered_jobs(list(jobs) if names is None else names, jobs):
+        _job = jobs[_name]
+        _key = job_key(_job)
+        _stamp = _read_stamp(directory, _name)
+        _missing = [_output for _output in _job_outputs(_job, plot)
+                    if not os.path.exists(os.path.join(directory, _output))]
+        _rebuilt = [_dependency for _dependency in _job["depends"]
+                    if _dependency in stale]
+        if force:
+            _reason = "forced"
+        elif _stamp is None:
+            _reason = "never built"
+        elif _stamp["key"] != _key:
+            _reason = "parameters or source changed"
+        elif plot and not _stamp["plot"]:
+            _reason = "figures were not created"
+        elif _missing:
+            _reason = "missing {}".format(", ".join(_missing))
+        elif _rebuilt:
+            _reason = "{} is rebuilt".format(", ".join(_rebuilt))
+        else:
+            continue
+        stale[_name] = (_key, _reason)
+    return stale
+
+def _run_job(command, directory, plot):
+    """Run the command of a job in a worker process."""
+    if plot:
+        os.environ.setdefault("MPLBACKEND", "Agg")
+    if SOURCE_DIRECTORY not in sys.path:
+        sys.path.insert(0, SOURCE_DIRECTORY)
+    import zoc
+    os.chdir(directory)
+    _run, _args = zoc.parse_command(command)
+    try:
+        _run(_args, plot=plot, export=True)
+    finally:
+        if "matplotlib.pyplot" in sys.modules:
+            sys.modules["matplotlib.pyplot"].close("all")
+
+def run_pipeline(directory=".", names=None, plot=False, force=False,
+                 workers=None, dry_run=False, verbose=False, jobs=JOBS):
+    """Rebuild the stale outputs of the jobs `names` (default: all jobs) in
+    `directory`.
+
+    The jobs are run in parallel in `workers` processes (default: number of
+    CPUs) as soon as the jobs they depend on are finished. With `plot`, the
+    figures are created as well. Jobs that fail are reported and the jobs
+    that depend on them are skipped. Returns the lists of the finished and of
+    the failed jobs.
+    """
+    directory = os.path.abspath(directory)
+    stale = stale_jobs(directory, names, plot=plot, force=force, jobs=jobs)
+    if verbose:
+        print("{:d} job(s) to run".format(len(stale)))
+        for _name, (_key, _reason) in stale.items():
+            print("  {}: {}".format(_name, _reason))
+    if dry_run or not stale:
+        return [], []
+    finished = []
+    failed = []
+    _waiting = list(stale)
+    _running = {}
+    with ProcessPoolExecutor(workers) as executor:
+        while _waiting or _running:
+            for _name in list(_waiting):
+                _depends = [_dependency for _dependency in jobs[_name]["depends"]
+                            if _dependency in stale]
+                if any(_dependency in failed for _dependency in _depends):
+                    _waiting.remove(_name)
+                    failed.append(_name)
+                    if verbose:
+                        print("Skipped {}: a dependency failed".format(_name))
+                elif all(_dependency in finished for _dependency in _depends):
+                    _waiting.remove(_name)
+                    _future = executor.submit(_run_job, jobs[_name]["command"],
+                                              directory, plot)
+                    _running[_future] = _name
+            if not _running:
+                break
+            _done, _pending = wait(_running, return_when=FIRST_COMPLETED)
+            for _future in _done:
+                _name = _running.pop(_future)
+                _missing = []
+                try:
+                    _future.result()
+                    _missing = [_output for _output in _job_outputs(jobs[_name], plot)
+                                if not os.path.exists(os.path.join(directory, _output))]
+                    if _missing:
+                        raise RuntimeError("The job did not create {}".format(
+                            ", ".join(_missing)))
+                except Exception as _error:
+                    failed.append(_name)
+                    if verbose:
+                        print("Failed {}: {}".format(_name, _error))
+                    continue
+                _write_stamp(directory, _name, stale[_name][0], plot)
+                finished.append(_name)
+                if verbose:
+                    print("Finished {}".format(_name))
+    return finished, failed
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("jobs", nargs="*",
+                        help="Jobs to build (default: all): {}".format(", ".join(JOBS)))
+    parser.add_argument("-C", "--directory", default=".")
+    parser.add_argument("--plot", action="store_true")
+    parser.add_argument("--force", action="store_true")
+    parser.add_argument("-j", "--workers", type=int)
+    parser.add_argument("-n", "--dry-run", action="store_true")
+    args = parser.parse_args()
+    try:
+        finished, failed = run_pipeline(args.directory, args.jobs or None,
+                                        plot=args.plot, force=args.force,
+                                        workers=args.workers,
+                                        dry_run=args.dry_run, verbose=True)
+    except ValueError as _error:
+        parser.error(str(_error))
+    if failed:
+        sys.exit(1)
@@ -24,27 +24,116 @@ See the GNU General Public License for more details.
 Author: Karl-Ludwig Besser, Technische Universität Braunschweig
 """
 
+import contextlib
+import tempfile
+
 import numpy as np
-from scipy import stats
-from scipy import integrate
 
-from utils import export_results
+from utils import adaptive_grid, export_results
+from result_store import ResultStore
 
 
-def zoc_copula_t_mrc_heterog_rayleigh(t, lam_x, lam_y):
-    _xstar = _xopt(t, lam_x, lam_y)
+def zoc_copula_t_mrc_heterog_rayleigh(t, lam_x, lam_y, return_branch=False):
+    _xstar, _branch = _xopt(t, lam_x, lam_y, return_branch=True)
     _opt_s = _xstar + _boundary_b(_xstar, t, lam_x, lam_y)
+    if return_branch:
+        return np.log2(1+_opt_s), _branch
     return np.log2(1+_opt_s)
 
+def optimal_t_rayleigh(lam_x, lam_y, t_max=1.):
+    """Copula parameter t in [0, t_max] with the largest ZOC for Rayleigh
+    fading and its ZOC for all broadcast values of the arguments.
+
+    The ZOC is nondecreasing in t on all branches of `_xopt` (see
+    `maximum_ratio_combining.optimal_t_mrc_heterog`), including the switches
+    at t=1-lam_y/lam_x and t=1-lam_x/lam_y, so the optimum is `t_max`.
+    """
+    t, lam_x, lam_y = np.broadcast_arrays(*[np.asarray(_arg, dtype=float)
+                                            for _arg in (t_max, lam_x, lam_y)])
+    if np.any((t < 0) | (t > 1)):
+        raise ValueError("t_max needs to be in [0, 1]")
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return t.copy()[()], zoc_copula_t_mrc_heterog_rayleigh(t, lam_x, lam_y)[()]
+
+def zoc_copula_t_mrc_heterog_rayleigh_batch(t, lam_x, lam_y, alpha_x=1, alpha_y=1,
+                                            dtype=np.float64, out=None,
+                                            filename=None, chunk_size=2**20):
+    """ZOC for Rayleigh fading over the broadcast of all arguments.
+
+    The inverse SNRs of the links are `lam_x/alpha_x` and `lam_y/alpha_y`.
+    The closed form is evaluated in blocks of at most `chunk_size` elements
+    (at least one row along the last axis) with the precision `dtype`
+    (float32 or float64), so that the memory only depends on the size of the
+    output. The results are written into `out`, which needs to have the
+    broadcast shape and can be, e.g., a memory map. With `filename`, `out` is
+    created as memory map of a `.npy` file, so that sweeps that do not fit
+    into memory are streamed to the disk.
+    """
+    _args = [np.asarray(_arg) for _arg in (t, lam_x, lam_y, alpha_x, alpha_y)]
+    shape = np.broadcast_shapes(*[np.shape(_arg) for _arg in _args])
+    if out is None:
+        if filename is not None:
+            out = np.lib.format.open_memmap(filename, mode="w+", dtype=dtype,
+                                            shape=shape)
+        else:
+            out = np.empty(shape, dtype=dtype)
+    elif np.shape(out) != shape:
+        raise ValueError("out needs to have the shape {}".format(shape))
+    dtype = out.dtype
+    if dtype not in (np.float32, np.float64):
+        raise ValueError("Unsupported dtype: {}".format(dtype))
+    _args = [np.broadcast_to(_arg, shape) for _arg in _args]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for _block in _chunk_blocks(shape, chunk_size):
+            _t, _lam_x, _lam_y, _alpha_x, _alpha_y = [
+                np.asarray(_arg[_block], dtype=dtype) for _arg in _args]
+            out[_block] = zoc_copula_t_mrc_heterog_rayleigh(
+                _t, _lam_x/_alpha_x, _lam_y/_alpha_y)
+    if isinstance(out, np.memmap):
+        out.flush()
+    return out
+
+def _chunk_blocks(shape, chunk_size):
+    """Index tuples of consecutive blocks of an array with shape `shape`,
+    which have at most `chunk_size` elements or a single row along the last
+    axis."""
+    _inner = 1
+    _axis = len(shape)
+    while _axis > 0 and _inner*shape[_axis-1] <= chunk_size:
+        _inner *= shape[_axis-1]
+        _axis -= 1
+    if _axis == 0:
+        yield ()
+        return
+    _step = max(chunk_size//_inner, 1)
+    for _outer in np.ndindex(*shape[:_axis-1]):
+        for _start in range(0, shape[_axis-1], _step):
+            yield _outer + (slice(_start, _start+_step),)
+
 def _boundary_b(x, t, lam_x, lam_y):
     return -np.log(2-t-np.exp(-lam_x*x))/lam_y
 
-def _xopt(t, lam_x, lam_y):
-    rv_x = stats.expon(scale=1/lam_x)
-    inv_cdf_x = rv_x.ppf(t)
+def _expon_ppf(t, lam):
+    """Quantile function of the exponential distribution with rate `lam`."""
+    with np.errstate(divide="ignore"):
+        return -np.log1p(-t)*(1/lam)
+
+def _xopt(t, lam_x, lam_y, return_branch=False):
+    """Minimizer x of `x + _boundary_b(x, t)`.
+
+    If `return_branch` is True, the active branch is returned as well with
+    the codes of `maximum_ratio_combining.zoc_copula_t_mrc_heterog`: 0 for
+    the stationary point, 1 for the inverse CDF of X, and 2 if the optimum
+    is at zero, where the sum is the inverse CDF of Y.
+    """
+    inv_cdf_x = _expon_ppf(t, lam_x)
     _part2 = -np.log(((2-t)*lam_y)/(lam_x+lam_y))/lam_x
     _min = np.minimum(inv_cdf_x, _part2)
-    return np.maximum(_min, 0)
+    xopt = np.maximum(_min, 0)
+    if return_branch:
+        branch = np.where(_min < 0, 2, np.where(inv_cdf_x < _part2, 1, 0))
+        return xopt, branch
+    return xopt
 
 #def expected_zoc_uniform(t_min, t_max, lam_x, lam_y):
 #    integral = integrate.quad(zero_outage_capacity, t_min, t_max,
@@ -65,34 +154,66 @@ def export_loose_bound(snr_db):
     filename = "rayleigh-max-zoc-loose-snr{}.dat".format(snr_db)
     export_results(results, filename)
 
-def zero_outage_snr_grid(t=.5, alpha_x=1, alpha_y=1, export=True):
+def zero_outage_snr_grid(t=.5, alpha_x=1, alpha_y=1, export=True,
+                         directory=None):
+    """ZOC on a grid of SNR values of both links.
+
+    `t` can also be an array, for which the ZOC is returned with the shape of
+    `t` followed by the shape of the grid. If `directory` is given (only for
+    a scalar `t`), the results are stored in a `result_store.ResultStore`
+    in this directory. With `export`, the tab-separated `.dat` file of every
+    value of `t` is exported from the store (a temporary one without
+    `directory`).
+    """
     snr_db = np.linspace(-10, 10, 50)
     SNR_X_DB, SNR_Y_DB = np.meshgrid(snr_db, snr_db)
     SNR_X = 10**(SNR_X_DB/10.)
     SNR_Y = 10**(SNR_Y_DB/10.)
-    LX = 1/(SNR_X*alpha_x)
-    LY = 1/(SNR_Y*alpha_y)
-    capac = zoc_copula_t_mrc_heterog_rayleigh(t, LX, LY)
-    if export:
-        filename = "grid-zero-out-snr-t{}.dat".format(t)
-        results = {"snrx": SNR_X_DB.ravel(), "snry": SNR_Y_DB.ravel(),
-                   "capac": capac.ravel()}
-        export_results(results, filename)
+    _t = np.asarray(t, dtype=float)
+    if directory is not None and _t.ndim > 0:
+        raise ValueError("A directory can only be given for a scalar t")
+    capac = zoc_copula_t_mrc_heterog_rayleigh_batch(
+        _t[..., np.newaxis, np.newaxis], 1/SNR_X, 1/SNR_Y, alpha_x, alpha_y)
+    if directory is None and not export:
+        return SNR_X_DB, SNR_Y_DB, capac
+    for _t_value, _capac in zip(np.ravel(t), capac.reshape(-1, *SNR_X.shape)):
+        with contextlib.ExitStack() as _stack:
+            _directory = directory
+            if _directory is None:
+                # Only the .dat file is kept
+                _directory = _stack.enter_context(tempfile.TemporaryDirectory())
+            store = ResultStore(_directory, mode="w", attrs={
+                "t": float(_t_value), "alpha_x": alpha_x, "alpha_y": alpha_y})
+            store.append({"snrx": SNR_X_DB.ravel(), "snry": SNR_Y_DB.ravel(),
+                          "capac": _capac.ravel()})
+            if export:
+                filename = "grid-zero-out-snr-t{}.dat".format(_t_value)
+                store.export(filename)
     return SNR_X_DB, SNR_Y_DB, capac
 
-def main(snr_x_db, snr_y_db, alpha_x=1, alpha_y=1, plot=False, export=True):
+def main(snr_x_db, snr_y_db, alpha_x=1, alpha_y=1, plot=False, export=True,
+         tol=None):
     key_results = "zocX{}Y{}"
     snr_x_db = np.array(snr_x_db)
     snr_y_db = np.array(snr_y_db)
     snr_x = 10**(snr_x_db/10.)
     snr_y = 10**(snr_y_db/10.)
-    lam_x = 1./(snr_x*alpha_x)
-    lam_y = 1./(snr_y*alpha_y)
-    t = np.linspace(0, 1)
-    results = {}
-    for _snr_x, _snr_y, _lam_x, _lam_y in zip(snr_x_db, snr_y_db, lam_x, lam_y):
-        zero_out = zoc_copula_t_mrc_heterog_rayleigh(t, _lam_x, _lam_y)
-        results[key_results.format(_snr_x, _snr_y)] = zero_out
+    if tol is None:
+        t = np.linspace(0, 1)
+    else:
+        # All SNR pairs are evaluated on the union of their adaptive grids
+        _grids = []
+        with np.errstate(divide="ignore", invalid="ignore"):
+            for _lam_x, _lam_y in zip(1./(snr_x*alpha_x), 1./(snr_y*alpha_y)):
+                _grids.append(adaptive_grid(
+                    lambda t: zoc_copula_t_mrc_heterog_rayleigh(t, _lam_x, _lam_y,
+                                                                return_branch=True),
+                    tol=tol)[0])
+        t = np.unique(np.concatenate(_grids))
+    zero_out = zoc_copula_t_mrc_heterog_rayleigh_batch(
+        t, 1./snr_x[:, np.newaxis], 1./snr_y[:, np.newaxis], alpha_x, alpha_y)
+    results = {key_results.format(_snr_x, _snr_y): _zero_out
+               for _snr_x, _snr_y, _zero_out in zip(snr_x_db, snr_y_db, zero_out)}
     #expected = expected_zoc_uniform(0.8, 1, lam_x, lam_y)
 
     SNR_X_DB, SNR_Y_DB, CAPAC_GRID = zero_outage_snr_grid(t=.5, export=export)
@@ -103,6 +224,7 @@ def main(snr_x_db, snr_y_db, alpha_x=1, alpha_y=1, plot=False, export=True):
         results.update({"t": t})
         export_results(results, filename)
     if plot:
+        import matplotlib.pyplot as plt
         fig, axs = plt.subplots()
         for _snr_x, _snr_y in zip(snr_x_db, snr_y_db):
             zero_out = results[key_results.format(_snr_x, _snr_y)]
@@ -122,12 +244,10 @@ def main(snr_x_db, snr_y_db, alpha_x=1, alpha_y=1, plot=False, export=True):
         axs2.set_title("Zero-Outage Capacity for Rayleigh Fading and MRC\nt={:.3f}".format(.5))
         fig2.tight_layout()
         fig2.savefig("results-zoc-grid-rayleigh-copula-t{}.png".format(0.5), dpi=100)
-        plt.show()
 
 
 if __name__ == "__main__":
     import argparse
-    import matplotlib.pyplot as plt
     parser = argparse.ArgumentParser()
     parser.add_argument("--plot", action="store_true")
     parser.add_argument("--export", action="store_true")
@@ -135,5 +255,9 @@ if __name__ == "__main__":
     parser.add_argument("-y", "--snr_y_db", type=float, default=[0, 5], nargs="+")
     parser.add_argument("-ax", "--alpha_x", type=float, default=1)
     parser.add_argument("-ay", "--alpha_y", type=float, default=1)
+    parser.add_argument("--tol", type=float, help="Use an adaptive t grid with this accuracy")
     args = vars(parser.parse_args())
     main(**args)
+    if args["plot"]:
+        import matplotlib.pyplot as plt
+        plt.show()
@@ -0,0 +1,203 @@
+"""Binary Result Store
+
+This module contains an append-able, columnar store for (large) results. Every
+column is stored as raw binary file next to a small JSON file with the
+metadata, so that results can be appended while a computation is running and
+loaded as memory maps without copying or parsing them. The tab-separated
+`.dat` files, which are used for the figures, can be exported from a store.
+
+
+Copyright (C) 2021 Karl-Ludwig Besser
+
+This program is used in the article:
+Karl-Ludwig Besser, Pin-Hsun Lin, and Eduard Jorswieck, "On Fading Channel
+Dependency Structures with a Positive Zero-Outage Capacity", IEEE Transactions
+on Communications, vol. 69, no. 10, pp. 6561-6574, Oct 2021.
+
+License:
+This program is licensed under the GPLv3 license. If you in any way use this
+code for research that results in publications, please cite our original
+article listed above.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+PARTICULAR PURPOSE.
+See the GNU General Public License for more details.
+
+Author: Karl-Ludwig Besser, Technische Universität Braunschweig
+"""
+
+import json
+import os
+
+import numpy as np
+
+STORE_FORMAT = 1
+
+class ResultStore:
+    """Columnar store of results in the directory `directory`.
+
+    All columns have the same number of rows and every row of a column can
+    be an array of fixed shape. The rows are added with `append` and the
+    columns are read with `store[name]`, which returns a read-only memory
+    map. The metadata (number of rows, dtypes and shapes of the columns and
+    the user attributes `attrs`) is stored in `meta.json`, which is replaced
+    atomically after every append. Data that is written after the number of
+    rows in the metadata, e.g., by an interrupted append, is discarded.
+
+    `mode` is "a" to open or create a store, "w" to create an empty store
+    and "r" to open an existing store read-only. An existing store is only
+    cleared ("w") if the directory contains its metadata, and a store is
+    only created in an empty (or new) directory.
+    """
+    def __init__(self, directory, mode="a", attrs=None):
+        if mode not in ("r", "a", "w"):
+            raise ValueError("Unknown mode: {}".format(mode))
+        self.directory = directory
+        self.mode = mode
+        _exists = os.path.exists(self._meta_filename)
+        if mode == "r" and not _exists:
+            raise FileNotFoundError("No result store in {}".format(directory))
+        if _exists:
+            self._check_store()
+        if mode == "w" or not _exists:
+            if _exists:
+                for _name in os.listdir(directory):
+                    if _name == "meta.json" or _name.endswith(".bin"):
+                        os.remove(os.path.join(directory, _name))
+            elif os.path.isdir(directory) and os.listdir(directory):
+                raise FileExistsError("The directory {} is not empty and contains no "
+                                      "result store".format(directory))
+            os.makedirs(directory, exist_ok=True)
+            self._meta = {"format": STORE_FORMAT, "length": 0, "columns": {},
+                          "attrs": {}}
+        else:
+            with open(self._meta_filename) as _file:
+                self._meta = json.load(_file)
+        if attrs is not None:
+            self._check_writable()
+            self._meta["attrs"].update(attrs)
+        if mode != "r":
+            self._write_meta()
+
+    def _check_store(self):
+        """Raise an error if `meta.json` does not belong to a result store."""
+        try:
+            with open(self._meta_filename) as _file:
+                _meta = json.load(_file)
+        except ValueError:
+            _meta = None
+        if not (isinstance(_meta, dict) and "format" in _meta and "columns" in _meta):
+            raise FileExistsError("The directory {} contains a meta.json that does not "
+                                  "belong to a result store".format(self.directory))
+
+    @property
+    def _meta_filename(self):
+        return os.path.join(self.directory, "meta.json")
+
+    def _column_filename(self, name):
+        return os.path.join(self.directory, "{}.bin".format(name))
+
+    def _check_writable(self):
+        if self.mode == "r":
+            raise PermissionError("The result store is opened read-only")
+
+    def _write_meta(self):
+        _tmp = "{}.tmp{}".format(self._meta_filename, os.getpid())
+        with open(_tmp, "w") as _file:
+            json.dump(self._meta, _file)
+        os.replace(_tmp, self._meta_filename)
+
+    @property
+    def attrs(self):
+        return self._meta["attrs"]
+
+    @property
+    def columns(self):
+        return list(self._meta["columns"])
+
+    def __len__(self):
+        return self._meta["length"]
+
+    def __contains__(self, name):
+        return name in self._meta["columns"]
+
+    def append(self, data):
+        """Append rows to all columns.
+
+        `data` is a dict with an array for every column, which all have the
+        same length along the first axis. The columns are created with the
+        dtypes and row shapes of the first append. Later appends need to
+        contain the same columns and are converted to their dtypes.
+        """
+        self._check_writable()
+        data = {k: np.asarray(v) for k, v in data.items()}
+        if not self._meta["columns"]:
+            for _name, _values in data.items():
+                if np.ndim(_values) == 0 or _values.dtype.hasobject:
+                    raise ValueError("Column {} needs to be a numerical array".format(_name))
+                self._meta["columns"][_name] = {"dtype": _values.dtype.str,
+                                                "shape": list(_values.shape[1:])}
+        if set(data) != set(self._meta["columns"]):
+            raise ValueError("Expected the columns {}".format(", ".join(self.columns)))
+        _num = {len(_values) for _values in data.values()}
+        if len(_num) != 1:
+            raise ValueError("All columns need to have the same number of rows")
+        _num = _num.pop()
+        for _name, _values in data.items():
+            _column = self._meta["columns"][_name]
+            _values = np.ascontiguousarray(_values, dtype=np.dtype(_column["dtype"]))
+            if list(_values.shape[1:]) != _column["shape"]:
+                raise ValueError("The rows of column {} need to have shape {}".format(
+                    _name, tuple(_column["shape"])))
+            with open(self._column_filename(_name), "ab") as _file:
+                _file.truncate(len(self)*self._row_bytes(_name))
+                _file.write(_values.tobytes())
+        self._meta["length"] += _num
+        self._write_meta()
+
+    def _row_bytes(self, name):
+        _column = self._meta["columns"][name]
+        return np.dtype(_column["dtype"]).itemsize*int(np.prod(_column["shape"]))
+
+    def __getitem__(self, name):
+        """Column `name` as read-only memory map."""
+        _column = self._meta["columns"][name]
+        _dtype = np.dtype(_column["dtype"])
+        _shape = (len(self), *_column["shape"])
+        if len(self) == 0 or self._row_bytes(name) == 0:
+            return np.empty(_shape, dtype=_dtype)
+        return np.memmap(self._column_filename(name), dtype=_dtype, mode="r",
+                         shape=_shape)
+
+    def load(self):
+        """All columns as dict of read-only memory maps."""
+        return {_name: self[_name] for _name in self.columns}
+
+    def export(self, filename, columns=None, chunk_size=2**20):
+        """Export the store to a tab-separated text file.
+
+        The file has the same format as the one written by
+        `utils.export_results`. Columns with multi-dimensional rows are
+        flattened into one text column per entry. The rows are written in
+        chunks, so that the store does not need to fit into memory.
+        """
+        import pandas as pd
+        columns = self.columns if columns is None else columns
+        for _start in range(0, max(len(self), 1), chunk_size):
+            _chunk = {}
+            for _name in columns:
+                _values = self[_name][_start:_start+chunk_size]
+                if self._meta["columns"][_name]["shape"]:
+                    _values = _values.reshape(len(_values), -1)
+                    _chunk.update({"{}{}".format(_name, _idx): _values[:, _idx]
+                                   for _idx in range(_values.shape[1])})
+                else:
+                    _chunk[_name] = _values
+            pd.DataFrame.from_dict(_chunk).to_csv(
+                filename, sep='\t', index=False, header=_start == 0,
+                mode="w" if _start == 0 else "a")
+
+def load_results(directory):
+    """Load the columns of the result store in `directory` as memory maps."""
+    return ResultStore(directory, mode="r").load()
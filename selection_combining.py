@@ -28,19 +28,116 @@ Author: Karl-Ludwig Besser, Technische Universität Braunschweig
 
 import numpy as np
 from scipy import optimize
+from scipy import stats
 
-from utils import export_results
+from utils import export_results, is_distribution, Marginals, NakagamiSNR
+
+# Increase when the results of the numerical solvers change. This invalidates
+# cached results (see `cache.py`).
+SOLVER_VERSION = 1
 
 
 def max_zoc_sc_homog(qf, n=2):
+    if is_distribution(qf):
+        qf = qf.ppf
     return np.log2(1 + qf(1-1/n))
 
 def max_zoc_sc_heterog(qf_list):
-    if len(qf_list) != 2:
-        raise NotImplementedError("Right now, only n=2 is supported")
-    p_star = _calc_p_star(*qf_list)
-    #print(p_star)
-    return np.log2(1 + qf_list[0](p_star))
+    if len(qf_list) == 2:
+        p_star = _calc_p_star(*qf_list)
+        return np.log2(1 + qf_list[0](p_star))
+    if all(hasattr(getattr(qf, "__self__", None), "dist") for qf in qf_list):
+        return max_zoc_sc_heterog_batch([qf.__self__ for qf in qf_list])
+    return np.log2(1 + _solve_s_star_qf(qf_list))
+
+def _inverse_qf(qf, s, xtol=1e-15, maxiter=100):
+    """Level u with qf(u)=s, i.e., the CDF at s, by bisection on [0, 1]."""
+    low, up = 0., 1.
+    for _ in range(maxiter):
+        if up - low <= xtol:
+            break
+        _mid = (low + up)/2
+        if qf(_mid) <= s:
+            low = _mid
+        else:
+            up = _mid
+    return (low + up)/2
+
+def _solve_s_star_qf(qf_list, xtol=1e-13, maxiter=200):
+    """Bisection for sum_i (1-F_i(s)) = 1 with the quantile functions
+    `qf_list`, where every F_i(s) is found by inverting qf_i.
+
+    This is the generic counterpart of `_solve_s_star`, which needs the CDFs
+    and densities of frozen distributions.
+    """
+    _n = len(qf_list)
+    # The threshold lies between the smallest and largest (1-1/n)-quantile
+    low = min(qf(1-(1+1e-6)/_n) for qf in qf_list)
+    up = max(qf(1-(1-1e-6)/_n) for qf in qf_list)
+    for _ in range(maxiter):
+        s_star = (low + up)/2
+        if up - low <= xtol*(1 + abs(s_star)):
+            break
+        _func = sum(1 - _inverse_qf(qf, s_star) for qf in qf_list) - 1
+        if _func > 0:
+            low = s_star
+        else:
+            up = s_star
+    return (low + up)/2
+
+def _solve_s_star(marginals, low, up, xtol=1e-13, maxiter=100):
+    """Safeguarded Newton iteration for sum_i (1-F_i(s)) = 1.
+
+    The function is decreasing in s, so the bracket `[low, up]` is updated
+    after every step and a bisection step is taken whenever the Newton step
+    leaves the bracket. Only unconverged configurations are evaluated.
+    """
+    low, up = low.copy(), up.copy()
+    s_star = (low + up)/2
+    active = np.arange(len(s_star))
+    for _ in range(maxiter):
+        if len(active) == 0:
+            break
+        _s = s_star[active]
+        _func = np.sum(marginals.sf(_s[:, np.newaxis], active), axis=1) - 1
+        _deriv = np.sum(marginals.pdf(_s[:, np.newaxis], active), axis=1)
+        low[active] = np.where(_func > 0, _s, low[active])
+        up[active] = np.where(_func < 0, _s, up[active])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            _new = _s + _func/_deriv
+        _outside = ~((_new > low[active]) & (_new < up[active]))
+        _new[_outside] = (low[active] + up[active])[_outside]/2
+        s_star[active] = _new
+        _done = ((np.abs(_new - _s) <= xtol*(1 + np.abs(_s))) | (_func == 0)
+                 | np.isnan(_func))
+        active = active[~_done]
+    return s_star
+
+def max_zoc_sc_heterog_batch(dists, return_levels=False):
+    """Maximum ZOC with SC for n heterogeneous links and many configurations.
+
+    The maximum ZOC is achieved by the threshold s, for which the quantile
+    levels p_i=1-F_i(s) of all links sum to one. `dists` is either a list of
+    n frozen distributions, whose parameters broadcast to the shape of the
+    configurations, or a single frozen distribution whose last parameter
+    axis indexes the links (see `utils.Marginals`). The threshold is found
+    by a safeguarded Newton iteration, which is vectorized over all
+    configurations.
+
+    Returns the maximum ZOC for every configuration and, if `return_levels`
+    is True, the quantile levels p_i with the links along the last axis.
+    """
+    marginals = Marginals(dists)
+    _n = marginals.n
+    # The threshold lies between the smallest and largest (1-1/n)-quantile
+    _low = np.min(marginals.ppf(1-(1+1e-6)/_n), axis=1)
+    _up = np.max(marginals.ppf(1-(1-1e-6)/_n), axis=1)
+    s_star = _solve_s_star(marginals, _low, _up)
+    zoc = np.log2(1 + s_star).reshape(marginals.shape)[()]
+    if return_levels:
+        levels = marginals.sf(s_star[:, np.newaxis])
+        return zoc, levels.reshape(*marginals.shape, _n)
+    return zoc
 
 def _condition_p_star(p, qf1, qf2):
     return qf1(p) - qf2(1.-p)
@@ -57,16 +154,15 @@ def main(m=5, snr_db=10., plot=False, export=False):
     snr = 10**(snr_db/10.)
     dist1 = stats.expon(scale=snr)
     zoc_sc = max_zoc_sc_homog(dist1.ppf, n)
-    results = {}
-    for _m in m:
-        dist2 = stats.gamma(a=_m, scale=snr/_m)
-        zoc_sc_naka = max_zoc_sc_homog(dist2.ppf, n)
-        results[key_naka.format(_m)] = zoc_sc_naka
+    zoc_sc_naka = max_zoc_sc_homog(NakagamiSNR(np.array(m)[:, np.newaxis], snr), n)
+    results = {key_naka.format(_m): _zoc for _m, _zoc in zip(m, zoc_sc_naka)}
+    dist2 = stats.gamma(a=m[-1], scale=snr/m[-1])
 
     p = np.linspace(0, 1)
     _x = dist1.ppf(p)
     _y = dist2.ppf(1-p)
-    _zoc = max_zoc_sc_heterog([dist1.ppf, dist2.ppf])
+    from cache import cached
+    _zoc = cached(max_zoc_sc_heterog, version=SOLVER_VERSION)([dist1.ppf, dist2.ppf])
     _s_zoc = 2**_zoc - 1
     print(_s_zoc)
     print(_zoc)
@@ -76,6 +172,7 @@ def main(m=5, snr_db=10., plot=False, export=False):
         export_results(results, "zoc-SC-snr{}-naka.dat".format(snr_db))
         export_results({"x": _x, "y": _y}, "zoc-sc-rayleigh-naka{}-snr{}.dat".format(m[-1], snr_db))
     if plot:
+        import matplotlib.pyplot as plt
         fig, axs = plt.subplots()
         axs.plot(n, zoc_sc, 'o-', label="Rayleigh Fading")
         for _m in m:
@@ -95,9 +192,7 @@ def main(m=5, snr_db=10., plot=False, export=False):
         axs2.set_ylabel("Y")
 
 if __name__ == "__main__":
-    from scipy import stats
     import argparse
-    import matplotlib.pyplot as plt
     parser = argparse.ArgumentParser()
     parser.add_argument("--plot", action="store_true")
     parser.add_argument("--export", action="store_true")
@@ -105,4 +200,6 @@ if __name__ == "__main__":
     parser.add_argument("-m", type=int, default=[5], nargs="+")
     args = vars(parser.parse_args())
     main(**args)
-    plt.show()
+    if args["plot"]:
+        import matplotlib.pyplot as plt
+        plt.show()
@@ -0,0 +1,201 @@
+"""Parameter Sweeps of the ZOC
+
+This module contains a runner for parameter sweeps of the ZOC with MRC over
+the fading distribution, the SNRs and the copula parameter t. The sweep is
+split into work units, which are computed on a process pool. The results are
+written incrementally, so that an interrupted sweep can be resumed without
+recomputing finished units.
+
+
+Copyright (C) 2021 Karl-Ludwig Besser
+
+This program is used in the article:
+Karl-Ludwig Besser, Pin-Hsun Lin, and Eduard Jorswieck, "On Fading Channel
+Dependency Structures with a Positive Zero-Outage Capacity", IEEE Transactions
+on Communications, vol. 69, no. 10, pp. 6561-6574, Oct 2021.
+
+License:
+This program is licensed under the GPLv3 license. If you in any way use this
+code for research that results in publications, please cite our original
+article listed above.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+PARTICULAR PURPOSE.
+See the GNU General Public License for more details.
+
+Author: Karl-Ludwig Besser, Technische Universität Braunschweig
+"""
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import itertools
+import json
+import os
+
+import numpy as np
+from scipy import stats
+
+PARAMETERS = ("family", "n", "m", "snr_x_db", "snr_y_db", "t")
+# Axes of `PARAMETERS` that are split into work units
+UNIT_AXES = 4
+FAMILIES = ("rayleigh", "nakagami")
+
+def fading_distribution(family, snr_db, m=1):
+    snr = 10**(snr_db/10.)
+    if family == "rayleigh":
+        return stats.expon(scale=snr)
+    elif family == "nakagami":
+        return stats.gamma(a=m, scale=snr/m)
+    raise ValueError("Unknown fading distribution: {}".format(family))
+
+def _zoc_unit(family, n, m, snr_x_db, snr_y_db, t):
+    """ZOC for one value of SNR_x and all values of SNR_y and t.
+
+    The first link has SNR_x and the remaining n-1 links have SNR_y. For
+    more than two links, the n-link solver is used for all values of SNR_y
+    and t at once.
+    """
+    from maximum_ratio_combining import (zoc_copula_t_mrc_heterog,
+                                         zoc_copula_t_mrc_heterog_nlinks)
+    from rayleigh_fading import zoc_copula_t_mrc_heterog_rayleigh
+    t = np.asarray(t, dtype=float)
+    if n > 2:
+        rv_x = fading_distribution(family, snr_x_db, m)
+        rv_y = fading_distribution(family, np.asarray(snr_y_db)[:, np.newaxis], m)
+        return zoc_copula_t_mrc_heterog_nlinks(t, [rv_x] + [rv_y]*(n-1))
+    results = np.empty((len(snr_y_db), len(t)))
+    for _idx, _snr_y_db in enumerate(snr_y_db):
+        if family == "rayleigh":
+            results[_idx] = zoc_copula_t_mrc_heterog_rayleigh(
+                t, 10**(-snr_x_db/10.), 10**(-_snr_y_db/10.))
+        else:
+            rv_x = fading_distribution(family, snr_x_db, m)
+            rv_y = fading_distribution(family, _snr_y_db, m)
+            results[_idx] = zoc_copula_t_mrc_heterog(t, rv_x, rv_y)
+    return results
+
+def _normalize_parameters(params):
+    # Sweeps over two links do not need to specify n
+    params = dict({"n": [2]}, **params)
+    missing = set(PARAMETERS) - set(params)
+    if missing:
+        raise ValueError("Missing parameters: {}".format(", ".join(sorted(missing))))
+    params = {k: np.ravel(params[k]).tolist() for k in PARAMETERS}
+    for _family in params["family"]:
+        if _family not in FAMILIES:
+            raise ValueError("Unknown fading distribution: {}".format(_family))
+    if any(int(_n) != _n or _n < 2 for _n in params["n"]):
+        raise ValueError("The numbers of links need to be integers of at least 2")
+    params["n"] = [int(_n) for _n in params["n"]]
+    return params
+
+def _stored_index(params, index):
+    """Index of the work unit that contains the results of the unit `index`.
+
+    Rayleigh fading does not depend on m, so its units are only computed
+    for the first value of m.
+    """
+    if params["family"][index[0]] == "rayleigh":
+        return index[:2] + (0,) + index[3:]
+    return index
+
+def _unit_filename(directory, index):
+    return os.path.join(directory, "unit-{}.npy".format("-".join(map(str, index))))
+
+def _save_unit(directory, index, results):
+    _filename = _unit_filename(directory, index)
+    _tmp = "{}.tmp{}".format(_filename, os.getpid())
+    with open(_tmp, "wb") as _file:
+        np.save(_file, results)
+    os.replace(_tmp, _filename)
+
+def _load_manifest(directory, params):
+    _manifest = os.path.join(directory, "manifest.json")
+    if os.path.exists(_manifest):
+        with open(_manifest) as _file:
+            _saved = json.load(_file)
+        if _saved != params:
+            raise ValueError("The directory {} contains a sweep with different "
+                             "parameters".format(directory))
+    else:
+        os.makedirs(directory, exist_ok=True)
+        with open(_manifest+".tmp", "w") as _file:
+            json.dump(params, _file)
+        os.replace(_manifest+".tmp", _manifest)
+
+def run_sweep(directory, params, workers=None, verbose=False):
+    """Compute the ZOC over a parameter space and store it in `directory`.
+
+    `params` is a dict with a list of values for every entry in `PARAMETERS`.
+    The ZOC is computed for all combinations, where one work unit contains
+    all values of SNR_y and t for a single combination of the distribution
+    family, the number of links n, m and SNR_x. The first link has SNR_x and
+    the remaining n-1 links have SNR_y. For Rayleigh fading, the units are
+    shared by all values of m. Every finished unit is written to its own file, so
+    that calling this function again with the same parameters resumes the
+    sweep and only computes the missing units.
+    Use `load_sweep` to read the results.
+    """
+    params = _normalize_parameters(params)
+    _load_manifest(directory, params)
+    _shape = [len(params[k]) for k in PARAMETERS[:UNIT_AXES]]
+    _units = sorted({_stored_index(params, _idx) for _idx in np.ndindex(*_shape)})
+    _pending = [_idx for _idx in _units
+                if not os.path.exists(_unit_filename(directory, _idx))]
+    if verbose:
+        print("{:d} of {:d} work units left".format(len(_pending), len(_units)))
+    with ProcessPoolExecutor(workers) as executor:
+        _futures = {executor.submit(_zoc_unit, *[params[k][i] for k, i in zip(PARAMETERS, _idx)],
+                                    params["snr_y_db"], params["t"]): _idx
+                    for _idx in _pending}
+        for _num, _future in enumerate(as_completed(_futures), start=1):
+            _save_unit(directory, _futures[_future], _future.result())
+            if verbose:
+                print("Finished work unit {:d}/{:d}".format(_num, len(_pending)))
+    return load_sweep(directory)
+
+def load_sweep(directory):
+    """Load the parameters and results of a (partial) sweep.
+
+    The results are returned as array with one axis per entry in
+    `PARAMETERS`. Units that have not been computed yet are NaN.
+    """
+    with open(os.path.join(directory, "manifest.json")) as _file:
+        params = json.load(_file)
+    results = np.full([len(params[k]) for k in PARAMETERS], np.nan)
+    for _idx in np.ndindex(*results.shape[:UNIT_AXES]):
+        _filename = _unit_filename(directory, _stored_index(params, _idx))
+        if os.path.exists(_filename):
+            results[_idx] = np.load(_filename)
+    return params, results
+
+def export_sweep(directory, filename):
+    from utils import export_results
+    params, results = load_sweep(directory)
+    _grid = list(itertools.product(*[params[k] for k in PARAMETERS]))
+    data = {k: [_point[_idx] for _point in _grid] for _idx, k in enumerate(PARAMETERS)}
+    data["capac"] = results.ravel()
+    export_results(data, filename)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("directory")
+    parser.add_argument("--family", choices=FAMILIES, nargs="+", default=["nakagami"])
+    parser.add_argument("-n", type=int, nargs="+", default=[2],
+                        help="Numbers of links (one with SNR_x and n-1 with SNR_y)")
+    parser.add_argument("-m", type=float, nargs="+", default=[5])
+    parser.add_argument("--snr_min", type=float, default=-10)
+    parser.add_argument("--snr_max", type=float, default=10)
+    parser.add_argument("--num_snr", type=int, default=50)
+    parser.add_argument("--num_t", type=int, default=50)
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--export")
+    args = parser.parse_args()
+    snr_db = np.linspace(args.snr_min, args.snr_max, args.num_snr)
+    params = {"family": args.family, "n": args.n, "m": args.m, "snr_x_db": snr_db,
+              "snr_y_db": snr_db, "t": np.linspace(0, 1, args.num_t)}
+    run_sweep(args.directory, params, workers=args.workers, verbose=True)
+    if args.export:
+        export_sweep(args.directory, args.export)
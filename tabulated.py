@@ -0,0 +1,274 @@
+"""Tabulated Distributions
+
+This module contains fast approximations of the quantile function (ppf), cdf
+and pdf of continuous distributions, which are built once per distribution
+and can be used wherever a frozen scipy distribution is accepted. This avoids
+the expensive evaluations of, e.g., `gammaincinv` for Nakagami-m fading and the
+large overhead of scipy for scalar arguments in the solvers.
+
+The table stores y=log(x) (or y=x for distributions with negative support) as
+function of z=logit(u) at adaptively chosen nodes, together with the exact
+derivatives from the pdf. Between the nodes, y(z) and its inverse z(y) are
+cubic Hermite polynomials, whose slopes are limited such that both are
+monotone. The nodes are refined until the errors of y(z), z(y) and log(pdf) at the
+midpoints between all nodes (and the points of the largest errors of the
+derivative) are below `rtol`, i.e., the relative errors of the ppf (absolute
+errors for y=x), the pdf and of both the cdf and the sf are bounded.
+Probabilities below `tail` (or above 1-`tail`) and values outside the table
+are evaluated with the exact distribution.
+
+Example:
+    rv = tabulate(stats.gamma(a=5, scale=.2))
+    max_zoc_sc_heterog([rv.ppf, rv_y.ppf])
+
+
+Copyright (C) 2021 Karl-Ludwig Besser
+
+This program is used in the article:
+Karl-Ludwig Besser, Pin-Hsun Lin, and Eduard Jorswieck, "On Fading Channel
+Dependency Structures with a Positive Zero-Outage Capacity", IEEE Transactions
+on Communications, vol. 69, no. 10, pp. 6561-6574, Oct 2021.
+
+License:
+This program is licensed under the GPLv3 license. If you in any way use this
+code for research that results in publications, please cite our original
+article listed above.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+PARTICULAR PURPOSE.
+See the GNU General Public License for more details.
+
+Author: Karl-Ludwig Besser, Technische Universität Braunschweig
+"""
+
+from bisect import bisect_right
+from collections import OrderedDict
+import math
+
+import numpy as np
+
+from cache import encode
+
+# Number of the most recently used tables that are kept by `tabulate`
+MAX_TABLES = 64
+_TABLES = OrderedDict()
+# Offset of the points with the largest error of the derivative of a cubic
+# Hermite interpolation from the center of the interval
+_C = .5/math.sqrt(3)
+
+def _logit(u):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.log(u) - np.log1p(-u)
+
+def _expit(z):
+    return 1/(1 + np.exp(-z))
+
+def _monotone_slopes(x, y, slopes):
+    """Limit the slopes of the Hermite interpolation of the increasing data
+    (x, y), such that the interpolation and its inverse are monotone."""
+    _secant = np.diff(y)/np.diff(x)
+    _left = np.concatenate(([_secant[0]], _secant))
+    _right = np.concatenate((_secant, [_secant[-1]]))
+    _low = np.maximum(_left, _right)/3
+    _high = 3*np.minimum(_left, _right)
+    return np.where(_low <= _high, np.clip(slopes, _low, _high), np.sqrt(_left*_right))
+
+def _hermite(x, y, slopes, q, derivative=False):
+    """Cubic Hermite interpolation through (x, y) with `slopes` at `q`.
+
+    With `derivative`, the derivative at `q` is returned as well.
+    """
+    _idx = np.clip(np.searchsorted(x, q, side="right")-1, 0, len(x)-2)
+    _h = x[_idx+1] - x[_idx]
+    s = (q - x[_idx])/_h
+    _y0, _y1 = y[_idx], y[_idx+1]
+    _d0, _d1 = _h*slopes[_idx], _h*slopes[_idx+1]
+    value = (1-s)**2*((1+2*s)*_y0 + s*_d0) + s**2*((3-2*s)*_y1 - (1-s)*_d1)
+    if derivative:
+        return value, (6*s*(1-s)*(_y1-_y0) + (1-s)*(1-3*s)*_d0 + s*(3*s-2)*_d1)/_h
+    return value
+
+def _hermite_scalar(x, y, slopes, q, derivative=False):
+    """`_hermite` for a single float in pure Python."""
+    _idx = min(max(bisect_right(x, q)-1, 0), len(x)-2)
+    _h = x[_idx+1] - x[_idx]
+    s = (q - x[_idx])/_h
+    _y0, _y1 = y[_idx], y[_idx+1]
+    _d0, _d1 = _h*slopes[_idx], _h*slopes[_idx+1]
+    value = (1-s)**2*((1+2*s)*_y0 + s*_d0) + s**2*((3-2*s)*_y1 - (1-s)*_d1)
+    if derivative:
+        return value, (6*s*(1-s)*(_y1-_y0) + (1-s)*(1-3*s)*_d0 + s*(3*s-2)*_d1)/_h
+    return value
+
+class TabulatedDistribution:
+    """Tabulated approximation of the frozen continuous distribution `rv`.
+
+    The methods `ppf`, `isf`, `cdf`, `sf` and `pdf` use the table and all
+    other attributes (e.g., `mean`, `dist` and `args`) are the ones of `rv`.
+    Raises a `ValueError` if `rtol` is not reached with `max_nodes` nodes.
+    """
+    def __init__(self, rv, rtol=1e-10, tail=1e-12, max_nodes=2**16):
+        self.rv = rv
+        self.rtol = rtol
+        self.tail = tail
+        self._log = rv.support()[0] >= 0
+        _z_max = -float(_logit(tail))
+        nodes = np.linspace(-_z_max, _z_max, 65)
+        _y, _exact_slopes = self._exact(nodes)
+        while True:
+            _slopes = _monotone_slopes(nodes, _y, _exact_slopes)
+            _inv_slopes = _monotone_slopes(_y, nodes, 1/_exact_slopes)
+            _error = np.zeros(len(nodes)-1)
+            for _position in (.5, .5 - _C, .5 + _C):
+                _z = nodes[:-1] + _position*np.diff(nodes)
+                _y_z, _slopes_z = self._exact(_z)
+                _error = np.maximum.reduce([
+                    _error, np.abs(_hermite(nodes, _y, _slopes, _z) - _y_z),
+                    np.abs(_hermite(_y, nodes, _inv_slopes, _y_z) - _z),
+                    np.abs(np.log(_hermite(_y, nodes, _inv_slopes, _y_z,
+                                           derivative=True)[1]*_slopes_z))])
+                if _position == .5:
+                    _mid, _y_mid, _slopes_mid = _z, _y_z, _slopes_z
+            _refine = ~(_error <= rtol)
+            if not np.any(_refine):
+                break
+            if len(nodes) + np.count_nonzero(_refine) > max_nodes:
+                raise ValueError("The tolerance {:g} is not reached with {:d} "
+                                 "nodes".format(rtol, max_nodes))
+            _order = np.argsort(np.concatenate((nodes, _mid[_refine])))
+            nodes = np.concatenate((nodes, _mid[_refine]))[_order]
+            _y = np.concatenate((_y, _y_mid[_refine]))[_order]
+            _exact_slopes = np.concatenate((_exact_slopes, _slopes_mid[_refine]))[_order]
+        self._z, self._y = nodes, _y
+        self._slopes, self._inv_slopes = _slopes, _inv_slopes
+        self._lists = [self._z.tolist(), self._y.tolist(), self._slopes.tolist(),
+                       self._inv_slopes.tolist()]
+        self._u_min, self._u_max = float(_expit(nodes[0])), float(_expit(nodes[-1]))
+
+    def _exact(self, z):
+        """Exact y and dy/dz at the nodes z."""
+        _lower = z < 0
+        x = np.where(_lower, self.rv.ppf(_expit(z)), self.rv.isf(_expit(-z)))
+        _log_slope = -np.logaddexp(0, z) - np.logaddexp(0, -z) - self.rv.logpdf(x)
+        if self._log:
+            return np.log(x), np.exp(_log_slope - np.log(x))
+        return x, np.exp(_log_slope)
+
+    def __getattr__(self, name):
+        if name == "rv":
+            raise AttributeError(name)
+        return getattr(self.rv, name)
+
+    def __len__(self):
+        """Number of nodes of the table."""
+        return len(self._z)
+
+    def cache_key(self):
+        """Representation for the keys of `cache.ResultCache`."""
+        return ("tabulated", self.rv, self.rtol, self.tail)
+
+    def _exact_outside(self, method, x, out, inside):
+        """Replace the entries of `out` outside of the table (`inside` is
+        False) by the exact values of `method` at `x`."""
+        out = np.asarray(out)
+        if not np.all(inside):
+            _outside = ~inside
+            out[_outside] = getattr(self.rv, method)(np.broadcast_to(x, out.shape)[_outside])
+        return out[()]
+
+    def _from_z(self, z):
+        """Value at the logit-probabilities `z` and the mask of the entries
+        inside of the table."""
+        _inside = (z >= self._z[0]) & (z <= self._z[-1])
+        _y = _hermite(self._z, self._y, self._slopes, np.where(_inside, z, 0.))
+        return (np.exp(_y) if self._log else _y), _inside
+
+    def ppf(self, q):
+        if np.ndim(q) == 0 and self._u_min <= q <= self._u_max:
+            _y = _hermite_scalar(self._lists[0], self._lists[1], self._lists[2],
+                                 math.log(q) - math.log1p(-q))
+            return math.exp(_y) if self._log else _y
+        return self._exact_outside("ppf", q, *self._from_z(_logit(np.asarray(q, dtype=float))))
+
+    def isf(self, q):
+        if np.ndim(q) == 0 and self._u_min <= q <= self._u_max:
+            _y = _hermite_scalar(self._lists[0], self._lists[1], self._lists[2],
+                                 math.log1p(-q) - math.log(q))
+            return math.exp(_y) if self._log else _y
+        return self._exact_outside("isf", q, *self._from_z(-_logit(np.asarray(q, dtype=float))))
+
+    def _to_z(self, x, derivative=False):
+        """Logit-probabilities (and their derivative w.r.t. x) at `x` and the
+        mask of the entries inside of the table."""
+        if self._log:
+            with np.errstate(divide="ignore", invalid="ignore"):
+                _y = np.log(x)
+        else:
+            _y = np.asarray(x, dtype=float)
+        _inside = (_y >= self._y[0]) & (_y <= self._y[-1])
+        _z = _hermite(self._y, self._z, self._inv_slopes, np.where(_inside, _y, self._y[0]),
+                      derivative=derivative)
+        if derivative and self._log:
+            with np.errstate(divide="ignore", invalid="ignore"):
+                _z = (_z[0], _z[1]/x)
+        return _z, _inside
+
+    def _scalar_y(self, x):
+        """y at a float `x` inside of the table or None."""
+        if self._log:
+            if not x > 0:
+                return None
+            _y = math.log(x)
+        else:
+            _y = float(x)
+        if not self._lists[1][0] <= _y <= self._lists[1][-1]:
+            return None
+        return _y
+
+    def cdf(self, x):
+        if np.ndim(x) == 0:
+            _y = self._scalar_y(x)
+            if _y is not None:
+                return 1/(1 + math.exp(-_hermite_scalar(self._lists[1], self._lists[0],
+                                                        self._lists[3], _y)))
+        _z, _inside = self._to_z(x)
+        return self._exact_outside("cdf", x, _expit(_z), _inside)
+
+    def sf(self, x):
+        if np.ndim(x) == 0:
+            _y = self._scalar_y(x)
+            if _y is not None:
+                return 1/(1 + math.exp(_hermite_scalar(self._lists[1], self._lists[0],
+                                                       self._lists[3], _y)))
+        _z, _inside = self._to_z(x)
+        return self._exact_outside("sf", x, _expit(-_z), _inside)
+
+    def pdf(self, x):
+        if np.ndim(x) == 0:
+            _y = self._scalar_y(x)
+            if _y is not None:
+                _z, _dz = _hermite_scalar(self._lists[1], self._lists[0], self._lists[3],
+                                          _y, derivative=True)
+                _u = 1/(1 + math.exp(-_z))
+                return _u*(1-_u)*_dz/(x if self._log else 1.)
+        (_z, _dz), _inside = self._to_z(x, derivative=True)
+        return self._exact_outside("pdf", x, _expit(_z)*_expit(-_z)*_dz, _inside)
+
+def tabulate(rv, rtol=1e-10, tail=1e-12):
+    """Tabulated version of the frozen distribution `rv`.
+
+    The tables are built once per distribution and tolerance and shared by
+    all callers. The `MAX_TABLES` most recently used tables are kept.
+    """
+    if isinstance(rv, TabulatedDistribution):
+        rv = rv.rv
+    _key = (encode(rv), rtol, tail)
+    if _key in _TABLES:
+        _TABLES.move_to_end(_key)
+        return _TABLES[_key]
+    _table = TabulatedDistribution(rv, rtol=rtol, tail=tail)
+    _TABLES[_key] = _table
+    while len(_TABLES) > MAX_TABLES:
+        _TABLES.popitem(last=False)
+    return _table
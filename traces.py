@@ -0,0 +1,362 @@
+"""Empirical ZOC of Measured Channel Traces
+
+This module estimates the empirical ZOC and the empirical copula of measured
+channel traces in a single pass with constant memory. A trace is a binary
+file with the SNRs (power gains) of all branches of every sample as rows,
+either as raw array with a given data type or as `.npy` file. The files are
+memory-mapped and processed in chunks.
+
+The `TraceSummary` of the samples contains the minimum of the sum (MRC) and of
+the maximum (SC) of the SNRs, sketches of the marginal quantiles with bounded
+relative error, the mean and variance of every branch, and a binned joint
+histogram of the first two branches, from which the empirical copula is
+computed. Summaries of different files or parts of a file can be merged, so
+large traces are processed in parallel.
+
+Example:
+    python3 traces.py --branches 2 --dtype float32 trace1.bin trace2.bin
+    python3 traces.py -t 1 --save summary.npz trace.npy
+
+
+Copyright (C) 2021 Karl-Ludwig Besser
+
+This program is used in the article:
+Karl-Ludwig Besser, Pin-Hsun Lin, and Eduard Jorswieck, "On Fading Channel
+Dependency Structures with a Positive Zero-Outage Capacity", IEEE Transactions
+on Communications, vol. 69, no. 10, pp. 6561-6574, Oct 2021.
+
+License:
+This program is licensed under the GPLv3 license. If you in any way use this
+code for research that results in publications, please cite our original
+article listed above.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+PARTICULAR PURPOSE.
+See the GNU General Public License for more details.
+
+Author: Karl-Ludwig Besser, Technische Universität Braunschweig
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import math
+import os
+
+import numpy as np
+
+
+class QuantileSketch:
+    """Mergeable sketch of the quantiles of nonnegative values.
+
+    The values are counted in the logarithmic buckets [g**k, g**(k+1)) with
+    g=(1+a)/(1-a) and the relative accuracy a, so that every quantile is
+    estimated with a relative error of at most a. The buckets cover the range
+    [`min_value`, `max_value`], smaller values (including zero) are counted in
+    the first and larger values in the last bucket.
+    """
+    def __init__(self, relative_accuracy=.01, min_value=1e-12, max_value=1e12):
+        self.relative_accuracy = relative_accuracy
+        self.min_value = min_value
+        self.max_value = max_value
+        self._gamma = (1+relative_accuracy)/(1-relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self._offset = math.floor(math.log(min_value)/self._log_gamma)
+        _num = math.floor(math.log(max_value)/self._log_gamma) - self._offset + 1
+        self.counts = np.zeros(_num, dtype=np.int64)
+
+    @property
+    def count(self):
+        return int(np.sum(self.counts))
+
+    def bucket(self, x):
+        """Index of the bucket of the values `x`."""
+        with np.errstate(divide="ignore"):
+            _idx = np.floor(np.log(x)/self._log_gamma) - self._offset
+        return np.clip(np.nan_to_num(_idx, nan=0., neginf=0.), 0,
+                       len(self.counts)-1).astype(np.intp)
+
+    def update(self, x):
+        """Add the values `x` and return the indices of their buckets."""
+        _idx = self.bucket(x)
+        self.counts += np.bincount(_idx, minlength=len(self.counts))
+        return _idx
+
+    def _check_compatible(self, other):
+        if (self.relative_accuracy, self.min_value, self.max_value) != (
+                other.relative_accuracy, other.min_value, other.max_value):
+            raise ValueError("Only sketches with the same parameters can be merged")
+
+    def merge(self, other):
+        self._check_compatible(other)
+        self.counts += other.counts
+
+    def quantile(self, q):
+        """Estimated quantiles at the probabilities `q`."""
+        _cumulative = np.cumsum(self.counts)
+        if _cumulative[-1] == 0:
+            raise ValueError("The sketch is empty")
+        _rank = np.asarray(q, dtype=float)*(_cumulative[-1]-1)
+        _idx = np.minimum(np.searchsorted(_cumulative, _rank, side="right"),
+                          len(self.counts)-1)
+        return (2*self._gamma**(_idx + self._offset + 1)/(self._gamma+1))[()]
+
+    def cdf(self, x):
+        """Fraction of the values below the lower edge of the bucket of `x`."""
+        _cumulative = np.concatenate(([0], np.cumsum(self.counts)))
+        return (_cumulative[self.bucket(x)]/_cumulative[-1])[()]
+
+
+class TraceSummary:
+    """Mergeable summary of the samples of a trace with `num_branches`
+    branches.
+
+    The joint histogram of the first two branches uses the buckets of their
+    quantile sketches, combined in groups of `copula_factor`. See
+    `QuantileSketch` for the other arguments.
+    """
+    def __init__(self, num_branches=2, relative_accuracy=.01, min_value=1e-12,
+                 max_value=1e12, copula_factor=16):
+        self.num_branches = num_branches
+        self.copula_factor = copula_factor
+        self.num = 0
+        self.num_invalid = 0
+        self.min_mrc = np.inf
+        self.min_sc = np.inf
+        self.sketches = [QuantileSketch(relative_accuracy, min_value, max_value)
+                         for _ in range(num_branches)]
+        self.mean = np.zeros(num_branches)
+        self.m2 = np.zeros(num_branches)
+        _num_bins = -(-len(self.sketches[0].counts)//copula_factor)
+        self.joint = np.zeros((_num_bins, _num_bins), dtype=np.int64)
+
+    def update(self, gains):
+        """Add the samples `gains` with shape `(k, num_branches)`. Samples with
+        negative or non-finite values are only counted in `num_invalid`."""
+        gains = np.asarray(gains, dtype=float)
+        _valid = np.all(np.isfinite(gains) & (gains >= 0), axis=1)
+        if not np.all(_valid):
+            self.num_invalid += len(gains) - np.count_nonzero(_valid)
+            gains = gains[_valid]
+        _num = len(gains)
+        if _num == 0:
+            return
+        self.min_mrc = min(self.min_mrc, float(np.min(np.sum(gains, axis=1))))
+        self.min_sc = min(self.min_sc, float(np.min(np.max(gains, axis=1))))
+        _buckets = []
+        for _sketch, _gains in zip(self.sketches, gains.T):
+            _buckets.append(_sketch.update(_gains)//self.copula_factor)
+        if self.num_branches >= 2:
+            _size = len(self.joint)
+            self.joint += np.bincount(_buckets[0]*_size + _buckets[1],
+                                      minlength=_size**2).reshape(_size, _size)
+        _mean = np.mean(gains, axis=0)
+        _m2 = np.sum((gains - _mean)**2, axis=0)
+        self._merge_moments(_num, _mean, _m2)
+
+    def _merge_moments(self, num, mean, m2):
+        """Combine the mean and the sum of squared deviations with the ones of
+        `num` further samples."""
+        _total = self.num + num
+        _delta = mean - self.mean
+        self.mean = self.mean + _delta*num/_total
+        self.m2 = self.m2 + m2 + _delta**2*self.num*num/_total
+        self.num = _total
+
+    def merge(self, other):
+        """Add the samples of the summary `other`."""
+        if (self.num_branches, self.copula_factor) != (other.num_branches,
+                                                       other.copula_factor):
+            raise ValueError("Only summaries with the same parameters can be merged")
+        for _sketch, _other in zip(self.sketches, other.sketches):
+            _sketch.merge(_other)
+        self.joint += other.joint
+        self.num_invalid += other.num_invalid
+        self.min_mrc = min(self.min_mrc, other.min_mrc)
+        self.min_sc = min(self.min_sc, other.min_sc)
+        if other.num > 0:
+            self._merge_moments(other.num, other.mean, other.m2)
+        return self
+
+    def zoc(self):
+        """Empirical ZOC with MRC and SC, i.e., the smallest rates of all
+        samples."""
+        return {"MRC": np.log2(1 + self.min_mrc), "SC": np.log2(1 + self.min_sc)}
+
+    def variance(self):
+        return self.m2/max(self.num-1, 1)
+
+    def fit_gamma(self):
+        """Gamma (Nakagami-m) distributions of all branches with the empirical
+        mean and variance."""
+        from scipy import stats
+        _var = self.variance()
+        return [stats.gamma(a=_mean**2/_v, scale=_v/_mean)
+                for _mean, _v in zip(self.mean, _var)]
+
+    def empirical_copula(self):
+        """Empirical copula of the first two branches at the edges of the
+        bins of the joint histogram.
+
+        Returns the levels u and v of the bin edges, which are exact
+        empirical marginal distribution functions, and the empirical copula
+        C(u, v) on their grid.
+        """
+        _edges = np.minimum(np.arange(len(self.joint)+1)*self.copula_factor,
+                            len(self.sketches[0].counts))
+        _levels = []
+        for _sketch in self.sketches[:2]:
+            _cumulative = np.concatenate(([0], np.cumsum(_sketch.counts)))
+            _levels.append(_cumulative[_edges]/self.num)
+        _joint = np.zeros((len(self.joint)+1,)*2)
+        _joint[1:, 1:] = np.cumsum(np.cumsum(self.joint, axis=0), axis=1)/self.num
+        _u, _idx_u = np.unique(_levels[0], return_index=True)
+        _v, _idx_v = np.unique(_levels[1], return_index=True)
+        return _u, _v, _joint[np.ix_(_idx_u, _idx_v)]
+
+    def copula_distance(self, copula, param):
+        """Largest difference between the empirical copula and
+        `copula(u, v, param)`, e.g., `copulas.zoc_copula2`, on the grid of
+        `empirical_copula`."""
+        _u, _v, _copula = self.empirical_copula()
+        return float(np.max(np.abs(_copula - copula(_u[:, np.newaxis], _v, param))))
+
+    def save(self, filename):
+        """Save the summary as `.npz` file, e.g., to merge it later."""
+        _sketch = self.sketches[0]
+        np.savez_compressed(filename, num_branches=self.num_branches,
+                            copula_factor=self.copula_factor,
+                            relative_accuracy=_sketch.relative_accuracy,
+                            min_value=_sketch.min_value, max_value=_sketch.max_value,
+                            num=self.num, num_invalid=self.num_invalid,
+                            min_mrc=self.min_mrc, min_sc=self.min_sc,
+                            counts=np.stack([_s.counts for _s in self.sketches]),
+                            mean=self.mean, m2=self.m2, joint=self.joint)
+
+    @classmethod
+    def load(cls, filename):
+        with np.load(filename) as _data:
+            summary = cls(int(_data["num_branches"]), float(_data["relative_accuracy"]),
+                          float(_data["min_value"]), float(_data["max_value"]),
+                          int(_data["copula_factor"]))
+            for _sketch, _counts in zip(summary.sketches, _data["counts"]):
+                _sketch.counts[:] = _counts
+            summary.joint[:] = _data["joint"]
+            summary.mean, summary.m2 = _data["mean"], _data["m2"]
+            summary.num, summary.num_invalid = int(_data["num"]), int(_data["num_invalid"])
+            summary.min_mrc = float(_data["min_mrc"])
+            summary.min_sc = float(_data["min_sc"])
+        return summary
+
+
+def open_trace(filename, num_branches=2, dtype="float32", offset=0):
+    """Memory map of the trace `filename` with shape `(k, num_branches)`.
+
+    `.npy` files contain their shape and data type, all other files are
+    read as raw arrays of `dtype` after a header of `offset` bytes.
+    """
+    if filename.endswith(".npy"):
+        trace = np.load(filename, mmap_mode="r")
+    else:
+        trace = np.memmap(filename, dtype=dtype, mode="r", offset=offset)
+    trace = trace.reshape(-1, num_branches)
+    return trace
+
+def summarize_trace(filename, start=0, stop=None, num_branches=2,
+                    dtype="float32", offset=0, chunk_size=2**20, **kwargs):
+    """Summary of the samples start..stop of the trace `filename`.
+
+    The samples are read in chunks of `chunk_size`, so the memory does not
+    depend on the size of the trace. The remaining arguments are passed to
+    `TraceSummary`.
+    """
+    trace = open_trace(filename, num_branches, dtype, offset)
+    stop = len(trace) if stop is None else min(stop, len(trace))
+    summary = TraceSummary(num_branches, **kwargs)
+    for _start in range(start, stop, chunk_size):
+        summary.update(trace[_start:min(_start+chunk_size, stop)])
+    return summary
+
+def _summarize_part(args):
+    filename, start, stop, kwargs = args
+    return summarize_trace(filename, start, stop, **kwargs)
+
+def summarize_traces(filenames, workers=None, task_size=2**24, **kwargs):
+    """Merged summary of all traces in `filenames`.
+
+    The traces are split into parts of `task_size` samples, which are
+    summarized in parallel in `workers` processes. See `summarize_trace` for
+    the other arguments.
+    """
+    _kwargs = {_key: kwargs[_key] for _key in ("num_branches", "dtype", "offset")
+               if _key in kwargs}
+    _tasks = []
+    for _filename in filenames:
+        _num = len(open_trace(_filename, **_kwargs))
+        _tasks.extend((_filename, _start, _start+task_size, kwargs)
+                      for _start in range(0, _num, task_size))
+    _summary_kwargs = {_key: _value for _key, _value in kwargs.items()
+                       if _key not in ("dtype", "offset", "chunk_size")}
+    summary = TraceSummary(**_summary_kwargs)
+    workers = workers or os.cpu_count()
+    if workers == 1 or len(_tasks) <= 1:
+        for _part in map(_summarize_part, _tasks):
+            summary.merge(_part)
+        return summary
+    with ProcessPoolExecutor(workers) as executor:
+        for _part in executor.map(_summarize_part, _tasks):
+            summary.merge(_part)
+    return summary
+
+def compare_with_model(summary, t=1.):
+    """Empirical ZOC of `summary` and the ZOC of the model with gamma
+    (Nakagami-m) marginals fitted to the first two branches.
+
+    For MRC, the model ZOC is the one of the copula with parameter `t`. For
+    SC, it is the maximum ZOC over all copulas, both for the fitted and for
+    the empirical marginals.
+    """
+    from maximum_ratio_combining import zoc_copula_t_mrc_heterog
+    from selection_combining import max_zoc_sc_heterog
+    rv_x, rv_y = summary.fit_gamma()[:2]
+    results = {"empMRC": summary.zoc()["MRC"], "empSC": summary.zoc()["SC"],
+               "modelMRC": float(zoc_copula_t_mrc_heterog(t, rv_x, rv_y)),
+               "modelSC": float(max_zoc_sc_heterog([rv_x.ppf, rv_y.ppf])),
+               "empMarginalsSC": float(max_zoc_sc_heterog(
+                   [_sketch.quantile for _sketch in summary.sketches[:2]])),
+               "m": (summary.mean**2/summary.variance())[:2].tolist()}
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("traces", nargs="+")
+    parser.add_argument("-b", "--branches", type=int, default=2)
+    parser.add_argument("--dtype", default="float32")
+    parser.add_argument("--offset", type=int, default=0, help="Header size in bytes")
+    parser.add_argument("-t", type=float, default=1., help="Copula parameter of the MRC model")
+    parser.add_argument("--accuracy", type=float, default=.01,
+                        help="Relative accuracy of the quantile sketches")
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--save", help="Save the summary as .npz file")
+    parser.add_argument("--load", nargs="*", default=[],
+                        help="Merge these saved summaries")
+    args = parser.parse_args()
+    summary = summarize_traces(args.traces, workers=args.workers,
+                               num_branches=args.branches, dtype=args.dtype,
+                               offset=args.offset, relative_accuracy=args.accuracy)
+    for _filename in args.load:
+        summary.merge(TraceSummary.load(_filename))
+    if args.save:
+        summary.save(args.save)
+    print("{:d} samples ({:d} invalid)".format(summary.num, summary.num_invalid))
+    if summary.num_branches >= 2:
+        from copulas import zoc_copula2
+        results = compare_with_model(summary, t=args.t)
+        print("Fitted Nakagami-m parameters: m = {:.3f}, {:.3f}".format(*results["m"]))
+        print("MRC: empirical ZOC = {:.4f}, model ZOC (t={}) = {:.4f}".format(
+            results["empMRC"], args.t, results["modelMRC"]))
+        print("SC: empirical ZOC = {:.4f}, maximum ZOC = {:.4f} (fitted), {:.4f} (empirical marginals)".format(
+            results["empSC"], results["modelSC"], results["empMarginalsSC"]))
+        print("Distance of the empirical copula to zoc_copula2 (t={}): {:.4f}".format(
+            args.t, summary.copula_distance(zoc_copula2, args.t)))
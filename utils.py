@@ -23,10 +23,13 @@ See the GNU General Public License for more details.
 Author: Karl-Ludwig Besser, Technische Universität Braunschweig
 """
 
+import copy
 from itertools import tee
 
 import numpy as np
-import pandas as pd
+from scipy import special, stats
+
+import instrumentation
 
 #https://docs.python.org/3/library/itertools.html#itertools-recipes
 def pairwise(iterable):
@@ -35,7 +38,251 @@ def pairwise(iterable):
     next(b, None)
     return zip(a, b)
 
+def find_roots_bisect(func, low, up, args=(), xtol=2e-12,
+                      rtol=4*np.finfo(float).eps, maxiter=500):
+    """Vectorized bisection for many brackets at once.
+
+    All brackets `[low, up]` are refined simultaneously and `func` is only
+    evaluated on the brackets that are still active. Array arguments in `args`
+    with the same shape as `low` are sliced along with the brackets.
+    Brackets without a sign change (including NaN values at the bounds) are
+    reported as not converged.
+    """
+    low, up = np.broadcast_arrays(np.asarray(low, dtype=float),
+                                  np.asarray(up, dtype=float))
+    shape = low.shape
+    low = low.ravel().copy()
+    up = up.ravel().copy()
+    _array_args = [isinstance(a, np.ndarray) and np.shape(a) == shape for a in args]
+    args = [np.ravel(a) if _is_arr else a for a, _is_arr in zip(args, _array_args)]
+    f_low = func(low, *args)
+    f_up = func(up, *args)
+    roots = np.full(len(low), np.nan)
+    converged = np.zeros(len(low), dtype=bool)
+    for _bound, _f_bound in ((up, f_up), (low, f_low)):
+        _zero = _f_bound == 0
+        roots[_zero] = _bound[_zero]
+        converged[_zero] = True
+    active = (np.sign(f_low)*np.sign(f_up) < 0) & ~converged
+    _bisected = active.copy()
+    _evaluations = 2*len(low)
+    _iterations = 0
+    for _iteration in range(maxiter):
+        idx = np.flatnonzero(active)
+        if len(idx) == 0:
+            break
+        _evaluations += len(idx)
+        _args = [a[idx] if _is_arr else a for a, _is_arr in zip(args, _array_args)]
+        mid = (low[idx] + up[idx])/2
+        f_mid = func(mid, *_args)
+        _upper_half = np.sign(f_mid) == np.sign(f_low[idx])
+        low[idx[_upper_half]] = mid[_upper_half]
+        f_low[idx[_upper_half]] = f_mid[_upper_half]
+        up[idx[~_upper_half]] = mid[~_upper_half]
+        _failed = np.isnan(f_mid)
+        _done = ((f_mid == 0) | (up[idx]-low[idx] <= xtol + rtol*np.abs(mid))) & ~_failed
+        roots[idx[_done]] = np.where(f_mid[_done] == 0, mid[_done],
+                                     (low[idx[_done]] + up[idx[_done]])/2)
+        converged[idx[_done]] = True
+        active[idx[_done | _failed]] = False
+        _iterations += (_iteration+1)*np.count_nonzero(_done)
+    if instrumentation.enabled():
+        instrumentation.count("bisect.calls")
+        instrumentation.count("bisect.brackets", len(low))
+        instrumentation.count("bisect.sign_changes", np.count_nonzero(_bisected))
+        instrumentation.count("bisect.converged", np.count_nonzero(converged))
+        instrumentation.count("bisect.failed", np.count_nonzero(_bisected & ~converged))
+        instrumentation.count("bisect.evaluations", _evaluations)
+        instrumentation.count("bisect.iterations", _iterations)
+    return roots.reshape(shape), converged.reshape(shape)
+
+def adaptive_grid(func, start=0., stop=1., tol=1e-3, num_init=17,
+                  max_points=2000, min_width=1e-9):
+    """Sample the vectorized function `func` on an adaptively refined grid.
+
+    Starting from `num_init` equidistant points, every interval is split as
+    long as the linear interpolation between its bounds deviates from the
+    function value at its midpoint by more than `tol`. If `func` returns a
+    tuple `(values, branches)`, the function may have a kink in intervals at
+    whose bounds the active branch differs. These intervals are additionally
+    split as long as the interpolation error at a kink, estimated from the
+    slopes of the neighboring intervals, exceeds `tol`. All midpoints are
+    evaluated in one call to `func` per refinement level. At most
+    `max_points` points are used and intervals narrower than `min_width` are
+    not split.
+
+    Returns the grid and the function values (and branches) on it.
+    """
+    def _evaluate(x):
+        _results = func(x)
+        if isinstance(_results, tuple):
+            return np.asarray(_results[0], dtype=float), np.asarray(_results[1])
+        return np.asarray(_results, dtype=float), None
+    x = np.linspace(start, stop, num_init)
+    values, branches = _evaluate(x)
+    todo = np.ones(len(x)-1, dtype=bool)
+    while len(x) < max_points:
+        todo &= np.diff(x) > min_width
+        idx = np.flatnonzero(todo)
+        if len(idx) == 0:
+            break
+        idx = idx[np.argsort(x[idx]-x[idx+1], kind="stable")][:max_points-len(x)]
+        idx = np.sort(idx)
+        _mid = (x[idx] + x[idx+1])/2
+        _values_mid, _branches_mid = _evaluate(_mid)
+        _split = np.abs(_values_mid - (values[idx] + values[idx+1])/2) > tol
+        if branches is not None:
+            _slopes = np.diff(values)/np.diff(x)
+            _slopes = np.concatenate(([_slopes[0]], _slopes, [_slopes[-1]]))
+            _kink_error = np.abs(_slopes[idx] - _slopes[idx+2])*(x[idx+1]-x[idx])/4
+            _split |= (branches[idx] != branches[idx+1]) & (_kink_error > tol)
+            branches = np.insert(branches, idx+1, _branches_mid)
+        x = np.insert(x, idx+1, _mid)
+        values = np.insert(values, idx+1, _values_mid)
+        todo[idx] = _split
+        todo = np.repeat(todo, np.where(np.isin(np.arange(len(todo)), idx), 2, 1))
+    if branches is not None:
+        return x, values, branches
+    return x, values
+
+class Marginals:
+    """Marginal distributions of n links for many configurations at once.
+
+    `dists` is either a list of n frozen scipy distributions, whose
+    parameters broadcast against each other, or a single frozen distribution
+    whose last parameter axis indexes the links. The broadcast shape of the
+    remaining parameter axes is the shape of the configurations.
+
+    The methods `cdf`, `sf`, `ppf`, `isf` and `pdf` take arrays of shape
+    `(K, n)` (or broadcastable to it), where `K` is the number of selected
+    configurations, and evaluate every link with its own distribution. The
+    links of the same distribution family are evaluated in a single call
+    with the unfrozen distribution, so no scipy objects are created per
+    configuration. `idx` selects a subset of the (flattened) configurations.
+    """
+    def __init__(self, dists):
+        if isinstance(dists, (list, tuple)):
+            _params = [_frozen_parameters(rv) for rv in dists]
+            self.shape = np.broadcast_shapes(*[np.shape(a) for _p in _params for a in _p[1]])
+            self.n = len(dists)
+            _families = []
+            for _dist, _p in _params:
+                if _dist not in _families:
+                    _families.append(_dist)
+            self._groups = []
+            for _dist in _families:
+                _links = [i for i, (_d, _p) in enumerate(_params) if _d is _dist]
+                _stacked = [np.stack([np.broadcast_to(_params[i][1][j], self.shape).ravel()
+                                      for i in _links], axis=-1)
+                            for j in range(len(_params[_links[0]][1]))]
+                self._groups.append((_dist, np.array(_links), _stacked))
+        else:
+            _dist, _p = _frozen_parameters(dists)
+            _shape = np.broadcast_shapes(*[np.shape(a) for a in _p])
+            if len(_shape) == 0:
+                raise ValueError("The parameters need an axis for the links")
+            self.shape = _shape[:-1]
+            self.n = _shape[-1]
+            _stacked = [np.broadcast_to(a, _shape).reshape(-1, self.n) for a in _p]
+            self._groups = [(_dist, np.arange(self.n), _stacked)]
+        self.size = int(np.prod(self.shape))
+
+    def _evaluate(self, method, x, idx=None):
+        _num = self.size if idx is None else len(idx)
+        x = np.broadcast_to(x, (_num, self.n))
+        out = np.empty((_num, self.n))
+        for _dist, _links, _params in self._groups:
+            if idx is not None:
+                _params = [a[idx] for a in _params]
+            out[:, _links] = getattr(_dist, method)(x[:, _links], *_params[:-2],
+                                                    loc=_params[-2], scale=_params[-1])
+        return out
+
+    def cdf(self, x, idx=None):
+        return self._evaluate("cdf", x, idx)
+
+    def sf(self, x, idx=None):
+        return self._evaluate("sf", x, idx)
+
+    def ppf(self, q, idx=None):
+        return self._evaluate("ppf", q, idx)
+
+    def isf(self, q, idx=None):
+        return self._evaluate("isf", q, idx)
+
+    def pdf(self, x, idx=None):
+        return self._evaluate("pdf", x, idx)
+
+    def broadcast_to(self, shape):
+        """Marginals of the configurations broadcast to `shape`."""
+        shape = tuple(shape)
+        _idx = np.broadcast_to(np.arange(self.size).reshape(self.shape), shape).ravel()
+        out = copy.copy(self)
+        out.shape = shape
+        out.size = int(np.prod(shape))
+        out._groups = [(_dist, _links, [a[_idx] for a in _params])
+                       for _dist, _links, _params in self._groups]
+        return out
+
+class NakagamiSNR:
+    """Distribution of the SNR with Nakagami-m fading, i.e., the gamma
+    distribution with shape `m` and mean `snr`, for arrays of parameters.
+
+    The parameters broadcast against each other and against the arguments of
+    the methods. In contrast to frozen scipy distributions, the special
+    functions are called directly, so large grids of parameters neither
+    create scipy objects nor go through the argument checks of scipy. The
+    quantiles are only computed for the broadcast of `m` and the
+    probabilities and then scaled by `snr`. It can be used instead of a
+    frozen distribution for the homogeneous bounds.
+    """
+    def __init__(self, m, snr):
+        self.m = np.asarray(m, dtype=float)
+        self.snr = np.asarray(snr, dtype=float)
+
+    def ppf(self, q):
+        return special.gammaincinv(self.m, q)*(self.snr/self.m)
+
+    def mean(self):
+        return self.snr
+
+    def cache_key(self):
+        """Representation for the keys of `cache.ResultCache`."""
+        return ("nakagami", self.m, self.snr)
+
+def is_distribution(dist):
+    """True if `dist` is a (frozen) continuous scipy distribution or a
+    `NakagamiSNR` instead of a plain quantile function."""
+    if isinstance(dist, NakagamiSNR):
+        return True
+    if hasattr(dist, 'dist'):
+        return isinstance(dist.dist, stats.rv_continuous)
+    else:
+        return isinstance(dist, stats.rv_continuous)
+
+def frozen_parameters(rv):
+    """Shape parameters (as tuple), loc and scale of the frozen scipy
+    distribution `rv`, which are given positionally or as keywords."""
+    _names = [_name.strip() for _name in (rv.dist.shapes or "").split(",") if _name.strip()]
+    _names += ["loc", "scale"]
+    if len(rv.args) > len(_names):
+        raise TypeError("Too many parameters for the distribution {}".format(rv.dist.name))
+    _params = dict(zip(_names, rv.args))
+    for _name, _value in rv.kwds.items():
+        if _name not in _names or _name in _params:
+            raise TypeError("Invalid parameter {} for the distribution {}".format(
+                _name, rv.dist.name))
+        _params[_name] = _value
+    _shapes = tuple(_params[_name] for _name in _names[:-2])
+    return _shapes, _params.get("loc", 0), _params.get("scale", 1)
+
+def _frozen_parameters(rv):
+    """Unfrozen distribution and parameters (shapes, loc, scale) of `rv`."""
+    _shapes, _loc, _scale = frozen_parameters(rv)
+    return rv.dist, [np.asarray(a, dtype=float) for a in (*_shapes, _loc, _scale)]
+
 def export_results(data, filename):
+    import pandas as pd
     data = pd.DataFrame.from_dict(data)
     data.to_csv(filename, sep='\t', index=False)
 
@@ -0,0 +1,160 @@
+"""Command Line Interface
+
+This module is the single entry point for the scripts that generate the
+results. Several commands can be given at once, which are then run in the same
+process, so that the (slow) imports of scipy, the distribution objects and the
+cached intermediate results are shared between them. The modules are only
+imported when their command is run and matplotlib is only imported with
+`--plot`. All figures are shown together at the end.
+
+Example:
+    python3 zoc.py --export boundary -x 8 -y 0 sc -s 10 -m 2 5 10
+    python3 zoc.py --plot --export all
+
+
+Copyright (C) 2021 Karl-Ludwig Besser
+
+This program is used in the article:
+Karl-Ludwig Besser, Pin-Hsun Lin, and Eduard Jorswieck, "On Fading Channel
+Dependency Structures with a Positive Zero-Outage Capacity", IEEE Transactions
+on Communications, vol. 69, no. 10, pp. 6561-6574, Oct 2021.
+
+License:
+This program is licensed under the GPLv3 license. If you in any way use this
+code for research that results in publications, please cite our original
+article listed above.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+PARTICULAR PURPOSE.
+See the GNU General Public License for more details.
+
+Author: Karl-Ludwig Besser, Technische Universität Braunschweig
+"""
+
+import argparse
+import sys
+import time
+
+# Commands of `all`, which generate the results presented in the paper
+ALL = [["boundary", "-x", "8", "-y", "0"],
+       ["rayleigh", "-x", "0", "5", "0", "-5", "-5", "-y", "0", "5", "5", "5", "10"],
+       ["mrc", "-s", "0", "-m", "5"],
+       ["sc", "-s", "10", "-m", "2", "5", "10"],
+      ]
+
+def _boundary_parser(parser):
+    parser.add_argument("-x", "--snr_x_db", type=float, default=8.)
+    parser.add_argument("-y", "--snr_y_db", type=float, default=0.)
+
+def _run_boundary(args, plot, export):
+    import boundary
+    boundary.main(snr_x_db=args.snr_x_db, snr_y_db=args.snr_y_db, plot=plot,
+                  export=export)
+
+def _rayleigh_parser(parser):
+    parser.add_argument("-x", "--snr_x_db", type=float, default=[0, 5], nargs="+")
+    parser.add_argument("-y", "--snr_y_db", type=float, default=[0, 5], nargs="+")
+    parser.add_argument("-ax", "--alpha_x", type=float, default=1)
+    parser.add_argument("-ay", "--alpha_y", type=float, default=1)
+
+def _run_rayleigh(args, plot, export):
+    import rayleigh_fading
+    rayleigh_fading.main(snr_x_db=args.snr_x_db, snr_y_db=args.snr_y_db,
+                         alpha_x=args.alpha_x, alpha_y=args.alpha_y,
+                         plot=plot, export=export)
+
+def _mrc_parser(parser):
+    parser.add_argument("-s", "--snr_db", type=float, default=10)
+    parser.add_argument("-m", type=int, default=5)
+
+def _run_mrc(args, plot, export):
+    import maximum_ratio_combining
+    maximum_ratio_combining.main(snr_db=args.snr_db, m=args.m, plot=plot,
+                                 export=export)
+
+def _sc_parser(parser):
+    parser.add_argument("-s", "--snr_db", type=float, default=10)
+    parser.add_argument("-m", type=int, default=[5], nargs="+")
+
+def _run_sc(args, plot, export):
+    import selection_combining
+    selection_combining.main(snr_db=args.snr_db, m=args.m, plot=plot,
+                             export=export)
+
+def _nakagami_parser(parser):
+    parser.add_argument("-x", "--snr_x_db", type=float, default=0)
+    parser.add_argument("-y", "--snr_y_db", type=float, default=0)
+    parser.add_argument("-m", type=int, default=5)
+    parser.add_argument("--n-links", action="store_true")
+    parser.add_argument("--tol", type=float, help="Use an adaptive t grid with this accuracy")
+
+def _run_nakagami(args, plot, export):
+    import nakagami_fading
+    if args.n_links:
+        nakagami_fading.main_n_links(m=args.m, snr_x_db=args.snr_x_db, plot=plot,
+                                     export=export)
+    else:
+        nakagami_fading.main_two_links(m=args.m, snr_x_db=args.snr_x_db,
+                                       snr_y_db=args.snr_y_db, plot=plot,
+                                       export=export, tol=args.tol)
+
+COMMANDS = {
+    "boundary": ("Boundary example", _boundary_parser, _run_boundary),
+    "rayleigh": ("Rayleigh fading example", _rayleigh_parser, _run_rayleigh),
+    "mrc": ("Bounds on the maximum ZOC with MRC", _mrc_parser, _run_mrc),
+    "sc": ("Maximum ZOC with SC", _sc_parser, _run_sc),
+    "nakagami": ("Nakagami-m fading example", _nakagami_parser, _run_nakagami),
+    }
+
+def split_commands(argv):
+    """Split the arguments into the global options and a list of commands.
+
+    Every command starts with its name, followed by its own arguments. The
+    command `all` is replaced by the commands in `ALL`.
+    """
+    options = []
+    commands = []
+    for _arg in argv:
+        if _arg == "all":
+            commands.extend([list(_command) for _command in ALL])
+        elif _arg in COMMANDS:
+            commands.append([_arg])
+        elif commands:
+            commands[-1].append(_arg)
+        else:
+            options.append(_arg)
+    return options, commands
+
+def parse_command(command):
+    name, help_text, add_arguments, run = (command[0], *COMMANDS[command[0]])
+    parser = argparse.ArgumentParser(prog="zoc.py {}".format(name),
+                                     description=help_text)
+    add_arguments(parser)
+    return run, parser.parse_args(command[1:])
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        usage="%(prog)s [-h] [--plot] [--export] COMMAND [ARGS] [COMMAND [ARGS] ...]",
+        description="Run several commands in a single process. The commands are "
+                    "{} and all.".format(", ".join(COMMANDS)),
+        epilog="Use 'COMMAND -h' to show the arguments of a command.")
+    parser.add_argument("--plot", action="store_true")
+    parser.add_argument("--export", action="store_true")
+    options, commands = split_commands(sys.argv[1:] if argv is None else argv)
+    args = parser.parse_args(options)
+    if not commands:
+        parser.error("At least one command is required")
+    commands = [(_command[0], *parse_command(_command)) for _command in commands]
+    for _name, _run, _args in commands:
+        print("Running {}...".format(COMMANDS[_name][0]))
+        _start = time.perf_counter()
+        _run(_args, plot=args.plot, export=args.export)
+        print("Finished {} in {:.2f} s".format(_name, time.perf_counter()-_start))
+    if args.plot:
+        import matplotlib.pyplot as plt
+        plt.show()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,365 @@
+"""Local ZOC Query Server
+
+This module contains an asyncio server, which answers queries for the ZOC and
+its bounds over a local socket. Concurrent queries are collected for a short
+time window and evaluated together in vectorized batches in a pool of worker
+processes, which import scipy and the solvers only once. Repeated queries are
+answered from an in-memory LRU cache. The server keeps statistics of the
+latencies and batch sizes.
+
+The protocol consists of one JSON object per line. A request
+    {"id": 1, "method": "inner_bound_mrc", "params": {"snr_db": 10, "n": 4, "m": 2}}
+is answered by
+    {"id": 1, "result": 2.345...}
+or by an object with an "error" message. The methods and their parameters
+are listed in `METHODS`. The fading is Nakagami-m with the mean SNR in dB
+(m=1 is Rayleigh fading). The method "stats" returns the statistics.
+
+Example:
+    python3 zoc_server.py --port 8765
+    python3 zoc_server.py --port 8765 --query inner_bound_mrc snr_db=10 n=4
+
+
+Copyright (C) 2021 Karl-Ludwig Besser
+
+This program is used in the article:
+Karl-Ludwig Besser, Pin-Hsun Lin, and Eduard Jorswieck, "On Fading Channel
+Dependency Structures with a Positive Zero-Outage Capacity", IEEE Transactions
+on Communications, vol. 69, no. 10, pp. 6561-6574, Oct 2021.
+
+License:
+This program is licensed under the GPLv3 license. If you in any way use this
+code for research that results in publications, please cite our original
+article listed above.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+PARTICULAR PURPOSE.
+See the GNU General Public License for more details.
+
+Author: Karl-Ludwig Besser, Technische Universität Braunschweig
+"""
+
+import asyncio
+from collections import OrderedDict, defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+import itertools
+import json
+import os
+import time
+
+import numpy as np
+
+# Parameters of the methods with their types and default values (None if
+# the parameter is required)
+METHODS = {
+    "inner_bound_mrc": {"snr_db": (float, None), "n": (int, None), "m": (float, 1.)},
+    "outer_bound_mrc": {"snr_db": (float, None), "n": (int, None), "m": (float, 1.)},
+    "sc_homog": {"snr_db": (float, None), "n": (int, None), "m": (float, 1.)},
+    "copula_t_mrc": {"snr_x_db": (float, None), "snr_y_db": (float, None),
+                     "t": (float, None), "m": (float, 1.)},
+    }
+
+def normalize_params(method, params):
+    """Parameters of a query as tuple in the order of `METHODS`."""
+    if method not in METHODS:
+        raise ValueError("Unknown method: {}".format(method))
+    params = dict(params or {})
+    _unknown = set(params) - set(METHODS[method])
+    if _unknown:
+        raise ValueError("Unknown parameters: {}".format(", ".join(sorted(_unknown))))
+    values = []
+    for _name, (_type, _default) in METHODS[method].items():
+        if _name not in params and _default is None:
+            raise ValueError("Missing parameter: {}".format(_name))
+        values.append(_type(params.get(_name, _default)))
+    return tuple(values)
+
+def _warm_up():
+    import maximum_ratio_combining
+    import selection_combining
+    import sweep
+
+def _evaluate(method, params):
+    """Evaluate a batch of queries of `method` with the normalized `params`.
+
+    The bounds are evaluated for all queries in a single vectorized call. The
+    queries of "copula_t_mrc" need to have the same distributions and are
+    evaluated for all values of t at once.
+    """
+    from maximum_ratio_combining import (zoc_copula_t_mrc_heterog,
+            max_zoc_inner_bound_mrc_homog, max_zoc_outer_bound_mrc_homog)
+    from selection_combining import max_zoc_sc_homog
+    from sweep import fading_distribution
+    from utils import NakagamiSNR
+    _values = np.array(params, dtype=float)
+    if method == "copula_t_mrc":
+        _snr_x_db, _snr_y_db, _t, _m = _values.T
+        rv_x = fading_distribution("nakagami", _snr_x_db[0], _m[0])
+        rv_y = fading_distribution("nakagami", _snr_y_db[0], _m[0])
+        return zoc_copula_t_mrc_heterog(_t, rv_x, rv_y).tolist()
+    _func = {"inner_bound_mrc": max_zoc_inner_bound_mrc_homog,
+             "outer_bound_mrc": max_zoc_outer_bound_mrc_homog,
+             "sc_homog": max_zoc_sc_homog}[method]
+    _snr_db, _n, _m = _values.T
+    with np.errstate(divide="ignore"):
+        return np.broadcast_to(_func(NakagamiSNR(_m, 10**(_snr_db/10.)), _n),
+                               _n.shape).tolist()
+
+class ZOCServer:
+    """Server that evaluates the queries in batches.
+
+    Queries that arrive within `batch_window` seconds (or until `max_batch`
+    queries are pending) are evaluated together in the process pool with
+    `workers` processes. The results of the last `cache_size` distinct
+    queries are kept in an LRU cache. The statistics include the latencies
+    of the last `history` queries.
+    """
+    def __init__(self, batch_window=.002, max_batch=4096, cache_size=2**16,
+                 workers=None, history=10000):
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._pending = defaultdict(dict)
+        self._inflight = {}
+        self._num_pending = 0
+        self._flush_handle = None
+        workers = os.cpu_count() if workers is None else workers
+        self._executor = ProcessPoolExecutor(workers)
+        self._latencies = deque(maxlen=history)
+        self._batch_sizes = deque(maxlen=history)
+        self._counts = defaultdict(int)
+        self._server = None
+        self._tasks = set()
+        for _worker in range(workers):
+            self._executor.submit(_warm_up)
+
+    async def query(self, method, params=None):
+        """Result of a single query."""
+        _start = time.perf_counter()
+        _key = (method, normalize_params(method, params))
+        self._counts["queries"] += 1
+        if _key in self._cache:
+            self._cache.move_to_end(_key)
+            self._counts["cache_hits"] += 1
+            result = self._cache[_key]
+        else:
+            if _key not in self._inflight:
+                self._inflight[_key] = asyncio.get_running_loop().create_future()
+                self._pending[method][_key] = self._inflight[_key]
+                self._num_pending += 1
+                self._schedule_flush()
+            else:
+                self._counts["coalesced"] += 1
+            result = await asyncio.shield(self._inflight[_key])
+        self._latencies.append(time.perf_counter() - _start)
+        return result
+
+    def _schedule_flush(self):
+        if self._num_pending >= self.max_batch:
+            if self._flush_handle is not None:
+                self._flush_handle.cancel()
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(
+                self.batch_window, self._flush)
+
+    def _flush(self):
+        self._flush_handle = None
+        _pending, self._pending = self._pending, defaultdict(dict)
+        self._num_pending = 0
+        for _method, _batch in _pending.items():
+            if _method == "copula_t_mrc":
+                _groups = defaultdict(dict)
+                for _key, _future in _batch.items():
+                    _snr_x_db, _snr_y_db, _t, _m = _key[1]
+                    _groups[(_snr_x_db, _snr_y_db, _m)][_key] = _future
+                _groups = list(_groups.values())
+            else:
+                _groups = [_batch]
+            for _group in _groups:
+                _task = asyncio.ensure_future(self._run_batch(_method, _group))
+                self._tasks.add(_task)
+                _task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, method, batch):
+        self._batch_sizes.append(len(batch))
+        self._counts["batches"] += 1
+        _loop = asyncio.get_running_loop()
+        try:
+            results = await _loop.run_in_executor(
+                self._executor, _evaluate, method, [_key[1] for _key in batch])
+        except Exception as _error:
+            for _key, _future in batch.items():
+                self._inflight.pop(_key, None)
+                if not _future.done():
+                    _future.set_exception(_error)
+            return
+        for (_key, _future), _result in zip(batch.items(), results):
+            self._cache[_key] = _result
+            self._inflight.pop(_key, None)
+            if not _future.done():
+                _future.set_result(_result)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def stats(self):
+        """Counters, latency percentiles (in ms) and batch sizes."""
+        stats = dict(self._counts)
+        stats["cache_size"] = len(self._cache)
+        if self._latencies:
+            _latencies = 1e3*np.array(self._latencies)
+            stats["latency_ms"] = {"p{}".format(_p): float(np.percentile(_latencies, _p))
+                                   for _p in (50, 90, 99)}
+            stats["latency_ms"]["max"] = float(np.max(_latencies))
+        if self._batch_sizes:
+            _sizes = np.array(self._batch_sizes)
+            stats["batch_size"] = {"mean": float(np.mean(_sizes)),
+                                   "p50": float(np.percentile(_sizes, 50)),
+                                   "max": int(np.max(_sizes))}
+        return stats
+
+    async def _answer(self, request, writer, lock):
+        _response = {"id": request.get("id")}
+        try:
+            if request.get("method") == "stats":
+                _response["result"] = self.stats()
+            else:
+                _response["result"] = await self.query(request.get("method"),
+                                                       request.get("params"))
+        except Exception as _error:
+            _response["error"] = "{}: {}".format(type(_error).__name__, _error)
+        async with lock:
+            writer.write((json.dumps(_response) + "\n").encode())
+            await writer.drain()
+
+    async def _handle_connection(self, reader, writer):
+        _lock = asyncio.Lock()
+        _tasks = set()
+        try:
+            while True:
+                _line = await reader.readline()
+                if not _line:
+                    break
+                try:
+                    _request = json.loads(_line)
+                    if not isinstance(_request, dict):
+                        raise ValueError("The request needs to be a JSON object")
+                except ValueError as _error:
+                    _response = {"id": None, "error": "Invalid request: {}".format(_error)}
+                    async with _lock:
+                        writer.write((json.dumps(_response) + "\n").encode())
+                    continue
+                _task = asyncio.ensure_future(self._answer(_request, writer, _lock))
+                _tasks.add(_task)
+                _task.add_done_callback(_tasks.discard)
+            if _tasks:
+                await asyncio.gather(*_tasks, return_exceptions=True)
+        finally:
+            writer.close()
+
+    async def start(self, host="127.0.0.1", port=0, path=None):
+        """Start listening on `host` and `port` (0 selects a free port) or on
+        the Unix socket `path`. Returns the address."""
+        if path is not None:
+            self._server = await asyncio.start_unix_server(self._handle_connection, path)
+            return path
+        self._server = await asyncio.start_server(self._handle_connection, host, port)
+        return self._server.sockets[0].getsockname()[:2]
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+class ZOCClient:
+    """Client of a `ZOCServer`, which can have many queries in flight."""
+    def __init__(self):
+        self._reader = None
+        self._writer = None
+        self._waiting = {}
+        self._ids = itertools.count()
+        self._receiver = None
+
+    async def connect(self, host="127.0.0.1", port=None, path=None):
+        if path is not None:
+            self._reader, self._writer = await asyncio.open_unix_connection(path)
+        else:
+            self._reader, self._writer = await asyncio.open_connection(host, port)
+        self._receiver = asyncio.ensure_future(self._receive())
+        return self
+
+    async def _receive(self):
+        try:
+            while True:
+                _line = await self._reader.readline()
+                if not _line:
+                    break
+                _response = json.loads(_line)
+                _future = self._waiting.pop(_response.get("id"), None)
+                if _future is None or _future.done():
+                    continue
+                if "error" in _response:
+                    _future.set_exception(RuntimeError(_response["error"]))
+                else:
+                    _future.set_result(_response["result"])
+        finally:
+            for _future in self._waiting.values():
+                if not _future.done():
+                    _future.set_exception(ConnectionError("Connection closed"))
+
+    async def query(self, method, **params):
+        _id = next(self._ids)
+        _future = asyncio.get_running_loop().create_future()
+        self._waiting[_id] = _future
+        self._writer.write((json.dumps({"id": _id, "method": method,
+                                        "params": params}) + "\n").encode())
+        await self._writer.drain()
+        return await _future
+
+    async def stats(self):
+        return await self.query("stats")
+
+    async def close(self):
+        self._writer.close()
+        await self._writer.wait_closed()
+        if self._receiver is not None:
+            await self._receiver
+
+
+async def _serve(args):
+    server = ZOCServer(batch_window=args.window*1e-3, cache_size=args.cache_size,
+                       workers=args.workers)
+    address = await server.start(args.host, args.port, args.path)
+    print("Listening on {}".format(address), flush=True)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.close()
+
+async def _query(args):
+    _params = dict(_param.split("=", 1) for _param in args.query[1:])
+    client = await ZOCClient().connect(args.host, args.port, args.path)
+    try:
+        print(json.dumps(await client.query(args.query[0], **_params)))
+    finally:
+        await client.close()
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--path", help="Unix socket instead of TCP")
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--window", type=float, default=2., help="Batch window in ms")
+    parser.add_argument("--cache-size", type=int, default=2**16)
+    parser.add_argument("--query", nargs="+", metavar="ARG",
+                        help="Send the query 'METHOD [NAME=VALUE ...]' to a running server")
+    args = parser.parse_args()
+    try:
+        asyncio.run(_query(args) if args.query else _serve(args))
+    except KeyboardInterrupt:
+        pass